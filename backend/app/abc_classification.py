@@ -0,0 +1,113 @@
+"""
+ABC classification of the items, by revenue and by units sold, in each store
+and network-wide.
+
+The items are ranked by their sales over the last `lookback_days`: the A
+items make the first `a_share` (80%) of the total, the B items the next ones
+up to `b_share` (95%), the C items the rest, along with the stocked items
+that didn't sell. Ranking the whole purchase ledger is too slow for a request, so
+the maintenance script runs `classify_items` daily, as a single
+`INSERT ... SELECT` with window functions, and `/items/classification` reads
+the stored ranks from an index.
+"""
+
+import datetime
+from dataclasses import dataclass
+
+from sqlmodel import Session, text
+
+
+@dataclass
+class ClassificationParams:
+    lookback_days: int = 90
+    # Cumulative shares of the total where the A and the B items end
+    a_share: float = 0.8
+    b_share: float = 0.95
+
+
+DELETE_CLASSIFICATION = text("DELETE FROM itemclassification")
+
+# The items each store stocks or sold, even if its stock row is gone since,
+# and all the items for the network (NULL store), each window partition
+# being a store
+CLASSIFY_ITEMS = text(
+    """
+    WITH sales AS (
+        SELECT p.store_id, p.item_id, sum(p.quantity) AS units,
+            sum(p.quantity * i.retail_price) AS revenue
+        FROM purchase AS p JOIN item AS i ON i.id = p.item_id
+        WHERE p.created_at >= :period_start AND p.created_at < :period_end
+        GROUP BY p.store_id, p.item_id
+    ),
+    totals AS (
+        SELECT store_id, item_id, coalesce(sales.units, 0) AS units,
+            coalesce(sales.revenue, 0) AS revenue
+        FROM storeitem FULL JOIN sales USING (store_id, item_id)
+        UNION ALL
+        SELECT NULL, i.id, coalesce(sum(sales.units), 0),
+            coalesce(sum(sales.revenue), 0)
+        FROM item AS i LEFT JOIN sales ON sales.item_id = i.id
+        GROUP BY i.id
+    ),
+    ranked AS (
+        SELECT *,
+            row_number() OVER by_revenue AS revenue_rank,
+            sum(revenue) OVER by_revenue - revenue AS revenue_before,
+            sum(revenue) OVER store AS store_revenue,
+            row_number() OVER by_units AS units_rank,
+            sum(units) OVER by_units - units AS units_before,
+            sum(units) OVER store AS store_units
+        FROM totals
+        WINDOW store AS (PARTITION BY store_id),
+            by_revenue AS (PARTITION BY store_id ORDER BY revenue DESC, item_id
+                ROWS UNBOUNDED PRECEDING),
+            by_units AS (PARTITION BY store_id ORDER BY units DESC, item_id
+                ROWS UNBOUNDED PRECEDING)
+    )
+    INSERT INTO itemclassification (store_id, item_id, units, revenue,
+        revenue_rank, revenue_class, units_rank, units_class, period_start,
+        period_end)
+    SELECT store_id, item_id, units, revenue,
+        revenue_rank,
+        CASE WHEN revenue = 0 THEN 'C'
+            WHEN revenue_before < :a_share * store_revenue THEN 'A'
+            WHEN revenue_before < :b_share * store_revenue THEN 'B'
+            ELSE 'C' END,
+        units_rank,
+        CASE WHEN units = 0 THEN 'C'
+            WHEN units_before < :a_share * store_units THEN 'A'
+            WHEN units_before < :b_share * store_units THEN 'B'
+            ELSE 'C' END,
+        :period_start, :period_end
+    FROM ranked
+    """
+)
+
+
+def classify_items(
+    session: Session,
+    params: ClassificationParams | None = None,
+    *,
+    now: datetime.datetime | None = None,
+) -> int:
+    """
+    Replace the classification with one of the sales of the last
+    `lookback_days` before `now`, returns the number of rows.
+    """
+    params = params or ClassificationParams()
+    period_end = now or datetime.datetime.now(datetime.timezone.utc)
+    period_start = period_end - datetime.timedelta(days=params.lookback_days)
+    # In one transaction, the requests keep reading the previous run until
+    # the commit. DELETE rather than TRUNCATE, which would block them
+    session.execute(DELETE_CLASSIFICATION)
+    result = session.execute(
+        CLASSIFY_ITEMS,
+        {
+            "period_start": period_start,
+            "period_end": period_end,
+            "a_share": params.a_share,
+            "b_share": params.b_share,
+        },
+    )
+    session.commit()
+    return result.rowcount  # type: ignore
@@ -0,0 +1,28 @@
+"""Add stock versions
+
+Revision ID: 012862e31725
+Revises: 292b847a5e48
+Create Date: 2026-10-19 09:58:03.614420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '012862e31725'
+down_revision = '292b847a5e48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A constant default doesn't rewrite the tables
+    op.add_column('storeitem', sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+    op.add_column('warehouseitem', sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+
+
+def downgrade():
+    op.drop_column('warehouseitem', 'version')
+    op.drop_column('storeitem', 'version')
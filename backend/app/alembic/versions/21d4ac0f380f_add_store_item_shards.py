@@ -0,0 +1,32 @@
+"""Add store item shards
+
+Revision ID: 21d4ac0f380f
+Revises: 012862e31725
+Create Date: 2026-10-19 10:41:26.093518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '21d4ac0f380f'
+down_revision = '012862e31725'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('storeitemshard',
+    sa.Column('store_id', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('slot', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['store_id', 'item_id'], ['storeitem.store_id', 'storeitem.item_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('store_id', 'item_id', 'slot')
+    )
+
+
+def downgrade():
+    op.drop_table('storeitemshard')
@@ -0,0 +1,35 @@
+"""Add idempotency keys
+
+Revision ID: 292b847a5e48
+Revises: ab04af46b9ca
+Create Date: 2026-10-19 09:12:40.271836
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '292b847a5e48'
+down_revision = 'ab04af46b9ca'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotencykey',
+    sa.Column('key', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.Column('request_hash', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('response', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_idempotencykey_created_at', 'idempotencykey', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_idempotencykey_created_at', table_name='idempotencykey')
+    op.drop_table('idempotencykey')
@@ -0,0 +1,42 @@
+"""Add item classification
+
+Revision ID: 40aa09138986
+Revises: c43b8d5e0a17
+Create Date: 2026-10-19 13:52:40.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '40aa09138986'
+down_revision = 'c43b8d5e0a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('itemclassification',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('store_id', sa.Integer(), nullable=True),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('units', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('revenue_rank', sa.Integer(), nullable=False),
+    sa.Column('revenue_class', sqlmodel.sql.sqltypes.AutoString(length=1), nullable=False),
+    sa.Column('units_rank', sa.Integer(), nullable=False),
+    sa.Column('units_class', sqlmodel.sql.sqltypes.AutoString(length=1), nullable=False),
+    sa.Column('period_start', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('period_end', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_itemclassification_store_id_revenue_rank', 'itemclassification', ['store_id', 'revenue_rank'], unique=False)
+    op.create_index('ix_itemclassification_store_id_units_rank', 'itemclassification', ['store_id', 'units_rank'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_itemclassification_store_id_units_rank', table_name='itemclassification')
+    op.drop_index('ix_itemclassification_store_id_revenue_rank', table_name='itemclassification')
+    op.drop_table('itemclassification')
@@ -0,0 +1,32 @@
+"""Add item search indexes
+
+Revision ID: 6f1c2e9a7d3b
+Revises: 21d4ac0f380f
+Create Date: 2026-10-19 11:52:37.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '6f1c2e9a7d3b'
+down_revision = '21d4ac0f380f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Shipped with Postgres (contrib), but not enabled by default
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Built without blocking writes to the catalog, see a5e26769773e
+    with op.get_context().autocommit_block():
+        op.create_index('ix_item_title_trgm', 'item', ['title'], unique=False, postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_item_title_tsv', 'item', [sa.text("to_tsvector('simple', title)")], unique=False, postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_item_title_tsv', table_name='item', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_item_title_trgm', table_name='item', postgresql_concurrently=True, if_exists=True)
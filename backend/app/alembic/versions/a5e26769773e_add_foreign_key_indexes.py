@@ -0,0 +1,38 @@
+"""Add foreign key indexes
+
+Revision ID: a5e26769773e
+Revises: 8edbf5ba205e
+Create Date: 2026-10-19 06:02:11.418210
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5e26769773e'
+down_revision = '8edbf5ba205e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block, so the
+    # indexes are built in autocommit mode to avoid locking writes on large tables
+    with op.get_context().autocommit_block():
+        # Revenue per store: index-only scan over (store_id, item_id, quantity)
+        op.create_index('ix_purchase_store_id_item_id', 'purchase', ['store_id', 'item_id'], unique=False, postgresql_include=['quantity'], postgresql_concurrently=True, if_not_exists=True)
+        # Foreign key lookups when deleting items
+        op.create_index('ix_purchase_item_id', 'purchase', ['item_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        # Per item lookups, the primary keys lead with store_id / warehouse_id
+        op.create_index('ix_storeitem_item_id_store_id', 'storeitem', ['item_id', 'store_id'], unique=False, postgresql_include=['quantity'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_warehouseitem_item_id_warehouse_id', 'warehouseitem', ['item_id', 'warehouse_id'], unique=False, postgresql_include=['quantity'], postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_warehouseitem_item_id_warehouse_id', table_name='warehouseitem', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_storeitem_item_id_store_id', table_name='storeitem', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_purchase_item_id', table_name='purchase', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_purchase_store_id_item_id', table_name='purchase', postgresql_concurrently=True, if_exists=True)
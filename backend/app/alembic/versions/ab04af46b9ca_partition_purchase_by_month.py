@@ -0,0 +1,117 @@
+"""Partition purchase by month
+
+Revision ID: ab04af46b9ca
+Revises: a5e26769773e
+Create Date: 2026-10-19 06:31:47.902114
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'ab04af46b9ca'
+down_revision = 'a5e26769773e'
+branch_labels = None
+depends_on = None
+
+# Months created ahead of the current one, later ones are created by
+# app.core.partitions when the app is deployed and by app.maintenance
+PARTITIONS_AHEAD = 3
+
+
+def _create_purchase_indexes():
+    op.create_index('ix_purchase_store_id_item_id', 'purchase', ['store_id', 'item_id'], unique=False, postgresql_include=['quantity'])
+    op.create_index('ix_purchase_item_id', 'purchase', ['item_id'], unique=False)
+
+
+def upgrade():
+    op.execute('ALTER TABLE purchase RENAME TO purchase_legacy')
+    op.execute('ALTER TABLE purchase_legacy RENAME CONSTRAINT purchase_pkey TO purchase_legacy_pkey')
+    op.drop_index('ix_purchase_store_id_item_id', table_name='purchase_legacy')
+    op.drop_index('ix_purchase_item_id', table_name='purchase_legacy')
+
+    op.create_table('purchase',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('purchase_id_seq'::regclass)"), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('store_id', sa.Integer(), nullable=True),
+    sa.Column('item_id', sa.Integer(), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['item_id'], ['item.id'], ),
+    sa.ForeignKeyConstraint(['store_id'], ['store.id'], ),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    # Keep the sequence alive when the legacy table is dropped
+    op.execute('ALTER SEQUENCE purchase_id_seq OWNED BY purchase.id')
+
+    month = datetime.datetime.now(datetime.timezone.utc).date().replace(day=1)
+    for _ in range(PARTITIONS_AHEAD + 1):
+        next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+        op.execute(
+            f"CREATE TABLE purchase_p{month.year:04d}_{month.month:02d} PARTITION OF purchase "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{next_month.isoformat()} 00:00:00+00')"
+        )
+        month = next_month
+
+    # Purchases of the months without a partition, see app.core.partitions
+    op.execute('CREATE TABLE purchase_default PARTITION OF purchase DEFAULT')
+
+    # Existing purchases keep their date where the table had one, each in the
+    # partition of its month. Undated ones get the epoch rather than a made up
+    # recent date, in the default partition, outside of any recent period
+    bind = op.get_bind()
+    dated = bind.execute(sa.text(
+        "SELECT EXISTS (SELECT FROM information_schema.columns "
+        "WHERE table_name = 'purchase_legacy' AND column_name = 'created_at')"
+    )).scalar_one()
+    created_at = "coalesce(created_at, 'epoch')" if dated else "'epoch'"
+    if dated:
+        months = bind.execute(sa.text(
+            "SELECT DISTINCT CAST(date_trunc('month', created_at AT TIME ZONE 'UTC') AS date) "
+            "FROM purchase_legacy WHERE created_at IS NOT NULL"
+        )).scalars().all()
+        for month in months:
+            next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+            op.execute(
+                f"CREATE TABLE IF NOT EXISTS purchase_p{month.year:04d}_{month.month:02d} PARTITION OF purchase "
+                f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{next_month.isoformat()} 00:00:00+00')"
+            )
+    op.execute(
+        'INSERT INTO purchase (id, created_at, store_id, item_id, quantity) '
+        f'SELECT id, {created_at}, store_id, item_id, quantity FROM purchase_legacy'
+    )
+    op.drop_table('purchase_legacy')
+
+    # Indexes on the partitioned table cascade to every partition, current and future
+    _create_purchase_indexes()
+    op.create_index('ix_purchase_created_at', 'purchase', ['created_at'], unique=False, postgresql_using='brin')
+
+
+def downgrade():
+    op.execute('ALTER TABLE purchase RENAME TO purchase_partitioned')
+    op.execute('ALTER TABLE purchase_partitioned RENAME CONSTRAINT purchase_pkey TO purchase_partitioned_pkey')
+    op.drop_index('ix_purchase_created_at', table_name='purchase_partitioned')
+    op.drop_index('ix_purchase_store_id_item_id', table_name='purchase_partitioned')
+    op.drop_index('ix_purchase_item_id', table_name='purchase_partitioned')
+
+    op.create_table('purchase',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('purchase_id_seq'::regclass)"), nullable=False),
+    sa.Column('store_id', sa.Integer(), nullable=True),
+    sa.Column('item_id', sa.Integer(), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['item_id'], ['item.id'], ),
+    sa.ForeignKeyConstraint(['store_id'], ['store.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('ALTER SEQUENCE purchase_id_seq OWNED BY purchase.id')
+    op.execute(
+        'INSERT INTO purchase (id, store_id, item_id, quantity) '
+        'SELECT id, store_id, item_id, quantity FROM purchase_partitioned'
+    )
+    # Drops the partitions too
+    op.drop_table('purchase_partitioned')
+    _create_purchase_indexes()
@@ -0,0 +1,43 @@
+"""Track turnover by transaction
+
+Revision ID: b463f0a7a5f2
+Revises: 5858dd0ceaee
+Create Date: 2026-10-19 16:02:41.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'b463f0a7a5f2'
+down_revision = '5858dd0ceaee'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Added without a default first, so that the existing rows aren't
+    # rewritten: they keep a NULL id, and only the new rows get theirs
+    for table in ('purchase', 'stockmovement'):
+        op.add_column(table, sa.Column('txid', sa.BigInteger(), nullable=True))
+        op.alter_column(table, 'txid', server_default=sa.text('txid_current()'))
+    # BRIN, built in one scan of the table, and on each partition of purchase
+    op.create_index('ix_purchase_txid', 'purchase', ['txid'], unique=False, postgresql_using='brin')
+    op.create_index('ix_stockmovement_txid', 'stockmovement', ['txid'], unique=False, postgresql_using='brin')
+    op.add_column('reportwatermark', sa.Column('processed_xid', sa.BigInteger(), nullable=True))
+    # The buckets added up to a time mark are rebuilt from the whole history
+    # by the next refresh
+    op.execute("DELETE FROM reportwatermark WHERE name = 'turnover'")
+    op.execute('DELETE FROM stockturnover')
+
+
+def downgrade():
+    op.execute("DELETE FROM reportwatermark WHERE name = 'turnover'")
+    op.execute('DELETE FROM stockturnover')
+    op.drop_column('reportwatermark', 'processed_xid')
+    op.drop_index('ix_stockmovement_txid', table_name='stockmovement', postgresql_using='brin')
+    op.drop_index('ix_purchase_txid', table_name='purchase', postgresql_using='brin')
+    op.drop_column('stockmovement', 'txid')
+    op.drop_column('purchase', 'txid')
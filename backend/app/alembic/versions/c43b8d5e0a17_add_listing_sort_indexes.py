@@ -0,0 +1,38 @@
+"""Add listing sort indexes
+
+Revision ID: c43b8d5e0a17
+Revises: 6f1c2e9a7d3b
+Create Date: 2026-10-19 12:31:08.657342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'c43b8d5e0a17'
+down_revision = '6f1c2e9a7d3b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built without blocking writes, see a5e26769773e
+    with op.get_context().autocommit_block():
+        # (sort key, id) for the keyset pagination, names in the "C" collation
+        # so that prefixes are ranges of the index
+        op.create_index('ix_item_title_id', 'item', [sa.text('title COLLATE "C"'), 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_item_retail_price_id', 'item', ['retail_price', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_item_wholesale_price_id', 'item', ['wholesale_price', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_store_name_id', 'store', [sa.text('name COLLATE "C"'), 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_warehouse_name_id', 'warehouse', [sa.text('name COLLATE "C"'), 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_warehouse_name_id', table_name='warehouse', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_store_name_id', table_name='store', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_item_wholesale_price_id', table_name='item', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_item_retail_price_id', table_name='item', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_item_title_id', table_name='item', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,55 @@
+"""Add stock turnover
+
+Revision ID: d0260e20000a
+Revises: 40aa09138986
+Create Date: 2026-10-19 14:37:12.904512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'd0260e20000a'
+down_revision = '40aa09138986'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stockmovement',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('location', sqlmodel.sql.sqltypes.AutoString(length=9), nullable=False),
+    sa.Column('location_id', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('reason', sqlmodel.sql.sqltypes.AutoString(length=8), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stockmovement_created_at', 'stockmovement', ['created_at'], unique=False, postgresql_using='brin')
+    op.create_table('stockturnover',
+    sa.Column('location', sqlmodel.sql.sqltypes.AutoString(length=9), nullable=False),
+    sa.Column('location_id', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('units_in', sa.Integer(), nullable=False),
+    sa.Column('units_out', sa.Integer(), nullable=False),
+    sa.Column('adjusted', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('location', 'location_id', 'item_id', 'day')
+    )
+    op.create_index('ix_stockturnover_day', 'stockturnover', ['day'], unique=False)
+    op.create_table('reportwatermark',
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+    sa.Column('processed_until', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('reportwatermark')
+    op.drop_index('ix_stockturnover_day', table_name='stockturnover')
+    op.drop_table('stockturnover')
+    op.drop_index('ix_stockmovement_created_at', table_name='stockmovement', postgresql_using='brin')
+    op.drop_table('stockmovement')
@@ -0,0 +1,42 @@
+"""
+Get many rows by id in one request, for the `/batch` routes.
+"""
+
+from collections.abc import Sequence
+from typing import Annotated, Any, TypeVar, cast
+
+from fastapi import Query
+from sqlalchemy import ColumnElement, Integer, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlmodel import Session, SQLModel, select
+
+# Ids per request, e.g. the rows of a page
+MAX_IDS = 200
+
+BatchIds = Annotated[list[int], Query(min_length=1, max_length=MAX_IDS)]
+
+Model = TypeVar("Model", bound=SQLModel)
+
+
+def in_ids(column: Any, ids: Sequence[int]) -> ColumnElement[bool]:
+    """
+    `column = ANY(:ids)`: one array parameter whatever the number of ids, a
+    single statement to prepare, unlike IN with a parameter per id.
+    """
+    ids_param = bindparam("ids", list(ids), type_=ARRAY(Integer), unique=True)
+    return cast(ColumnElement[bool], column == any_(ids_param))
+
+
+def get_by_ids(
+    session: Session, model: type[Model], ids: Sequence[int]
+) -> tuple[list[Model], list[int]]:
+    """
+    The rows of `model` with `ids`, in the same order, without duplicates,
+    and the ids not found.
+    """
+    ids = list(dict.fromkeys(ids))
+    rows = session.exec(select(model).where(in_ids(model.id, ids))).all()  # type: ignore
+    by_id = {row.id: row for row in rows}  # type: ignore
+    found = [by_id[row_id] for row_id in ids if row_id in by_id]
+    missing = [row_id for row_id in ids if row_id not in by_id]
+    return found, missing
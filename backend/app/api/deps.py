@@ -1,7 +1,9 @@
+import time
 from collections.abc import Generator
+from contextlib import contextmanager
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import ValidationError
@@ -10,6 +12,8 @@ from sqlmodel import Session
 from app.core import security
 from app.core.config import settings
 from app.core.db import engine
+from app.core.idempotency import Idempotency, request_hash
+from app.core.metrics import DB_POOL_WAIT
 from app.models import TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -17,8 +21,18 @@ reusable_oauth2 = OAuth2PasswordBearer(
 )
 
 
-def get_db() -> Generator[Session, None, None]:
+@contextmanager
+def open_session() -> Generator[Session, None, None]:
     with Session(engine) as session:
+        # Check out the connection up front to measure the wait for the pool
+        start = time.perf_counter()
+        session.connection()
+        DB_POOL_WAIT.observe(time.perf_counter() - start)
+        yield session
+
+
+def get_db() -> Generator[Session, None, None]:
+    with open_session() as session:
         yield session
 
 
@@ -54,3 +68,17 @@ def get_current_active_superuser(current_user: CurrentUser) -> User:
             status_code=403, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+IdempotencyKeyHeader = Annotated[str | None, Header(max_length=255)]
+
+
+def get_idempotency(
+    session: SessionDep,
+    request: Request,
+    idempotency_key: IdempotencyKeyHeader = None,
+) -> Idempotency:
+    return Idempotency(session, idempotency_key, request_hash(request))
+
+
+IdempotencyDep = Annotated[Idempotency, Depends(get_idempotency)]
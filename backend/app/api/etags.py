@@ -0,0 +1,57 @@
+"""
+Optimistic concurrency for the versioned rows, with ETags.
+
+Reads return the version of the row as an ETag. A write with an `If-Match`
+header is only applied if the row is still at one of the given versions:
+checked against the row as read, then by the UPDATE itself, which only
+matches the version read. Otherwise it fails with 412 Precondition Failed,
+and the client reads the row again before retrying, without any lock held
+in between. A write without `If-Match` has no precondition to fail: if the
+row changed between its read and its UPDATE, it is read and written again.
+"""
+
+from fastapi import HTTPException
+from sqlalchemy.orm.exc import StaleDataError
+from sqlmodel import Session
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+# Reads and writes of a row without `If-Match` before giving up with 409
+VERSIONED_WRITE_ATTEMPTS = 3
+
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(status_code=412, detail="The stock changed since it was read")
+
+
+def write_conflict() -> HTTPException:
+    return HTTPException(status_code=409, detail="The stock kept changing, try again")
+
+
+def check_if_match(if_match: str | None, version: int) -> None:
+    if if_match is None or if_match.strip() == "*":
+        return
+    # Versions are exact, weak and strong comparisons are the same
+    tags = {tag.strip().removeprefix("W/") for tag in if_match.split(",")}
+    if etag(version) not in tags:
+        raise precondition_failed()
+
+
+def flush_versioned(session: Session, if_match: str | None) -> bool:
+    """
+    Write the changes of versioned rows. If one of them was changed by another
+    transaction since it was read, rolls back, and raises 412 if the write had
+    an `If-Match` precondition, or returns False for it to be read and written
+    again.
+    """
+    try:
+        session.flush()
+    except StaleDataError:
+        session.rollback()
+        if if_match is not None:
+            raise precondition_failed()
+        return False
+    return True
@@ -0,0 +1,46 @@
+"""
+Sparse fieldsets for the listings.
+
+With `fields=id,title`, a listing only selects these columns, without
+loading ORM entities, and only returns them, so that e.g. a picker doesn't
+fetch and serialize whole rows. The extra columns needed by the pagination
+are selected too, but not returned.
+"""
+
+from collections.abc import Sequence
+from typing import Any
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import Select
+from sqlmodel import SQLModel, select
+
+
+def parse_fields(model: type[SQLModel], fields: str | None) -> list[str] | None:
+    """
+    The columns of `model` listed in `fields`, None to return whole rows.
+    """
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",")))
+    columns = model.__table__.columns.keys()  # type: ignore
+    if not set(names) <= set(columns):
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown fields, choose among: {', '.join(columns)}",
+        )
+    return names
+
+
+def select_fields(model: type[SQLModel], names: Sequence[str]) -> Select[Any]:
+    return select(*(getattr(model, name) for name in dict.fromkeys(names)))  # type: ignore
+
+
+def sparse_page(rows: Sequence[Any], names: list[str], **page: Any) -> JSONResponse:
+    """
+    The page of rows with only the `names` columns, serialized as is rather
+    than through the response model of the route.
+    """
+    data = [{name: getattr(row, name) for name in names} for row in rows]
+    return JSONResponse(jsonable_encoder({"data": data, **page}))
@@ -0,0 +1,112 @@
+"""
+Keyset pagination.
+
+Instead of an offset, which makes Postgres read and discard all the rows
+before the page, each page ends with an opaque cursor holding the sort keys
+of its last row, and the next page starts right after them, from an index
+when there is one matching the order.
+"""
+
+import base64
+import binascii
+import json
+import sys
+from collections.abc import Callable
+from typing import Any
+
+from fastapi import HTTPException
+from sqlalchemy import ColumnElement, Select, and_, false, or_
+from sqlmodel import Session
+
+# (expression, descending)
+SortKey = tuple[ColumnElement[Any], bool]
+
+
+def sort_keys(
+    key: ColumnElement[Any], unique_key: ColumnElement[Any], descending: bool
+) -> list[SortKey]:
+    """
+    Sort by `key`, then by `unique_key` among equal keys, in the same
+    direction, so that an index on both serves the sort, backwards if
+    descending.
+    """
+    if key is unique_key:
+        return [(unique_key, descending)]
+    return [(key, descending), (unique_key, descending)]
+
+
+def encode_cursor(values: list[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list[Any]:
+    """
+    Sort keys of the last row of the previous page, 400 if the cursor wasn't
+    issued for a page in this order.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def order_by(keys: list[SortKey]) -> list[ColumnElement[Any]]:
+    return [key.desc() if descending else key.asc() for key, descending in keys]
+
+
+def after(keys: list[SortKey], values: list[Any]) -> ColumnElement[bool]:
+    """
+    Condition for the rows after `values` in the order of `keys`, the last
+    key has to be unique.
+    """
+    # (a, b) > (x, y) as a > x OR (a = x AND b > y), for mixed directions
+    condition: ColumnElement[bool] = false()
+    for (key, descending), value in reversed(list(zip(keys, values, strict=True))):
+        beyond = key < value if descending else key > value
+        condition = or_(beyond, and_(key == value, condition))
+    return condition
+
+
+def starts_with(key: ColumnElement[str], prefix: str) -> ColumnElement[bool]:
+    """
+    `key` starts with `prefix`, as a range of a "C" collated `key`, the same
+    in the index, so that it is a range scan whatever the plan.
+    """
+    # In the "C" collation, strings sort by code points. The strings after
+    # those starting with the prefix start with its last code point that can
+    # be incremented, incremented: there is none for U+10FFFF
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return key >= prefix
+    following = ord(stem[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        # Surrogates aren't valid characters, nor can Postgres store them
+        following = 0xE000
+    return and_(key >= prefix, key < stem[:-1] + chr(following))
+
+
+def paginate(
+    session: Session,
+    statement: Select[Any],
+    keys: list[SortKey],
+    *,
+    cursor: str | None,
+    limit: int,
+    cursor_values: Callable[[Any], list[Any]],
+) -> tuple[list[Any], str | None]:
+    """
+    The page of `statement` after `cursor`, in the order of `keys`, and the
+    cursor of the next page, None if it is the last one. `cursor_values`
+    gives the values of the keys of a row.
+    """
+    if cursor:
+        statement = statement.where(after(keys, decode_cursor(cursor, len(keys))))
+    statement = statement.order_by(*order_by(keys)).limit(limit + 1)
+    rows = list(session.exec(statement).all())  # type: ignore
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(cursor_values(rows[-1]))
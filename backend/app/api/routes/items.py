@@ -1,36 +1,150 @@
+import re
 from logging import Logger
-from typing import Any
+from typing import Annotated, Any, Literal
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select, union_all, join
+from fastapi import APIRouter, HTTPException, Query
+from sqlalchemy import ColumnElement, Double, literal, literal_column
+from sqlmodel import and_, cast, col, func, join, or_, select, union_all
 
+from app.api.batch import BatchIds, get_by_ids, in_ids
 from app.api.deps import CurrentUser, SessionDep
+from app.api.fields import parse_fields, select_fields, sparse_page
+from app.api.pagination import paginate, sort_keys, starts_with
 from app.models import (
     Item,
+    ItemAvailability,
+    ItemClassification,
+    ItemClassificationPublic,
+    ItemClassificationsPublic,
     ItemCreate,
-    ItemPublic,
+    ItemsAvailability,
+    ItemsBatch,
+    ItemSearchResult,
+    ItemSearchResults,
     ItemsPublic,
     ItemUpdate,
+    LocationQuantity,
     Message,
+    Store,
     StoreItem,
+    StoreItemShard,
+    Warehouse,
     WarehouseItem,
 )
+from app.stock_shards import shard_totals
 
 router = APIRouter()
 
+# A constant configuration, as in the expression of the ix_item_title_tsv
+# index: with a bound parameter, the index wouldn't match
+SIMPLE: ColumnElement[Any] = literal_column("'simple'::regconfig")
+TITLE_DOCUMENT = func.to_tsvector(SIMPLE, Item.title)
+
+# The expressions of the indexes of the sorts
+ITEM_SORT_KEYS: dict[str, ColumnElement[Any]] = {
+    "id": Item.id,  # type: ignore
+    "title": Item.title.collate("C"),  # type: ignore
+    "retail_price": Item.retail_price,  # type: ignore
+    "wholesale_price": Item.wholesale_price,  # type: ignore
+}
+
+# Rank and class of the items, per metric
+CLASSIFICATION_RANKS: dict[str, tuple[Any, Any]] = {
+    "revenue": (ItemClassification.revenue_rank, ItemClassification.revenue_class),
+    "units": (ItemClassification.units_rank, ItemClassification.units_class),
+}
+
+
+def item_availability(
+    session: SessionDep, ids: list[int]
+) -> dict[int, ItemAvailability]:
+    """
+    The stock of the items with `ids` in each store and warehouse, in one
+    query, by item ID. Only the items that exist.
+    """
+    # The sharded stock of the few sharded pairs, by primary key
+    in_shards = (
+        select(func.sum(StoreItemShard.quantity))
+        .where(
+            StoreItemShard.store_id == StoreItem.store_id,
+            StoreItemShard.item_id == StoreItem.item_id,
+        )
+        .scalar_subquery()
+    )
+    # Both from the (item_id, location id) indexes. Five columns, past the
+    # typed overloads of select
+    stock = union_all(
+        select(  # type: ignore[call-overload]
+            literal("store").label("location"),
+            StoreItem.item_id,
+            Store.id,
+            Store.name,
+            (StoreItem.quantity + func.coalesce(in_shards, 0)).label("quantity"),
+        )
+        .join(Store, Store.id == StoreItem.store_id)
+        .where(in_ids(StoreItem.item_id, ids)),
+        select(  # type: ignore[call-overload]
+            literal("warehouse").label("location"),
+            WarehouseItem.item_id,
+            Warehouse.id,
+            Warehouse.name,
+            WarehouseItem.quantity,
+        )
+        .join(Warehouse, Warehouse.id == WarehouseItem.warehouse_id)
+        .where(in_ids(WarehouseItem.item_id, ids)),
+    ).subquery()
+    # From the items, to tell the items without stock from the missing ones
+    rows = session.exec(
+        select(
+            Item.id.label("item_id"),  # type: ignore
+            stock.c.location,
+            stock.c.id,
+            stock.c.name,
+            stock.c.quantity,
+        )
+        .outerjoin(stock, stock.c.item_id == Item.id)
+        .where(in_ids(Item.id, ids))
+        .order_by(stock.c.location, stock.c.id)
+    ).all()
+    availability: dict[int, ItemAvailability] = {}
+    for row in rows:
+        item = availability.setdefault(
+            row.item_id,
+            ItemAvailability(item_id=row.item_id, quantity=0, stores=[], warehouses=[]),
+        )
+        if row.location is None:
+            continue
+        item.quantity += row.quantity
+        locations = item.stores if row.location == "store" else item.warehouses
+        locations.append(
+            LocationQuantity(id=row.id, name=row.name, quantity=row.quantity)
+        )
+    return availability
+
 
 @router.get("/units", response_model=None)
 def get_units_per_item(session: SessionDep):
     """
     Get the total number of units per item.
     """
+    # Sharded stock is in slots besides the store item rows
+    shards = shard_totals()
     store_items_statement = (
         select(
             StoreItem.item_id,
             Item.title,
-            func.sum(StoreItem.quantity).label("total_units"),
+            func.sum(StoreItem.quantity + func.coalesce(shards.c.quantity, 0)).label(
+                "total_units"
+            ),
         )
         .select_from(join(StoreItem, Item, StoreItem.item_id == Item.id))
+        .outerjoin(
+            shards,
+            and_(
+                shards.c.store_id == StoreItem.store_id,
+                shards.c.item_id == StoreItem.item_id,
+            ),
+        )
         .group_by(StoreItem.item_id, Item.title)
     )
 
@@ -64,27 +178,190 @@ def get_units_per_item(session: SessionDep):
     return [dict(row._asdict()) for row in items]
 
 
+@router.get("/search", response_model=ItemSearchResults)
+def search_items(
+    session: SessionDep,
+    current_user: CurrentUser,  # noqa: ARG001
+    q: Annotated[str, Query(min_length=1, max_length=100)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None,
+) -> Any:
+    """
+    Search the items by title, best matches first: titles with words starting
+    with each word of `q` (full-text), or with words similar to them
+    (trigrams), to tolerate typos.
+    """
+    words = re.findall(r"[^\W_]+", q.lower())
+    # Both are answered from the GIN indexes on the title
+    match: ColumnElement[bool] = literal(q).op("<%")(Item.title)
+    rank: ColumnElement[Any] = func.word_similarity(q, Item.title)
+    if words:
+        prefixes = func.to_tsquery(SIMPLE, " & ".join(f"{word}:*" for word in words))
+        match = or_(TITLE_DOCUMENT.op("@@")(prefixes), match)
+        rank = rank + func.ts_rank(TITLE_DOCUMENT, prefixes)
+    # Compared with the cursor as it was sent, a float
+    rank = cast(rank, Double)
+    # Five columns, past the typed overloads of select
+    statement = select(  # type: ignore[call-overload]
+        Item.id,
+        Item.title,
+        Item.wholesale_price,
+        Item.retail_price,
+        rank.label("rank"),
+    ).where(match)
+    rows, next_cursor = paginate(
+        session,
+        statement,
+        [(rank, True), (ITEM_SORT_KEYS["id"], False)],
+        cursor=cursor,
+        limit=limit,
+        cursor_values=lambda row: [row.rank, row.id],
+    )
+    return ItemSearchResults(
+        data=[ItemSearchResult.model_validate(row._mapping) for row in rows],
+        next_cursor=next_cursor,
+    )
+
+
 @router.get("/", response_model=ItemsPublic)
 def read_items(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    session: SessionDep,
+    current_user: CurrentUser,  # noqa: ARG001
+    skip: int = 0,
+    limit: int = 100,
+    title_prefix: Annotated[str | None, Query(min_length=1)] = None,
+    min_retail_price: float | None = None,
+    max_retail_price: float | None = None,
+    min_wholesale_price: float | None = None,
+    max_wholesale_price: float | None = None,
+    sort: Literal["id", "title", "retail_price", "wholesale_price"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    cursor: str | None = None,
+    fields: str | None = None,
 ) -> Any:
     """
-    Retrieve items.
+    Retrieve items, filtered and sorted. Pass `next_cursor` back as `cursor`
+    for the next page. With `fields` (e.g. `id,title`), only these columns
+    are returned.
     """
     Logger("test").info("Getting total units per item")
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Item)
-        count = session.exec(count_statement).one()
-        statement = select(Item).offset(skip).limit(limit)
-        items = session.exec(statement).all()
-    else:
-        count_statement = select(func.count()).select_from(Item)
-        count = session.exec(count_statement).one()
-        statement = select(Item).offset(skip).limit(limit)
-        items = session.exec(statement).all()
+    filters = []
+    if title_prefix is not None:
+        filters.append(starts_with(ITEM_SORT_KEYS["title"], title_prefix))
+    for price, low, high in (
+        (col(Item.retail_price), min_retail_price, max_retail_price),
+        (col(Item.wholesale_price), min_wholesale_price, max_wholesale_price),
+    ):
+        if low is not None:
+            filters.append(price >= low)
+        if high is not None:
+            filters.append(price <= high)
 
-    return ItemsPublic(data=list(items), count=count)
+    names = parse_fields(Item, fields)
+    count_statement = select(func.count()).select_from(Item).where(*filters)
+    count = session.exec(count_statement).one()
+    # The keys of the cursor are selected too
+    statement = (
+        select(Item) if names is None else select_fields(Item, [*names, sort, "id"])
+    )
+    # Each sort has an index on (key, id), the ranges on the key are ranges
+    # of the index, the other filters are checked while walking it
+    items, next_cursor = paginate(
+        session,
+        statement.where(*filters).offset(skip),
+        sort_keys(ITEM_SORT_KEYS[sort], ITEM_SORT_KEYS["id"], order == "desc"),
+        cursor=cursor,
+        limit=limit,
+        cursor_values=lambda item: [item.id]
+        if sort == "id"
+        else [getattr(item, sort), item.id],
+    )
+
+    if names is not None:
+        return sparse_page(items, names, count=count, next_cursor=next_cursor)
+    return ItemsPublic(data=items, count=count, next_cursor=next_cursor)
+
+
+# Before /{id}, that would match it
+@router.get("/classification", response_model=ItemClassificationsPublic)
+def read_item_classification(
+    session: SessionDep,
+    current_user: CurrentUser,  # noqa: ARG001
+    store_id: int | None = None,
+    by: Literal["revenue", "units"] = "revenue",
+    abc_class: Annotated[Literal["A", "B", "C"] | None, Query(alias="class")] = None,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: str | None = None,
+) -> Any:
+    """
+    Get the items ranked by revenue or by units sold, in a store or, without
+    `store_id`, network-wide, with their ABC class, optionally only those of
+    a `class`. Precomputed by the last run of the maintenance script.
+    """
+    rank, item_class = CLASSIFICATION_RANKS[by]
+    # The NULL store is the network. Not IS NOT DISTINCT FROM, which can't use
+    # the index
+    store: Any = ItemClassification.store_id
+    filters = [store.is_(None) if store_id is None else store == store_id]
+    if abc_class is not None:
+        # The classes are ranges of ranks, read from the same index
+        filters.append(item_class == abc_class)
+    statement = (
+        select(ItemClassification, Item.title)
+        .join(Item, Item.id == ItemClassification.item_id)  # type: ignore
+        .where(*filters)
+    )
+    rows, next_cursor = paginate(
+        session,
+        statement,
+        [(rank, False)],
+        cursor=cursor,
+        limit=limit,
+        cursor_values=lambda row: [getattr(row[0], f"{by}_rank")],
+    )
+    return ItemClassificationsPublic(
+        data=[
+            ItemClassificationPublic(title=title, **classification.model_dump())
+            for classification, title in rows
+        ],
+        period_start=rows[0][0].period_start if rows else None,
+        period_end=rows[0][0].period_end if rows else None,
+        next_cursor=next_cursor,
+    )
+
+
+# Before /{id}, that would match it
+@router.get("/availability", response_model=ItemsAvailability)
+def read_items_availability(
+    session: SessionDep,
+    current_user: CurrentUser,  # noqa: ARG001
+    ids: BatchIds,
+) -> Any:
+    """
+    Get the stock of items (repeat `ids`) in each store and warehouse, in the
+    same order, in one query.
+    """
+    ids = list(dict.fromkeys(ids))
+    availability = item_availability(session, ids)
+    return ItemsAvailability(
+        data=[availability[id] for id in ids if id in availability],
+        missing=[id for id in ids if id not in availability],
+    )
+
+
+# Before /{id}, that would match it
+@router.get("/batch", response_model=ItemsBatch)
+def read_items_batch(
+    session: SessionDep,
+    current_user: CurrentUser,  # noqa: ARG001
+    ids: BatchIds,
+) -> Any:
+    """
+    Get items by ID (repeat `ids`), in the same order, in one query.
+    """
+    items, missing = get_by_ids(session, Item, ids)
+    return ItemsBatch(data=items, missing=missing)
 
 
 @router.get("/{id}", response_model=Item)
@@ -100,6 +377,21 @@ def read_item(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
     return item
 
 
+@router.get("/{id}/availability", response_model=ItemAvailability)
+def read_item_availability(
+    session: SessionDep,
+    current_user: CurrentUser,  # noqa: ARG001
+    id: int,
+) -> Any:
+    """
+    Get the stock of an item in each store and warehouse, in one query.
+    """
+    availability = item_availability(session, [id])
+    if id not in availability:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return availability[id]
+
+
 @router.post("/", response_model=Item)
 def create_item(
     *, session: SessionDep, current_user: CurrentUser, item_in: ItemCreate
@@ -0,0 +1,54 @@
+import asyncio
+from collections.abc import AsyncGenerator
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.core.stock_events import broker
+
+router = APIRouter()
+
+# Comment sent on idle streams, so that proxies don't close them
+KEEPALIVE_SECONDS = 15
+
+
+async def server_sent_events(
+    store_ids: list[int], warehouse_ids: list[int]
+) -> AsyncGenerator[str, None]:
+    with broker.subscribe(store_ids, warehouse_ids) as subscription:
+        while True:
+            try:
+                change = await subscription.get(timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if change is None:
+                return
+            yield f"event: stock\ndata: {change.to_json()}\n\n"
+
+
+# Any user, e.g. the store terminals. The session of the authentication is
+# closed before the stream starts
+@router.get(
+    "/events",
+    dependencies=[Depends(get_current_user)],
+    response_class=StreamingResponse,
+)
+async def stream_stock_changes(
+    store_id: list[int] = Query(default=[]),
+    warehouse_id: list[int] = Query(default=[]),
+) -> StreamingResponse:
+    """
+    Stream the stock changes of the stores in `store_id` and the warehouses
+    in `warehouse_id`, of every location if neither is given, as Server-Sent
+    Events: the new quantity of an item at a location, once committed.
+    """
+    if not settings.STOCK_EVENTS_ENABLED:
+        raise HTTPException(status_code=404, detail="Stock events are disabled")
+    return StreamingResponse(
+        server_sent_events(store_id, warehouse_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,89 +1,242 @@
+from datetime import datetime
+from typing import Annotated, Any, Literal
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from sqlmodel import Session, and_, func, select
+
+from app.api.batch import BatchIds, get_by_ids
+from app.api.deps import (
+    CurrentUser,
+    IdempotencyKeyHeader,
+    SessionDep,
+    get_current_active_superuser,
+    open_session,
+)
+from app.api.etags import (
+    VERSIONED_WRITE_ATTEMPTS,
+    check_if_match,
+    etag,
+    flush_versioned,
+    write_conflict,
+)
+from app.api.fields import parse_fields, select_fields, sparse_page
+from app.api.pagination import paginate, sort_keys, starts_with
+from app.core.config import settings
+from app.core.idempotency import Idempotency, request_hash
+from app.core.metrics import UNITS_SOLD
+from app.core.stock_events import StockChange, notify_stock_changes
+from app.group_commit import purchase_batcher
+from app.models import (
+    Item,
+    LocationStock,
+    Purchase,
+    StockLine,
+    StockShards,
+    StockUpdate,
+    Store,
+    StoreItem,
+    StoresBatch,
+    StoresPublic,
+    TurnoverReport,
+)
+from app.stock_shards import reshard, shard_totals, sharded_quantity, take_store_stock
 from app.tests.utils.http_exceptions import raiseForbidden
-from fastapi import APIRouter, HTTPException
-from sqlmodel import Session, SQLModel, select, func, join
-from typing import Any
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Item, Purchase, Store, StoreItem, StoresPublic
+from app.turnover import (
+    Movement,
+    processed_until,
+    record_movements,
+    turnover_line,
+    turnover_totals,
+    window_start,
+)
 
 router = APIRouter()
 
+MAX_SHARDS = 64
+
 
 @router.get("/items/units", response_model=None)
 def get_units_per_store_item(session: SessionDep):
-    stores = session.exec(select(Store)).all()
-    if not stores:
-        return []
-    result = []
-    for store in stores:
-        store_items_statement = (
-            select(
-                Item,
-                func.sum(StoreItem.quantity).label("total_units"),
-                func.sum(StoreItem.quantity * Item.wholesale_price).label(
-                    "total_wholesale_value"
-                ),
-                func.sum(StoreItem.quantity * Item.retail_price).label(
-                    "total_retail_value"
-                ),
-            )
-            .select_from(join(StoreItem, Item, StoreItem.item_id == Item.id))
-            .where(StoreItem.store_id == store.id)
-            .group_by(Item.id)
+    """
+    Get the units, wholesale and retail value of each item in each store.
+    """
+    shards = shard_totals()
+    quantity = StoreItem.quantity + func.coalesce(shards.c.quantity, 0)
+    store_items_statement = (
+        select(
+            Store.id,
+            Store.name,
+            Item,
+            func.sum(quantity).label("total_units"),
+            func.sum(quantity * Item.wholesale_price).label("total_wholesale_value"),
+            func.sum(quantity * Item.retail_price).label("total_retail_value"),
         )
-        items = session.exec(store_items_statement).all()
-        result.append(
-            {
-                "name": store.name,
-                "store_id": store.id,
-                "items": [row._asdict() for row in items],
-            }
+        .select_from(Store)
+        .outerjoin(StoreItem, StoreItem.store_id == Store.id)
+        .outerjoin(
+            shards,
+            and_(
+                shards.c.store_id == StoreItem.store_id,
+                shards.c.item_id == StoreItem.item_id,
+            ),
         )
-    return result
+        .outerjoin(Item, StoreItem.item_id == Item.id)
+        .group_by(Store.id, Item.id)
+        .order_by(Store.id, Item.id)
+    )
+    result: dict[int, dict[str, Any]] = {}
+    for store_id, name, *item_row in session.exec(store_items_statement).all():
+        store = result.setdefault(
+            store_id, {"name": name, "store_id": store_id, "items": []}
+        )
+        item, total_units, total_wholesale_value, total_retail_value = item_row
+        if item is not None:
+            store["items"].append(
+                {
+                    "Item": item,
+                    "total_units": total_units,
+                    "total_wholesale_value": total_wholesale_value,
+                    "total_retail_value": total_retail_value,
+                }
+            )
+    return list(result.values())
 
 
 @router.get("/revenue")
-def get_store_revenue(session: SessionDep):
-    stores = session.exec(select(Store)).all()
-    if not stores:
-        return []
-    result = []
-    for store in stores:
-        store_purchases_statement = (
-            select(
-                func.sum(Purchase.quantity * Item.retail_price).label("revenue"),
-                func.sum(Purchase.quantity * Item.wholesale_price).label("cost"),
-            )
-            .select_from(join(Purchase, Item, Purchase.item_id == Item.id))
-            .where(Purchase.store_id == store.id)
+def get_store_revenue(
+    session: SessionDep,
+    start: datetime | None = None,
+    end: datetime | None = None,
+):
+    """
+    Get the revenue, cost and profit per store, optionally over the purchases
+    made in [start, end). Bounding the period lets Postgres skip the monthly
+    purchase partitions outside of it.
+    """
+    purchase_filters = [Purchase.store_id == Store.id]
+    if start:
+        purchase_filters.append(Purchase.created_at >= start)
+    if end:
+        purchase_filters.append(Purchase.created_at < end)
+    store_purchases_statement = (
+        select(
+            Store.id,
+            Store.name,
+            func.sum(Purchase.quantity * Item.retail_price).label("revenue"),
+            func.sum(Purchase.quantity * Item.wholesale_price).label("cost"),
         )
-        revenue = session.exec(store_purchases_statement).first()
-        if revenue:
-            row_dict = {}
-            row_dict["store"] = store.name
-            row_dict["store_id"] = store.id
-            row_dict["total_revenue"] = revenue._asdict().get("revenue") or 0.0
-            row_dict["total_cost"] = revenue._asdict().get("cost") or 0.0
-            row_dict["total_profit"] = (
-                row_dict["total_revenue"] - row_dict["total_cost"]
-            )
-            result.append(row_dict)
+        .select_from(Store)
+        .outerjoin(Purchase, and_(*purchase_filters))
+        .outerjoin(Item, Purchase.item_id == Item.id)
+        .group_by(Store.id)
+        .order_by(Store.id)
+    )
+    result = []
+    for store_id, name, revenue, cost in session.exec(store_purchases_statement):
+        row_dict = {}
+        row_dict["store"] = name
+        row_dict["store_id"] = store_id
+        row_dict["total_revenue"] = revenue or 0.0
+        row_dict["total_cost"] = cost or 0.0
+        row_dict["total_profit"] = row_dict["total_revenue"] - row_dict["total_cost"]
+        result.append(row_dict)
     return result
 
 
+@router.get("/replenishment")
+def get_replenishment_suggestions(
+    session: SessionDep,
+    store_id: int | None = None,
+    lookback_days: int = Query(default=28, ge=1),
+    reorder_point_days: float = Query(default=7, ge=0),
+    target_days: float = Query(default=14, ge=0),
+    limit: int = Query(default=1000, ge=1, le=100_000),
+) -> list[dict[str, Any]]:
+    """
+    Get the items to ship to the stores about to run out of them, computed
+    from their sales over the last `lookback_days`, the most urgent first.
+
+    The suggestions are computed for all the stores at once, so that the
+    units available in the warehouses are shared among them.
+    """
+    # Imported on first use, NumPy is slow to import
+    from app.replenishment import (
+        ReplenishmentParams,
+        load_stock_levels,
+        most_urgent,
+        suggest,
+    )
+
+    params = ReplenishmentParams(
+        lookback_days=lookback_days,
+        reorder_point_days=reorder_point_days,
+        target_days=target_days,
+    )
+    levels = load_stock_levels(session.connection(), lookback_days=lookback_days)
+    suggestions = most_urgent(suggest(levels, params), limit=limit, store_id=store_id)
+    return suggestions.to_dicts()
+
+
 @router.get("/")
 def read_stores(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    session: SessionDep,
+    current_user: CurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    name_prefix: Annotated[str | None, Query(min_length=1)] = None,
+    sort: Literal["id", "name"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    cursor: str | None = None,
+    fields: str | None = None,
 ) -> Any:
     if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Store)
+        # Names in the "C" collation, as in ix_store_name_id
+        name = Store.name.collate("C")  # type: ignore
+        filters = [] if name_prefix is None else [starts_with(name, name_prefix)]
+        names = parse_fields(Store, fields)
+        count_statement = select(func.count()).select_from(Store).where(*filters)
         count = session.exec(count_statement).one()
-        statement = select(Store).offset(skip).limit(limit)
-        stores = session.exec(statement).all()
-        return StoresPublic(data=list(stores), count=count)
+        key = name if sort == "name" else Store.id
+        statement = (
+            select(Store)
+            if names is None
+            else select_fields(Store, [*names, sort, "id"])
+        )
+        stores, next_cursor = paginate(
+            session,
+            statement.where(*filters).offset(skip),
+            sort_keys(key, Store.id, order == "desc"),  # type: ignore
+            cursor=cursor,
+            limit=limit,
+            cursor_values=lambda store: [store.id]
+            if sort == "id"
+            else [store.name, store.id],
+        )
+        if names is not None:
+            return sparse_page(stores, names, count=count, next_cursor=next_cursor)
+        return StoresPublic(data=stores, count=count, next_cursor=next_cursor)
     else:
         raise raiseForbidden("warehouse")
 
 
+# Before /{id}, that would match it
+@router.get("/batch", response_model=StoresBatch)
+def read_stores_batch(session: SessionDep, ids: BatchIds) -> Any:
+    """
+    Get stores by ID (repeat `ids`), in the same order, in one query.
+    """
+    stores, missing = get_by_ids(session, Store, ids)
+    return StoresBatch(data=stores, missing=missing)
+
+
 @router.get("/{id}")
 def read_store(session: SessionDep, id: int) -> Any:
     store = session.get(Store, id)
@@ -124,21 +277,230 @@ def delete_store(session: SessionDep, id: int) -> Any:
     return {"message": "Store deleted successfully"}
 
 
-@router.post("/{id}/items/{item_id}/purchase")
-def purchase_item(session: SessionDep, id: int, item_id: int, quantity: int) -> Any:
+def purchase_store_item(
+    session: Session, idempotency: Idempotency, id: int, item_id: int, quantity: int
+) -> Any:
+    """
+    Purchase `quantity` units of an item in a store, in a transaction of its
+    own.
+    """
+    if replayed := idempotency.replay():
+        return replayed
     store = session.get(Store, id)
     if not store:
         raise HTTPException(status_code=404, detail="Store not found")
-    store_item = session.exec(
-        select(StoreItem).where(StoreItem.store_id == id, StoreItem.item_id == item_id)
-    ).first()
-    if not store_item:
-        raise HTTPException(status_code=404, detail="Item not found in store")
-    if store_item.quantity < quantity:
-        raise HTTPException(status_code=400, detail="Not enough items in stock")
-    store_item.quantity -= quantity
+    store_item, left = take_store_stock(session, id, item_id, quantity)
     purchase = Purchase(store_id=id, item_id=item_id, quantity=quantity)
-    session.add(store_item)
     session.add(purchase)
+    notify_stock_changes(session, [StockChange("store", id, item_id, left)])
+    session.flush()
+    # The stock of a sharded item is not only in its row
+    result = store_item.model_dump() | {"quantity": left}
+    idempotency.save(result)
+    session.commit()
+    UNITS_SOLD.inc(quantity)
+    return result
+
+
+@router.post("/{id}/items/{item_id}/purchase")
+def purchase_item(
+    request: Request,
+    id: int,
+    item_id: int,
+    quantity: int,
+    idempotency_key: IdempotencyKeyHeader = None,
+) -> Any:
+    # Requests with a key store their response in the transaction of their
+    # purchase, they aren't grouped. The others wait for their batch without
+    # a session, only the first purchase of the batch opens one
+    if settings.PURCHASE_GROUP_COMMIT and idempotency_key is None:
+        result = purchase_batcher.purchase(id, item_id, quantity)
+        if result is not None:
+            return result
+    with open_session() as session:
+        idempotency = Idempotency(session, idempotency_key, request_hash(request))
+        return purchase_store_item(session, idempotency, id, item_id, quantity)
+
+
+@router.get("/{id}/items", response_model=LocationStock)
+def read_store_stock(
+    session: SessionDep,
+    id: int,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: str | None = None,
+) -> Any:
+    """
+    Get the stock of a store with its items, by item ID. Pass `next_cursor`
+    back as `cursor` for the next page.
+    """
+    shards = shard_totals()
+    # One join, into plain rows: no relationships to load
+    statement = (
+        # Five columns, past the typed overloads of select
+        select(  # type: ignore[call-overload]
+            StoreItem.item_id,
+            Item.title,
+            Item.wholesale_price,
+            Item.retail_price,
+            (StoreItem.quantity + func.coalesce(shards.c.quantity, 0)).label(
+                "quantity"
+            ),
+        )
+        .join(Item, Item.id == StoreItem.item_id)
+        .outerjoin(
+            shards,
+            and_(
+                shards.c.store_id == StoreItem.store_id,
+                shards.c.item_id == StoreItem.item_id,
+            ),
+        )
+        .where(StoreItem.store_id == id)
+    )
+    lines, next_cursor = paginate(
+        session,
+        statement,
+        [(StoreItem.item_id, False)],  # type: ignore
+        cursor=cursor,
+        limit=limit,
+        cursor_values=lambda line: [line.item_id],
+    )
+    # Only then, a store without stock is rare
+    if not lines and not cursor and not session.get(Store, id):
+        raise HTTPException(status_code=404, detail="Store not found")
+    return LocationStock(
+        data=[StockLine.model_validate(line._mapping) for line in lines],
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/{id}/turnover", response_model=TurnoverReport)
+def read_store_turnover(
+    session: SessionDep,
+    id: int,
+    days: Annotated[int, Query(ge=1, le=settings.TURNOVER_HISTORY_DAYS)] = 28,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: str | None = None,
+) -> Any:
+    """
+    Get the units sold, received and counted of each item of a store over
+    the last `days`, with its average stock, turnover and days of supply, by
+    item ID. From the buckets of app.turnover, as of `processed_until`.
+    """
+    start_day = window_start(days)
+    shards = shard_totals()
+    totals = turnover_totals("store", id, start_day)
+    statement = (
+        # Five columns, past the typed overloads of select
+        select(  # type: ignore[call-overload]
+            StoreItem.item_id,
+            (StoreItem.quantity + func.coalesce(shards.c.quantity, 0)).label(
+                "quantity"
+            ),
+            func.coalesce(totals.c.units_in, 0).label("units_in"),
+            func.coalesce(totals.c.units_out, 0).label("units_out"),
+            func.coalesce(totals.c.adjusted, 0).label("adjusted"),
+        )
+        .outerjoin(
+            shards,
+            and_(
+                shards.c.store_id == StoreItem.store_id,
+                shards.c.item_id == StoreItem.item_id,
+            ),
+        )
+        .outerjoin(totals, totals.c.item_id == StoreItem.item_id)
+        .where(StoreItem.store_id == id)
+    )
+    lines, next_cursor = paginate(
+        session,
+        statement,
+        [(StoreItem.item_id, False)],  # type: ignore
+        cursor=cursor,
+        limit=limit,
+        cursor_values=lambda line: [line.item_id],
+    )
+    if not lines and not cursor and not session.get(Store, id):
+        raise HTTPException(status_code=404, detail="Store not found")
+    return TurnoverReport(
+        data=[turnover_line(**line._mapping, days=days) for line in lines],
+        start_day=start_day,
+        processed_until=processed_until(session),
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/{id}/items/{item_id}", response_model=StoreItem)
+def read_store_item(
+    session: SessionDep, response: Response, id: int, item_id: int
+) -> Any:
+    """
+    Get the stock of an item in a store, with its version as ETag.
+    """
+    store_item = session.get(StoreItem, (id, item_id))
+    if not store_item:
+        raise HTTPException(status_code=404, detail="Item not found in store")
+    response.headers["ETag"] = etag(store_item.version)
+    in_slots = sharded_quantity(session, id, item_id)
+    if in_slots is not None:
+        return store_item.model_dump() | {"quantity": store_item.quantity + in_slots}
+    return store_item
+
+
+@router.patch("/{id}/items/{item_id}", response_model=StoreItem)
+def update_store_item(
+    session: SessionDep,
+    response: Response,
+    id: int,
+    item_id: int,
+    update: StockUpdate,
+    if_match: Annotated[str | None, Header()] = None,
+) -> Any:
+    """
+    Set the stock of an item in a store, e.g. after a count. With an
+    `If-Match` ETag, fails with 412 if the stock changed since it was read,
+    without one the stock is set over the latest change.
+    """
+    for _ in range(VERSIONED_WRITE_ATTEMPTS):
+        store_item = session.get(StoreItem, (id, item_id))
+        if not store_item:
+            raise HTTPException(status_code=404, detail="Item not found in store")
+        check_if_match(if_match, store_item.version)
+        if sharded_quantity(session, id, item_id) is not None:
+            raise HTTPException(
+                status_code=409, detail="The stock is sharded, unshard it first"
+            )
+        counted = update.quantity - store_item.quantity
+        store_item.quantity = update.quantity
+        session.add(store_item)
+        if flush_versioned(session, if_match):
+            break
+    else:
+        raise write_conflict()
+    notify_stock_changes(
+        session, [StockChange("store", id, item_id, store_item.quantity)]
+    )
+    record_movements(session, [Movement("store", id, item_id, counted, "count")])
     session.commit()
+    response.headers["ETag"] = etag(store_item.version)
     return store_item
+
+
+@router.put(
+    "/{id}/items/{item_id}/shards",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=StockShards,
+)
+def shard_store_item(
+    session: SessionDep,
+    id: int,
+    item_id: int,
+    count: int = Query(ge=0, le=MAX_SHARDS),
+) -> StockShards:
+    """
+    Split the stock of an item in a store over `count` slots, for purchases
+    of the item to run in parallel, e.g. during a flash sale. Call it again
+    to spread the units shipped meanwhile over the slots, or with 0 to
+    unshard the stock.
+    """
+    shards = reshard(session, id, item_id, count)
+    session.commit()
+    return shards
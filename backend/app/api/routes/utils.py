@@ -1,13 +1,27 @@
-from fastapi import APIRouter, Depends
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Path
+from fastapi.responses import FileResponse
 from pydantic.networks import EmailStr
 
 from app.api.deps import get_current_active_superuser
+from app.core.db import slow_query_log
+from app.core.profiling import profile_path
 from app.models import Message
 from app.utils import generate_test_email, send_email
 
 router = APIRouter()
 
 
+@router.get("/health-check/")
+async def health_check() -> bool:
+    """
+    Answered once the worker is warmed up: Uvicorn only serves requests after
+    the startup of the lifespan, see `app.main.lifespan`.
+    """
+    return True
+
+
 @router.post(
     "/test-email/",
     dependencies=[Depends(get_current_active_superuser)],
@@ -24,3 +38,29 @@ def test_email(email_to: EmailStr) -> Message:
         html_content=email_data.html_content,
     )
     return Message(message="Test email sent")
+
+
+@router.get(
+    "/slow-queries/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def read_slow_queries() -> list[dict[str, Any]]:
+    """
+    Slow SQL statements logged by the worker handling the request, latest first.
+    """
+    return [query.to_dict() for query in slow_query_log.recent()]
+
+
+@router.get(
+    "/profiles/{profile_id}",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_class=FileResponse,
+)
+def read_profile(profile_id: str = Path(pattern="^[0-9a-f]{32}$")) -> Any:
+    """
+    Speedscope profile of a request, see `ProfilingMiddleware`.
+    """
+    path = profile_path(profile_id)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=path.name)
@@ -1,68 +1,166 @@
-from app.tests.utils.http_exceptions import raise404, raiseForbidden
-from fastapi import APIRouter, HTTPException
-from sqlmodel import Session, select, func, join
-from typing import Any
-from app.api.deps import CurrentUser, SessionDep
+from typing import Annotated, Any, Literal
+
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from sqlmodel import func, select
+
+from app.api.batch import BatchIds, get_by_ids
+from app.api.deps import CurrentUser, IdempotencyDep, SessionDep
+from app.api.etags import (
+    VERSIONED_WRITE_ATTEMPTS,
+    check_if_match,
+    etag,
+    flush_versioned,
+    write_conflict,
+)
+from app.api.fields import parse_fields, select_fields, sparse_page
+from app.api.pagination import paginate, sort_keys, starts_with
+from app.core.config import settings
+from app.core.metrics import UNITS_RECEIVED, UNITS_SHIPPED
+from app.core.stock_events import StockChange, notify_stock_changes
 from app.models import (
     Item,
+    LocationStock,
+    ShipmentPlan,
+    ShipmentRequest,
+    StockLine,
+    StockUpdate,
     Store,
     StoreItem,
+    TurnoverReport,
     Warehouse,
     WarehouseItem,
     WarehousePublic,
+    WarehousesBatch,
     WarehousesPublic,
 )
+from app.shipments import ship
+from app.tests.utils.http_exceptions import raise404, raiseForbidden
+from app.turnover import (
+    Movement,
+    processed_until,
+    record_movements,
+    turnover_line,
+    turnover_totals,
+    window_start,
+)
 
 router = APIRouter()
 
 
 @router.get("/items/units", response_model=None)
 def get_units_per_warehouse_item(session: SessionDep):
-    warehouses = session.exec(select(Warehouse)).all()
-    if not warehouses:
-        return []
-    result = []
-    for warehouse in warehouses:
-        warehouse_items_statement = (
-            select(
-                Item,
-                func.sum(WarehouseItem.quantity).label("total_units"),
-                func.sum(WarehouseItem.quantity * Item.wholesale_price).label(
-                    "total_wholesale_value"
-                ),
-                func.sum(WarehouseItem.quantity * Item.retail_price).label(
-                    "total_retail_value"
-                ),
-            )
-            .select_from(join(WarehouseItem, Item, WarehouseItem.item_id == Item.id))
-            .where(WarehouseItem.warehouse_id == warehouse.id)
-            .group_by(Item.id)
+    """
+    Get the units, wholesale and retail value of each item in each warehouse.
+    """
+    warehouse_items_statement = (
+        select(
+            Warehouse.id,
+            Warehouse.name,
+            Item,
+            func.sum(WarehouseItem.quantity).label("total_units"),
+            func.sum(WarehouseItem.quantity * Item.wholesale_price).label(
+                "total_wholesale_value"
+            ),
+            func.sum(WarehouseItem.quantity * Item.retail_price).label(
+                "total_retail_value"
+            ),
         )
-        items = session.exec(warehouse_items_statement).all()
-        result.append(
-            {
-                "name": warehouse.name,
-                "warehouse_id": warehouse.id,
-                "items": [dict(row._asdict()) for row in items],
-            }
+        .select_from(Warehouse)
+        .outerjoin(WarehouseItem, WarehouseItem.warehouse_id == Warehouse.id)
+        .outerjoin(Item, WarehouseItem.item_id == Item.id)
+        .group_by(Warehouse.id, Item.id)
+        .order_by(Warehouse.id, Item.id)
+    )
+    result: dict[int, dict[str, Any]] = {}
+    for warehouse_id, name, *item_row in session.exec(warehouse_items_statement).all():
+        warehouse = result.setdefault(
+            warehouse_id, {"name": name, "warehouse_id": warehouse_id, "items": []}
         )
-    return result
+        item, total_units, total_wholesale_value, total_retail_value = item_row
+        if item is not None:
+            warehouse["items"].append(
+                {
+                    "Item": item,
+                    "total_units": total_units,
+                    "total_wholesale_value": total_wholesale_value,
+                    "total_retail_value": total_retail_value,
+                }
+            )
+    return list(result.values())
+
+
+@router.post("/shipments", response_model=ShipmentPlan)
+def ship_items_to_stores(
+    session: SessionDep, shipment: ShipmentRequest, dry_run: bool = False
+) -> Any:
+    """
+    Ship the demand of the stores from the warehouses at the least total
+    cost (see `costs`), in one transaction. The demand the warehouses can't
+    cover is returned as `unfulfilled`. With `dry_run`, only plan. Fails with
+    a 409 if the stock of the plan was taken while planning.
+    """
+    plan = ship(session, shipment.demand, shipment.costs, dry_run=dry_run)
+    if not dry_run:
+        UNITS_SHIPPED.inc(sum(line.quantity for line in plan.lines))
+    return plan
 
 
 @router.get("/", response_model=WarehousesPublic)
 def read_warehouses(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    session: SessionDep,
+    current_user: CurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    name_prefix: Annotated[str | None, Query(min_length=1)] = None,
+    sort: Literal["id", "name"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    cursor: str | None = None,
+    fields: str | None = None,
 ) -> Any:
     if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Warehouse)
+        # Names in the "C" collation, as in ix_warehouse_name_id
+        name = Warehouse.name.collate("C")  # type: ignore
+        filters = [] if name_prefix is None else [starts_with(name, name_prefix)]
+        names = parse_fields(Warehouse, fields)
+        count_statement = select(func.count()).select_from(Warehouse).where(*filters)
         count = session.exec(count_statement).one()
-        statement = select(Warehouse).offset(skip).limit(limit)
-        warehouses = session.exec(statement).all()
-        return WarehousesPublic(data=list(warehouses), count=count)
+        key = name if sort == "name" else Warehouse.id
+        statement = (
+            select(Warehouse)
+            if names is None
+            else select_fields(Warehouse, [*names, sort, "id"])
+        )
+        warehouses, next_cursor = paginate(
+            session,
+            statement.where(*filters).offset(skip),
+            sort_keys(key, Warehouse.id, order == "desc"),  # type: ignore
+            cursor=cursor,
+            limit=limit,
+            cursor_values=lambda warehouse: [warehouse.id]
+            if sort == "id"
+            else [warehouse.name, warehouse.id],
+        )
+        if names is not None:
+            return sparse_page(warehouses, names, count=count, next_cursor=next_cursor)
+        return WarehousesPublic(data=warehouses, count=count, next_cursor=next_cursor)
     else:
         raise raiseForbidden("warehouse")
 
 
+# Before /{id}, that would match it
+@router.get("/batch", response_model=WarehousesBatch)
+def read_warehouses_batch(
+    session: SessionDep, current_user: CurrentUser, ids: BatchIds
+) -> Any:
+    """
+    Get warehouses by ID (repeat `ids`), in the same order, in one query.
+    """
+    if not current_user.is_superuser:
+        raise raiseForbidden("warehouse")
+    warehouses, missing = get_by_ids(session, Warehouse, ids)
+    return WarehousesBatch(data=warehouses, missing=missing)
+
+
 @router.get("/{id}", response_model=WarehousePublic)
 def read_warehouse(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
     warehouse = session.get(Warehouse, id)
@@ -114,45 +212,53 @@ def delete_warehouse(session: SessionDep, id: int) -> Any:
 
 
 @router.post("/{id}/items/{item_id}", response_model=Warehouse)
-def receive_item(session: SessionDep, id: int, item_id: int, quantity: int) -> Any:
+def receive_item(
+    session: SessionDep,
+    idempotency: IdempotencyDep,
+    id: int,
+    item_id: int,
+    quantity: int,
+) -> Any:
+    if replayed := idempotency.replay():
+        return replayed
     warehouse = session.get(Warehouse, id)
     if not warehouse:
         raise raise404("warehouse")
-    try:
-        warehouse_item_id = next(
-            filter(lambda item: item.item_id == item_id, warehouse.item_links)
-        )
-    except StopIteration:
-        warehouse_item_id = None
-    if not warehouse_item_id:
+    warehouse_item = session.get(WarehouseItem, (id, item_id), with_for_update=True)
+    if not warehouse_item:
         warehouse_item = WarehouseItem(
             warehouse_id=id, item_id=item_id, quantity=quantity
         )
-        warehouse.item_links.append(warehouse_item)
     else:
-        warehouse_item = session.get(WarehouseItem, (id, item_id))
-        if warehouse_item:
-            warehouse_item.quantity += quantity
-    session.add(warehouse)
+        warehouse_item.quantity += quantity
     session.add(warehouse_item)
+    notify_stock_changes(
+        session, [StockChange("warehouse", id, item_id, warehouse_item.quantity)]
+    )
+    record_movements(session, [Movement("warehouse", id, item_id, quantity, "receipt")])
+    idempotency.save(warehouse)
     session.commit()
+    UNITS_RECEIVED.inc(quantity)
     session.refresh(warehouse)
     return warehouse
 
 
 @router.post("/{id}/items/{item_id}/stores/{store_id}")
 def ship_item_to_store(
-    session: SessionDep, id: int, item_id: int, store_id: int, quantity: int
+    session: SessionDep,
+    idempotency: IdempotencyDep,
+    id: int,
+    item_id: int,
+    store_id: int,
+    quantity: int,
 ) -> Any:
+    if replayed := idempotency.replay():
+        return replayed
     warehouse = session.get(Warehouse, id)
     if not warehouse:
         raise raise404("warehouse")
-    try:
-        warehouse_item = next(
-            filter(lambda item: item.item_id == item_id, warehouse.item_links)
-        )
-    except StopIteration:
-        warehouse_item = None
+    # Locked like in the batch shipments: the warehouse stock, then the store's
+    warehouse_item = session.get(WarehouseItem, (id, item_id), with_for_update=True)
     if not warehouse_item:
         raise raise404("warehouse item")
     store = session.get(Store, store_id)
@@ -160,21 +266,166 @@ def ship_item_to_store(
         raise raise404("store")
     if warehouse_item.quantity < quantity:
         raise HTTPException(status_code=400, detail="Not enough items in warehouse")
-    try:
-        store_item = next(
-            filter(lambda item: item.item_id == item_id, store.item_links)
-        )
-    except StopIteration:
-        new_store_item = StoreItem(
-            store_id=store_id, item_id=item_id, quantity=quantity
-        )
-        store.item_links.append(new_store_item)
+    store_item = session.get(StoreItem, (store_id, item_id), with_for_update=True)
+    if not store_item:
+        store_item = StoreItem(store_id=store_id, item_id=item_id, quantity=quantity)
     else:
         store_item.quantity += quantity
     warehouse_item.quantity -= quantity
-    session.add(store)
-    session.add(warehouse)
+    session.add(store_item)
+    session.add(warehouse_item)
+    notify_stock_changes(
+        session,
+        [
+            StockChange("warehouse", id, item_id, warehouse_item.quantity),
+            StockChange("store", store_id, item_id, store_item.quantity),
+        ],
+    )
+    record_movements(
+        session,
+        [
+            Movement("warehouse", id, item_id, -quantity, "shipment"),
+            Movement("store", store_id, item_id, quantity, "shipment"),
+        ],
+    )
+    idempotency.save(warehouse)
     session.commit()
+    UNITS_SHIPPED.inc(quantity)
     session.refresh(warehouse)
-    session.refresh(store)
     return warehouse
+
+
+@router.get("/{id}/items", response_model=LocationStock)
+def read_warehouse_stock(
+    session: SessionDep,
+    id: int,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: str | None = None,
+) -> Any:
+    """
+    Get the stock of a warehouse with its items, by item ID. Pass
+    `next_cursor` back as `cursor` for the next page.
+    """
+    # One join, into plain rows: no relationships to load
+    statement = (
+        # Five columns, past the typed overloads of select
+        select(  # type: ignore[call-overload]
+            WarehouseItem.item_id,
+            Item.title,
+            Item.wholesale_price,
+            Item.retail_price,
+            WarehouseItem.quantity,
+        )
+        .join(Item, Item.id == WarehouseItem.item_id)
+        .where(WarehouseItem.warehouse_id == id)
+    )
+    lines, next_cursor = paginate(
+        session,
+        statement,
+        [(WarehouseItem.item_id, False)],  # type: ignore
+        cursor=cursor,
+        limit=limit,
+        cursor_values=lambda line: [line.item_id],
+    )
+    # Only then, a warehouse without stock is rare
+    if not lines and not cursor and not session.get(Warehouse, id):
+        raise raise404("warehouse")
+    return LocationStock(
+        data=[StockLine.model_validate(line._mapping) for line in lines],
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/{id}/turnover", response_model=TurnoverReport)
+def read_warehouse_turnover(
+    session: SessionDep,
+    id: int,
+    days: Annotated[int, Query(ge=1, le=settings.TURNOVER_HISTORY_DAYS)] = 28,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: str | None = None,
+) -> Any:
+    """
+    Get the units received, shipped and counted of each item of a warehouse
+    over the last `days`, with its average stock, turnover and days of
+    supply, by item ID. From the buckets of app.turnover, as of
+    `processed_until`.
+    """
+    start_day = window_start(days)
+    totals = turnover_totals("warehouse", id, start_day)
+    statement = (
+        # Five columns, past the typed overloads of select
+        select(  # type: ignore[call-overload]
+            WarehouseItem.item_id,
+            WarehouseItem.quantity,
+            func.coalesce(totals.c.units_in, 0).label("units_in"),
+            func.coalesce(totals.c.units_out, 0).label("units_out"),
+            func.coalesce(totals.c.adjusted, 0).label("adjusted"),
+        )
+        .outerjoin(totals, totals.c.item_id == WarehouseItem.item_id)
+        .where(WarehouseItem.warehouse_id == id)
+    )
+    lines, next_cursor = paginate(
+        session,
+        statement,
+        [(WarehouseItem.item_id, False)],  # type: ignore
+        cursor=cursor,
+        limit=limit,
+        cursor_values=lambda line: [line.item_id],
+    )
+    if not lines and not cursor and not session.get(Warehouse, id):
+        raise raise404("warehouse")
+    return TurnoverReport(
+        data=[turnover_line(**line._mapping, days=days) for line in lines],
+        start_day=start_day,
+        processed_until=processed_until(session),
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/{id}/items/{item_id}", response_model=WarehouseItem)
+def read_warehouse_item(
+    session: SessionDep, response: Response, id: int, item_id: int
+) -> Any:
+    """
+    Get the stock of an item in a warehouse, with its version as ETag.
+    """
+    warehouse_item = session.get(WarehouseItem, (id, item_id))
+    if not warehouse_item:
+        raise raise404("warehouse item")
+    response.headers["ETag"] = etag(warehouse_item.version)
+    return warehouse_item
+
+
+@router.patch("/{id}/items/{item_id}", response_model=WarehouseItem)
+def update_warehouse_item(
+    session: SessionDep,
+    response: Response,
+    id: int,
+    item_id: int,
+    update: StockUpdate,
+    if_match: Annotated[str | None, Header()] = None,
+) -> Any:
+    """
+    Set the stock of an item in a warehouse, e.g. after a count. With an
+    `If-Match` ETag, fails with 412 if the stock changed since it was read,
+    without one the stock is set over the latest change.
+    """
+    for _ in range(VERSIONED_WRITE_ATTEMPTS):
+        warehouse_item = session.get(WarehouseItem, (id, item_id))
+        if not warehouse_item:
+            raise raise404("warehouse item")
+        check_if_match(if_match, warehouse_item.version)
+        counted = update.quantity - warehouse_item.quantity
+        warehouse_item.quantity = update.quantity
+        session.add(warehouse_item)
+        if flush_versioned(session, if_match):
+            break
+    else:
+        raise write_conflict()
+    notify_stock_changes(
+        session, [StockChange("warehouse", id, item_id, warehouse_item.quantity)]
+    )
+    record_movements(session, [Movement("warehouse", id, item_id, counted, "count")])
+    session.commit()
+    response.headers["ETag"] = etag(warehouse_item.version)
+    return warehouse_item
@@ -0,0 +1,277 @@
+"""
+Synthetic high-volume dataset generator for scale testing.
+
+Generates stores, warehouses, items, stock levels and purchases with NumPy and
+streams them into Postgres with binary COPY, chunk by chunk, so memory use is
+bounded by --chunk-size whatever the number of rows, e.g.:
+
+    python -m app.benchmarks.datagen --stores 5000 --items 200000 \\
+        --purchases 500000000
+
+Item popularity follows a Zipf law, stores have lognormal sizes, and the
+purchases of each store follow a weekly cycle and a yearly season with a
+store-specific amplitude and phase. The output only depends on --seed and
+--chunk-size.
+"""
+
+import argparse
+import datetime
+import logging
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from typing import cast
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import Connection
+from sqlmodel import Session, text
+
+from app.core.db import engine
+from app.core.partitions import add_months, create_purchase_partitions
+from app.core.pgcopy import binary_copy_rows, copy_binary
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PG_EPOCH = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Relative purchase volume per weekday, Monday first
+WEEKLY_CYCLE = np.array([0.8, 0.8, 0.9, 1.0, 1.2, 1.5, 1.3])
+
+
+@dataclass
+class Config:
+    stores: int = 5_000
+    warehouses: int = 50
+    items: int = 200_000
+    purchases: int = 10_000_000
+    # Number of distinct items stocked by each store
+    assortment: int = 2_000
+    zipf_exponent: float = 1.1
+    days: int = 365
+    start: datetime.date = field(
+        default_factory=lambda: add_months(datetime.date.today(), -12)
+    )
+    chunk_size: int = 1_000_000
+    seed: int = 0
+
+
+def next_id(conn: Connection, table: str) -> int:
+    return int(
+        conn.execute(text(f"SELECT coalesce(max(id), 0) + 1 FROM {table}")).scalar_one()
+    )
+
+
+def reset_sequence(conn: Connection, table: str) -> None:
+    conn.execute(
+        text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT max(id) FROM {table}))"
+        )
+    )
+
+
+def copy_named(
+    conn: Connection, table: str, prefix: str, count: int
+) -> npt.NDArray[np.int64]:
+    """
+    Insert `count` rows with a generated name, return their ids.
+    """
+    first_id = next_id(conn, table)
+    ids = np.arange(first_id, first_id + count)
+    cursor = conn.connection.driver_connection.cursor()  # type: ignore
+    with cursor.copy(f"COPY {table} (id, name) FROM STDIN") as copy:
+        for i in ids:
+            copy.write_row((int(i), f"{prefix}-{i}"))
+    reset_sequence(conn, table)
+    return ids
+
+
+def zipf_cdf(n: int, exponent: float) -> npt.NDArray[np.float64]:
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    cdf = np.cumsum(weights)
+    return cast(npt.NDArray[np.float64], cdf / cdf[-1])
+
+
+class Generator:
+    def __init__(self, config: Config) -> None:
+        self.config = config
+        self.rng = np.random.default_rng(config.seed)
+
+    def generate_items(self, conn: Connection) -> npt.NDArray[np.int64]:
+        config = self.config
+        first_id = next_id(conn, "item")
+        ids = np.arange(first_id, first_id + config.items)
+        wholesale = np.round(self.rng.lognormal(2.5, 0.8, config.items), 2)
+        retail = np.round(wholesale * self.rng.uniform(1.2, 2.5, config.items), 2)
+        cursor = conn.connection.driver_connection.cursor()  # type: ignore
+        with cursor.copy(
+            "COPY item (id, title, wholesale_price, retail_price) FROM STDIN"
+        ) as copy:
+            for item_id, wholesale_price, retail_price in zip(
+                ids.tolist(), wholesale.tolist(), retail.tolist(), strict=True
+            ):
+                copy.write_row(
+                    (item_id, f"sku-{item_id:08d}", wholesale_price, retail_price)
+                )
+        reset_sequence(conn, "item")
+        # Popularity rank -> item id, so that popular items are spread out
+        return self.rng.permutation(ids)
+
+    def stock_chunks(
+        self,
+        location_ids: npt.NDArray[np.int64],
+        item_ids_by_rank: npt.NDArray[np.int64],
+        per_location: int,
+    ) -> Iterator[bytes]:
+        """
+        Stock each location with `per_location` distinct items, the popular
+        ones being more likely to be stocked.
+        """
+        per_location = min(per_location, len(item_ids_by_rank))
+        # The sampling keys of a chunk are a (locations x items) matrix
+        locations_per_chunk = max(1, self.config.chunk_size // len(item_ids_by_rank))
+        # Gumbel top-k sampling: weighted sampling without replacement in one pass
+        log_weights = -self.config.zipf_exponent * np.log(
+            np.arange(1, len(item_ids_by_rank) + 1)
+        )
+        for start in range(0, len(location_ids), locations_per_chunk):
+            locations = location_ids[start : start + locations_per_chunk]
+            keys = log_weights + self.rng.gumbel(
+                size=(len(locations), len(item_ids_by_rank))
+            )
+            ranks = np.argpartition(-keys, per_location - 1, axis=1)[:, :per_location]
+            yield binary_copy_rows(
+                [
+                    (np.repeat(locations, per_location), ">i4"),
+                    (item_ids_by_rank[ranks].ravel(), ">i4"),
+                    (self.rng.integers(0, 500, ranks.size), ">i4"),
+                ]
+            )
+
+    def purchase_chunks(
+        self, store_ids: npt.NDArray[np.int64], item_ids_by_rank: npt.NDArray[np.int64]
+    ) -> Iterator[bytes]:
+        config = self.config
+        item_cdf = zipf_cdf(len(item_ids_by_rank), config.zipf_exponent)
+        store_weights = self.rng.lognormal(0, 0.7, len(store_ids))
+        store_cdf = np.cumsum(store_weights) / store_weights.sum()
+        amplitude = self.rng.uniform(0.1, 0.6, len(store_ids))
+        phase = self.rng.uniform(0, 2 * np.pi, len(store_ids))
+        start_us = (config.start - PG_EPOCH.date()).days * 86_400 * 1_000_000
+        start_weekday = config.start.weekday()
+        max_weight = (1 + amplitude.max()) * WEEKLY_CYCLE.max()
+
+        remaining = config.purchases
+        while remaining:
+            size = min(config.chunk_size, remaining)
+            # Seasonality by rejection sampling: draw (store, day) uniformly
+            # and keep it with a probability proportional to its weight
+            stores = np.empty(0, dtype=np.int64)
+            days = np.empty(0, dtype=np.int64)
+            while len(stores) < size:
+                candidates = np.searchsorted(store_cdf, self.rng.random(size))
+                candidate_days = self.rng.integers(0, config.days, size)
+                weights = (
+                    1
+                    + amplitude[candidates]
+                    * np.sin(2 * np.pi * candidate_days / 365 + phase[candidates])
+                ) * WEEKLY_CYCLE[(start_weekday + candidate_days) % 7]
+                kept = self.rng.random(size) * max_weight < weights
+                stores = np.concatenate([stores, candidates[kept]])
+                days = np.concatenate([days, candidate_days[kept]])
+            stores, days = stores[:size], days[:size]
+            # Opening hours, 8:00 to 22:00
+            seconds = days * 86_400 + self.rng.integers(8 * 3600, 22 * 3600, size)
+            items = item_ids_by_rank[np.searchsorted(item_cdf, self.rng.random(size))]
+            yield binary_copy_rows(
+                [
+                    (store_ids[stores], ">i4"),
+                    (items, ">i4"),
+                    (self.rng.geometric(0.6, size), ">i4"),
+                    (start_us + seconds * 1_000_000, ">i8"),
+                ]
+            )
+            remaining -= size
+            logger.info(f"{config.purchases - remaining} purchases generated")
+
+    def run(self) -> None:
+        config = self.config
+        end = config.start + datetime.timedelta(days=config.days)
+        months = (end.year - config.start.year) * 12 + end.month - config.start.month
+        with Session(engine) as session:
+            create_purchase_partitions(session, start=config.start, months=months)
+        start = time.perf_counter()
+        # COPY goes through the driver's cursor, one transaction per table group
+        with engine.begin() as conn:
+            store_ids = copy_named(conn, "store", "store", config.stores)
+            warehouse_ids = copy_named(
+                conn, "warehouse", "warehouse", config.warehouses
+            )
+            item_ids_by_rank = self.generate_items(conn)
+        logger.info("Stores, warehouses and items generated")
+
+        with engine.begin() as conn:
+            copy_binary(
+                conn,
+                "storeitem",
+                ["store_id", "item_id", "quantity"],
+                self.stock_chunks(store_ids, item_ids_by_rank, config.assortment),
+            )
+            copy_binary(
+                conn,
+                "warehouseitem",
+                ["warehouse_id", "item_id", "quantity"],
+                self.stock_chunks(
+                    warehouse_ids,
+                    item_ids_by_rank,
+                    config.items * 3 // max(1, config.warehouses),
+                ),
+            )
+        logger.info("Stock levels generated")
+
+        with engine.begin() as conn:
+            copy_binary(
+                conn,
+                "purchase",
+                ["store_id", "item_id", "quantity", "created_at"],
+                self.purchase_chunks(store_ids, item_ids_by_rank),
+            )
+        logger.info(f"Data generated in {time.perf_counter() - start:.1f}s")
+
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("ANALYZE"))
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    defaults = Config()
+    parser.add_argument("--stores", type=int, default=defaults.stores)
+    parser.add_argument("--warehouses", type=int, default=defaults.warehouses)
+    parser.add_argument("--items", type=int, default=defaults.items)
+    parser.add_argument("--purchases", type=int, default=defaults.purchases)
+    parser.add_argument(
+        "--assortment",
+        type=int,
+        default=defaults.assortment,
+        help="distinct items stocked per store",
+    )
+    parser.add_argument("--zipf-exponent", type=float, default=defaults.zipf_exponent)
+    parser.add_argument(
+        "--days", type=int, default=defaults.days, help="days of purchase history"
+    )
+    parser.add_argument(
+        "--start",
+        type=datetime.date.fromisoformat,
+        default=defaults.start,
+        help="first day of purchase history (YYYY-MM-DD)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=defaults.chunk_size)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args(argv)
+    Generator(Config(**vars(args))).run()
+
+
+if __name__ == "__main__":
+    main()
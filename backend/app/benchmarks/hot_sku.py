@@ -0,0 +1,165 @@
+"""
+Flash-sale benchmark: concurrent purchases of a single item in a store.
+
+Runs the purchase route from `--concurrency` processes, each with its own
+connection, for `--seconds`, with the stock of the item unsharded (0) and
+then split over each of the `--shards` slot counts, and prints the
+throughput and latency percentiles of each as JSON, e.g.:
+
+    python -m app.benchmarks.hot_sku --shards 0,1,2,4,8,16 --concurrency 16
+
+With the stock unsharded or in one slot, the purchases queue up on a single
+row lock, held from the update to the commit, the throughput should grow
+with the number of slots until another resource (CPU, WAL flushes) is the
+bottleneck. Run it against a dedicated database, it seeds its own store and
+item.
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from dataclasses import asdict
+from multiprocessing.synchronize import Barrier
+from typing import Any
+
+from sqlalchemy import event
+from sqlmodel import Session, create_engine
+
+from app.benchmarks.seed import Scale, seed
+from app.core.config import settings
+
+
+def purchase_loop(
+    store_id: int,
+    item_id: int,
+    seconds: float,
+    latency: float,
+    barrier: Barrier,
+    results: "multiprocessing.Queue[tuple[list[float], int]]",
+) -> None:
+    """
+    Purchase one unit at a time for `seconds`, in a process of its own.
+    """
+    # Imported in the process, they create the engine of the app
+    from fastapi import HTTPException
+
+    from app.api.routes.stores import purchase_store_item
+    from app.core.idempotency import Idempotency
+
+    engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), pool_size=1)
+    if latency:
+        # Round trip to a database over the network, that the locks are held
+        # for too
+        event.listen(engine, "before_cursor_execute", lambda *_: time.sleep(latency))
+    latencies: list[float] = []
+    errors = 0
+    barrier.wait()
+    end = time.perf_counter() + seconds
+    while (start := time.perf_counter()) < end:
+        with Session(engine) as session:
+            try:
+                purchase_store_item(
+                    session, Idempotency(session, None, ""), store_id, item_id, 1
+                )
+            except HTTPException:
+                errors += 1
+        latencies.append(time.perf_counter() - start)
+    engine.dispose()
+    results.put((latencies, errors))
+
+
+def measure(
+    store_id: int,
+    item_id: int,
+    *,
+    concurrency: int,
+    seconds: float,
+    latency: float = 0,
+) -> dict[str, Any]:
+    # Not imported at the top, http_load imports the app, in every process
+    from app.benchmarks.http_load import summarize
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(concurrency + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=purchase_loop,
+            args=(store_id, item_id, seconds, latency, barrier, results),
+        )
+        for _ in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
+    # All the processes are ready, only the purchases are measured
+    barrier.wait()
+    start = time.perf_counter()
+    latencies: list[float] = []
+    errors = 0
+    for _ in processes:
+        process_latencies, process_errors = results.get()
+        latencies += process_latencies
+        errors += process_errors
+    duration = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    return asdict(summarize(latencies, errors, duration))
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--shards", default="0,1,2,4,8,16", help="comma separated slot counts"
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=1,
+        help="added to each statement, to simulate the network round trip",
+    )
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    from app.benchmarks.http_load import git_revision
+    from app.core.db import engine
+    from app.stock_shards import reshard
+
+    with Session(engine) as session:
+        data = seed(session, Scale(stores=1, warehouses=1, items=1, purchases=0))
+    store_id, item_id = data.store_ids[0], data.item_ids[0]
+
+    results = {}
+    for count in [int(count) for count in args.shards.split(",")]:
+        with Session(engine) as session:
+            reshard(session, store_id, item_id, count)
+            session.commit()
+        results[count] = measure(
+            store_id,
+            item_id,
+            concurrency=args.concurrency,
+            seconds=args.seconds,
+            latency=args.latency_ms / 1000,
+        )
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "concurrency": args.concurrency,
+        "seconds": args.seconds,
+        "latency_ms": args.latency_ms,
+        "shards": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+HTTP load benchmark of the inventory API.
+
+Seeds the database at a configurable scale, then drives the real ASGI app
+in-process with concurrent clients over the main inventory flows, and prints
+the throughput and latency percentiles per flow as JSON, e.g.:
+
+    python -m app.benchmarks.http_load --stores 50 --items 2000 \\
+        --purchases 100000 --concurrency 16 --requests 500 > bench.json
+
+Run it against a dedicated database, the write flows modify stock.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from typing import Any
+
+import httpx
+from sqlmodel import Session
+
+from app.benchmarks.seed import Scale, SeededData, seed
+from app.core.config import settings
+from app.core.db import engine
+from app.main import app
+
+# A flow builds the (method, path) of its next request
+Flow = Callable[[random.Random, SeededData], tuple[str, str]]
+
+FLOWS: dict[str, Flow] = {
+    "list": lambda rng, data: ("GET", "/items/"),  # noqa: ARG005
+    "units": lambda rng, data: ("GET", "/items/units"),  # noqa: ARG005
+    "store_units": lambda rng, data: ("GET", "/stores/items/units"),  # noqa: ARG005
+    "warehouse_units": lambda rng, data: ("GET", "/warehouses/items/units"),  # noqa: ARG005
+    "revenue": lambda rng, data: ("GET", "/stores/revenue"),  # noqa: ARG005
+    "receive": lambda rng, data: (
+        "POST",
+        f"/warehouses/{rng.choice(data.warehouse_ids)}"
+        f"/items/{rng.choice(data.item_ids)}?quantity=10",
+    ),
+    "ship": lambda rng, data: (
+        "POST",
+        f"/warehouses/{rng.choice(data.warehouse_ids)}"
+        f"/items/{rng.choice(data.item_ids)}"
+        f"/stores/{rng.choice(data.store_ids)}?quantity=1",
+    ),
+    "purchase": lambda rng, data: (
+        "POST",
+        f"/stores/{rng.choice(data.store_ids)}"
+        f"/items/{rng.choice(data.item_ids)}/purchase?quantity=1",
+    ),
+}
+
+
+@dataclass
+class FlowResult:
+    requests: int
+    errors: int
+    duration_s: float
+    throughput_rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+def summarize(latencies: list[float], errors: int, duration: float) -> FlowResult:
+    """
+    Summarize the latencies (in seconds) of the requests of a flow.
+    """
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    if len(latencies_ms) > 1:
+        percentiles = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+    else:
+        percentiles = latencies_ms * 99
+    return FlowResult(
+        requests=len(latencies_ms),
+        errors=errors,
+        duration_s=round(duration, 3),
+        throughput_rps=round(len(latencies_ms) / duration, 1) if duration else 0.0,
+        p50_ms=round(percentiles[49], 2),
+        p95_ms=round(percentiles[94], 2),
+        p99_ms=round(percentiles[98], 2),
+        max_ms=round(latencies_ms[-1], 2),
+    )
+
+
+async def run_flow(
+    client: httpx.AsyncClient,
+    flow: Flow,
+    data: SeededData,
+    *,
+    requests: int,
+    concurrency: int,
+    rng_seed: int,
+) -> FlowResult:
+    """
+    Send `requests` requests of `flow` from `concurrency` concurrent clients.
+    """
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker(worker_id: int) -> None:
+        nonlocal errors
+        rng = random.Random(rng_seed * 1000 + worker_id)
+        for _ in remaining:
+            method, path = flow(rng, data)
+            start = time.perf_counter()
+            response = await client.request(method, f"{settings.API_V1_STR}{path}")
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def get_token_headers(client: httpx.AsyncClient) -> dict[str, str]:
+    response = await client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={
+            "username": settings.FIRST_SUPERUSER,
+            "password": settings.FIRST_SUPERUSER_PASSWORD,
+        },
+    )
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_benchmark(
+    data: SeededData,
+    *,
+    flows: list[str],
+    requests: int,
+    concurrency: int,
+    warmup: int = 10,
+    rng_seed: int = 0,
+) -> dict[str, FlowResult]:
+    results = {}
+    transport = httpx.ASGITransport(app=app)  # type: ignore
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark", timeout=None
+    ) as client:
+        client.headers.update(await get_token_headers(client))
+        for name in flows:
+            if warmup:
+                await run_flow(
+                    client,
+                    FLOWS[name],
+                    data,
+                    requests=warmup,
+                    concurrency=1,
+                    rng_seed=rng_seed,
+                )
+            results[name] = await run_flow(
+                client,
+                FLOWS[name],
+                data,
+                requests=requests,
+                concurrency=concurrency,
+                rng_seed=rng_seed,
+            )
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--stores", type=int, default=Scale.stores)
+    parser.add_argument("--warehouses", type=int, default=Scale.warehouses)
+    parser.add_argument("--items", type=int, default=Scale.items)
+    parser.add_argument("--purchases", type=int, default=Scale.purchases)
+    parser.add_argument("--requests", type=int, default=200, help="per flow")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10, help="requests per flow")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--flows", default=",".join(FLOWS), help="comma separated subset of flows"
+    )
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    flows = args.flows.split(",")
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"unknown flows: {', '.join(sorted(unknown))}")
+
+    scale = Scale(
+        stores=args.stores,
+        warehouses=args.warehouses,
+        items=args.items,
+        purchases=args.purchases,
+    )
+    with Session(engine) as session:
+        data = seed(session, scale, rng_seed=args.seed)
+
+    results = asyncio.run(
+        run_benchmark(
+            data,
+            flows=flows,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            warmup=args.warmup,
+            rng_seed=args.seed,
+        )
+    )
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "scale": asdict(scale),
+        "concurrency": args.concurrency,
+        "requests_per_flow": args.requests,
+        "seed": args.seed,
+        "flows": {name: asdict(result) for name, result in results.items()},
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import random
+from collections.abc import Iterable
+from dataclasses import dataclass
+from itertools import islice
+
+from sqlmodel import Session, insert
+
+from app.models import Item, Purchase, Store, StoreItem, Warehouse, WarehouseItem
+
+# Large enough that the write flows of a benchmark never run out of stock
+STOCK_QUANTITY = 1_000_000
+
+
+@dataclass
+class Scale:
+    stores: int = 20
+    warehouses: int = 5
+    items: int = 500
+    purchases: int = 20_000
+
+
+@dataclass
+class SeededData:
+    store_ids: list[int]
+    warehouse_ids: list[int]
+    item_ids: list[int]
+
+
+def _insert_returning_ids(
+    session: Session, model: type, rows: list[dict[str, object]]
+) -> list[int]:
+    if not rows:
+        return []
+    result = session.execute(insert(model).returning(model.id), rows)  # type: ignore
+    return list(result.scalars())
+
+
+def _insert_batched(
+    session: Session, model: type, rows: Iterable[dict[str, object]], batch_size: int
+) -> None:
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        session.execute(insert(model), batch)
+
+
+def seed(
+    session: Session, scale: Scale, *, rng_seed: int = 0, batch_size: int = 10_000
+) -> SeededData:
+    """
+    Insert `scale` stores, warehouses and items, with every item stocked in
+    every warehouse and in every store, and `scale.purchases` purchases of
+    random items from random stores. The data only depends on `rng_seed`.
+    """
+    rng = random.Random(rng_seed)
+    store_ids = _insert_returning_ids(
+        session, Store, [{"name": f"bench-store-{i}"} for i in range(scale.stores)]
+    )
+    warehouse_ids = _insert_returning_ids(
+        session,
+        Warehouse,
+        [{"name": f"bench-warehouse-{i}"} for i in range(scale.warehouses)],
+    )
+    item_rows: list[dict[str, object]] = []
+    for i in range(scale.items):
+        wholesale_price = round(rng.uniform(1, 50), 2)
+        item_rows.append(
+            {
+                "title": f"bench-item-{i}",
+                "wholesale_price": wholesale_price,
+                "retail_price": round(wholesale_price * rng.uniform(1.1, 2), 2),
+            }
+        )
+    item_ids = _insert_returning_ids(session, Item, item_rows)
+
+    _insert_batched(
+        session,
+        StoreItem,
+        (
+            {"store_id": store_id, "item_id": item_id, "quantity": STOCK_QUANTITY}
+            for item_id in item_ids
+            for store_id in store_ids
+        ),
+        batch_size,
+    )
+    _insert_batched(
+        session,
+        WarehouseItem,
+        (
+            {
+                "warehouse_id": warehouse_id,
+                "item_id": item_id,
+                "quantity": STOCK_QUANTITY,
+            }
+            for item_id in item_ids
+            for warehouse_id in warehouse_ids
+        ),
+        batch_size,
+    )
+    _insert_batched(
+        session,
+        Purchase,
+        (
+            {
+                "store_id": rng.choice(store_ids),
+                "item_id": rng.choice(item_ids),
+                "quantity": rng.randint(1, 5),
+            }
+            for _ in range(scale.purchases)
+        ),
+        batch_size,
+    )
+    session.commit()
+    return SeededData(
+        store_ids=store_ids, warehouse_ids=warehouse_ids, item_ids=item_ids
+    )
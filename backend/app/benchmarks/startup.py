@@ -0,0 +1,183 @@
+"""
+Worker cold-start benchmark.
+
+Measures the time to import the app in a fresh interpreter, and starts
+Gunicorn with and without `preload_app` to measure the time until all the
+workers are ready and the memory used by each of them, e.g.:
+
+    python -m app.benchmarks.startup --workers 4 > startup.json
+
+Linux only, the memory of the workers is read from /proc.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+IMPORT_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app.main
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+}))
+"""
+
+READY_LINE = "Application startup complete."
+
+
+def measure_import(repeat: int = 5) -> dict[str, Any]:
+    """
+    Import `app.main` in `repeat` fresh interpreters.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {
+        "median_seconds": statistics.median(run["seconds"] for run in runs),
+        "max_rss_mb": max(run["max_rss_mb"] for run in runs),
+        "modules": runs[-1]["modules"],
+    }
+
+
+def memory_mb(pid: int) -> dict[str, float]:
+    """
+    Memory of a process: resident, proportional (shared pages are split among
+    the processes sharing them) and private.
+    """
+    fields: dict[str, float] = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value, *_ = line.split()
+        fields[name.rstrip(":")] = int(value) / 1024
+    return {
+        "rss_mb": fields["Rss"],
+        "pss_mb": fields["Pss"],
+        "private_mb": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def child_pids(pid: int) -> list[int]:
+    children = Path(f"/proc/{pid}/task/{pid}/children").read_text()
+    return [int(child) for child in children.split()]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def measure_workers(
+    workers: int, *, preload: bool, timeout: float = 60
+) -> dict[str, Any]:
+    """
+    Start Gunicorn with `workers` workers, wait until they are all ready and
+    measure their memory.
+    """
+    with tempfile.TemporaryDirectory() as metrics_dir:
+        env = {
+            **os.environ,
+            "BIND": f"127.0.0.1:{free_port()}",
+            "WEB_CONCURRENCY": str(workers),
+            "PRELOAD_APP": str(preload).lower(),
+            "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+            "ACCESS_LOG": "",
+        }
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                "-c",
+                "gunicorn_conf.py",
+                "-k",
+                "uvicorn.workers.UvicornWorker",
+                "app.main:app",
+            ],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        ready = threading.Semaphore(0)
+
+        def read_log() -> None:
+            assert server.stderr
+            for line in server.stderr:
+                if READY_LINE in line:
+                    ready.release()
+
+        threading.Thread(target=read_log, daemon=True).start()
+        try:
+            for _ in range(workers):
+                remaining = timeout - (time.perf_counter() - start)
+                if not ready.acquire(timeout=max(remaining, 0)):
+                    raise TimeoutError(f"{workers} workers not ready in {timeout}s")
+            ready_seconds = time.perf_counter() - start
+            worker_memory = [memory_mb(pid) for pid in child_pids(server.pid)]
+            return {
+                "preload": preload,
+                "workers": workers,
+                "ready_seconds": ready_seconds,
+                "master": memory_mb(server.pid),
+                "per_worker": {
+                    name: statistics.mean(memory[name] for memory in worker_memory)
+                    for name in worker_memory[0]
+                },
+            }
+        finally:
+            server.terminate()
+            server.wait(timeout)
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5, help="import runs")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    # Not imported at the top, http_load imports the app
+    from app.benchmarks.http_load import git_revision
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "import": measure_import(args.repeat),
+        "gunicorn": [
+            measure_workers(args.workers, preload=preload) for preload in (False, True)
+        ],
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
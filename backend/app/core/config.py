@@ -66,6 +66,53 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Database connections opened by each worker when it starts
+    WARM_UP_CONNECTIONS: int = 5
+
+    # Report the SQL statements run by each request in its response headers
+    QUERY_STATS_HEADERS: bool = True
+    # Raise instead of lazy loading relationships, to audit N+1 queries
+    SQLALCHEMY_LAZY_RAISE: bool = False
+    # Expose Prometheus metrics at /metrics
+    METRICS_ENABLED: bool = True
+    # Log the statements slower than this, None to disable
+    SLOW_QUERY_THRESHOLD_MS: float | None = 200
+    # Share of the slow SELECT statements to run again under EXPLAIN ANALYZE
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE: float = 0.1
+    # Number of slow statements kept by each worker
+    SLOW_QUERY_LOG_SIZE: int = 100
+    # Let superusers profile a request with an `X-Profile: 1` header
+    PROFILING_ENABLED: bool = True
+    PROFILING_INTERVAL_MS: float = 5
+    PROFILES_DIR: str = "/tmp/profiles"
+    # Push the stock changes to the clients of /stock/events
+    STOCK_EVENTS_ENABLED: bool = True
+    # Changes buffered per client, a client falling further behind is dropped
+    STOCK_EVENTS_QUEUE_SIZE: int = 1000
+
+    # Group the concurrent purchases of a worker into shared transactions
+    PURCHASE_GROUP_COMMIT: bool = False
+    # A batch waits this long for purchases to join it, up to the max size,
+    # itself at most half of the threadpool and of the connection pool (see
+    # app.group_commit)
+    PURCHASE_GROUP_COMMIT_WINDOW_MS: float = 2
+    PURCHASE_GROUP_COMMIT_MAX_SIZE: int = 7
+
+    # Idempotency keys are kept at least this long, then purged by app.maintenance
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+
+    # Monthly partitions of the purchase table to create ahead of time
+    PURCHASE_PARTITIONS_AHEAD: int = 3
+    # Partitions older than this many months are dropped by app.maintenance
+    PURCHASE_RETENTION_MONTHS: int | None = None
+    # The ABC classification of app.maintenance ranks the sales of this period
+    ABC_LOOKBACK_DAYS: int = 90
+    # Days of sales and stock movements kept for the turnover report
+    TURNOVER_HISTORY_DAYS: int = 90
+    # Intervals of the jobs run by app.scheduler
+    TURNOVER_REFRESH_INTERVAL_SECONDS: float = 300
+    MAINTENANCE_INTERVAL_HOURS: float = 24
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
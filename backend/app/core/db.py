@@ -1,10 +1,26 @@
+import datetime
+
 from sqlmodel import Session, create_engine, select
 
 from app import crud
 from app.core.config import settings
+from app.core.metrics import instrument_pool
+from app.core.partitions import create_purchase_partitions
+from app.core.query_stats import instrument_engine
+from app.core.slow_queries import SlowQueryLog
 from app.models import User, UserCreate
 
 engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+instrument_engine(engine)
+instrument_pool(engine)
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS or 0,
+    explain_sample_rate=settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+    size=settings.SLOW_QUERY_LOG_SIZE,
+)
+if settings.SLOW_QUERY_THRESHOLD_MS is not None:
+    slow_query_log.install(engine)
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -32,3 +48,9 @@ def init_db(session: Session) -> None:
             is_superuser=True,
         )
         user = crud.create_user(session=session, user_create=user_in)
+
+    create_purchase_partitions(
+        session,
+        start=datetime.datetime.now(datetime.timezone.utc).date(),
+        months=settings.PURCHASE_PARTITIONS_AHEAD,
+    )
@@ -0,0 +1,119 @@
+"""
+Idempotency keys for the stock mutations.
+
+A client sends the same `Idempotency-Key` header with every retry of a
+request. The first request claims the key by inserting it at the start of
+its transaction, and stores its response in the same transaction, so the
+key is only kept if the changes are committed. A retry that finds the key
+gets the stored response, without running the request again. A retry sent
+while the first request is still running waits on the insert of the key
+until the first one commits, then gets its response, or rolls back, then
+runs in its place.
+
+Failed requests (4xx, 5xx) roll back and don't keep their key: retrying them
+runs them again.
+"""
+
+import datetime
+import hashlib
+import json
+from typing import Any
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlmodel import Session, delete, text
+
+from app.core.config import settings
+from app.models import IdempotencyKey
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def request_hash(request: Request) -> str:
+    """
+    Hash of the method, path and query parameters of `request`, to reject a
+    key reused for another request.
+    """
+    query = sorted(request.query_params.multi_items())
+    return hashlib.sha256(
+        f"{request.method} {request.url.path} {query}".encode()
+    ).hexdigest()
+
+
+class Idempotency:
+    def __init__(self, session: Session, key: str | None, request_hash: str) -> None:
+        self.session = session
+        self.key = key
+        self.request_hash = request_hash
+
+    def replay(self) -> JSONResponse | None:
+        """
+        Claim the key, or return the stored response if it was already used.
+        Does nothing without a key.
+        """
+        if self.key is None:
+            return None
+        claimed = self.session.execute(
+            text(
+                "INSERT INTO idempotencykey (key, request_hash) "
+                "VALUES (:key, :request_hash) "
+                "ON CONFLICT (key) DO NOTHING RETURNING key"
+            ),
+            {"key": self.key, "request_hash": self.request_hash},
+        ).first()
+        if claimed:
+            return None
+        stored = self.session.get(IdempotencyKey, self.key)
+        if stored and stored.request_hash != self.request_hash:
+            raise HTTPException(
+                status_code=422, detail="Idempotency-Key used for another request"
+            )
+        # Purged since the insert, or committed without a response
+        if not stored or stored.status_code is None:
+            raise HTTPException(
+                status_code=409, detail="Idempotency-Key has no stored response"
+            )
+        return JSONResponse(
+            stored.response,
+            status_code=stored.status_code,
+            headers={REPLAYED_HEADER: "true"},
+        )
+
+    def save(self, response: Any, status_code: int = 200) -> None:
+        """
+        Store the response of the request, to be committed with its changes.
+        Does nothing without a key.
+        """
+        if self.key is None:
+            return
+        # Write the changes first, for the response to match the committed
+        # rows, e.g. their versions
+        self.session.flush()
+        self.session.execute(
+            text(
+                "UPDATE idempotencykey "
+                "SET status_code = :status_code, response = CAST(:response AS jsonb) "
+                "WHERE key = :key"
+            ),
+            {
+                "key": self.key,
+                "status_code": status_code,
+                "response": json.dumps(jsonable_encoder(response)),
+            },
+        )
+
+
+def purge_idempotency_keys(session: Session) -> int:
+    """
+    Delete the keys older than `IDEMPOTENCY_KEY_TTL_HOURS`, returns their
+    number.
+    """
+    before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        hours=settings.IDEMPOTENCY_KEY_TTL_HOURS
+    )
+    result = session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < before)  # type: ignore
+    )
+    session.commit()
+    return result.rowcount  # type: ignore
@@ -0,0 +1,162 @@
+import os
+import time
+
+from anyio import to_thread
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import Engine, event
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# With several worker processes (e.g. gunicorn), each process writes its
+# metrics to its own files in PROMETHEUS_MULTIPROC_DIR, and they are
+# aggregated when scraped. Gauges are summed over the live processes.
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+# Label values are bounded: route templates, known methods and status classes
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+UNMATCHED_ROUTE = "unmatched"
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being processed",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+THREADPOOL_BUSY = Gauge(
+    "threadpool_busy_threads",
+    "Threads of the threadpool running sync endpoints and dependencies",
+    multiprocess_mode="livesum",
+)
+THREADPOOL_SIZE = Gauge(
+    "threadpool_size",
+    "Size of the threadpool running sync endpoints and dependencies",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Database connections checked out of the pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow_connections",
+    "Database connections opened beyond the pool size",
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a database connection from the pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+PURCHASE_BATCH_SIZE = Histogram(
+    "purchase_batch_size",
+    "Purchases committed together by group commit",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+UNITS_SOLD = Counter("inventory_units_sold", "Units sold in stores")
+UNITS_RECEIVED = Counter("inventory_units_received", "Units received in warehouses")
+UNITS_SHIPPED = Counter("inventory_units_shipped", "Units shipped to stores")
+
+
+def instrument_pool(engine: Engine) -> None:
+    """
+    Track the connections checked out of the pool of `engine`.
+    """
+
+    def update_pool_gauges(*args: object) -> None:  # noqa: ARG001
+        pool = engine.pool
+        DB_POOL_CHECKED_OUT.set(pool.checkedout())  # type: ignore
+        DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))  # type: ignore
+
+    event.listen(engine, "checkout", update_pool_gauges)
+    event.listen(engine, "checkin", update_pool_gauges)
+
+
+class MetricsMiddleware:
+    """
+    Record the latency of each request by route, and the requests in progress.
+
+    Streamed responses (Server-Sent Events) last as long as the client stays
+    connected: they are no longer in progress once their response starts,
+    and their duration is not a latency.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"] if scope["method"] in METHODS else "OTHER"
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        status = 500
+        streaming = False
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = is_event_stream(message)
+                if streaming:
+                    in_progress.dec()
+            await send(message)
+
+        in_progress.inc()
+        record_threadpool_usage()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if not streaming:
+                # The router stores the matched route in the scope
+                route = scope.get("route")
+                REQUEST_DURATION.labels(
+                    method,
+                    getattr(route, "path", UNMATCHED_ROUTE),
+                    f"{status // 100}xx",
+                ).observe(time.perf_counter() - start)
+                in_progress.dec()
+            record_threadpool_usage()
+
+
+def is_event_stream(message: Message) -> bool:
+    return any(
+        name == b"content-type" and value.startswith(b"text/event-stream")
+        for name, value in message.get("headers", [])
+    )
+
+
+def record_threadpool_usage() -> None:
+    limiter = to_thread.current_default_thread_limiter()
+    THREADPOOL_BUSY.set(limiter.borrowed_tokens)
+    THREADPOOL_SIZE.set(limiter.total_tokens)
+
+
+async def metrics(request: Request) -> Response:  # noqa: ARG001
+    """
+    Expose the metrics in the Prometheus text format.
+    """
+    record_threadpool_usage()
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)  # type: ignore
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,165 @@
+import datetime
+import logging
+import re
+
+from sqlmodel import Session, text
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "purchase_p"
+# Catches the purchases of the months without a partition, e.g. when the
+# maintenance didn't run for months, rather than failing them
+DEFAULT_PARTITION = "purchase_default"
+PARTITION_NAME_RE = re.compile(rf"^{PARTITION_PREFIX}(\d{{4}})_(\d{{2}})$")
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def add_months(day: datetime.date, months: int) -> datetime.date:
+    month_index = day.year * 12 + day.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"{PARTITION_PREFIX}{month.year:04d}_{month.month:02d}"
+
+
+def list_purchase_partitions(session: Session) -> dict[datetime.date, str]:
+    """
+    Return the monthly partitions attached to `purchase`, keyed by month.
+    """
+    rows = session.exec(  # type: ignore
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'purchase'::regclass"
+        )
+    ).all()
+    partitions = {}
+    for (name,) in rows:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions[datetime.date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def create_purchase_partitions(
+    session: Session, *, start: datetime.date, months: int
+) -> list[str]:
+    """
+    Create the monthly partitions of `purchase` from the month of `start`,
+    `months` months ahead. Existing partitions are left untouched.
+
+    Indexes defined on `purchase` (including the BRIN index on `created_at`)
+    are created on every new partition by Postgres. The purchases of the
+    month found in the default partition are moved to the new one.
+    """
+    existing = list_purchase_partitions(session)
+    created = []
+    month = month_start(start)
+    for _ in range(months + 1):
+        if month not in existing:
+            name = partition_name(month)
+            bounds = {
+                "start": f"{month.isoformat()} 00:00:00+00",
+                "end": f"{add_months(month, 1).isoformat()} 00:00:00+00",
+            }
+            # Postgres refuses the partition while the default one holds rows
+            # of its range: they are set aside, then inserted again
+            session.exec(  # type: ignore
+                text(
+                    "CREATE TEMPORARY TABLE purchase_moved (LIKE purchase) "
+                    "ON COMMIT DROP"
+                )
+            )
+            moved = session.exec(  # type: ignore
+                text(
+                    "WITH moved AS (DELETE FROM purchase_default "
+                    "WHERE created_at >= :start AND created_at < :end RETURNING *) "
+                    "INSERT INTO purchase_moved SELECT * FROM moved"
+                ),
+                params=bounds,
+            ).rowcount
+            session.exec(  # type: ignore
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF purchase "
+                    f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+                )
+            )
+            if moved:
+                logger.warning(
+                    f"Moved {moved} purchases from {DEFAULT_PARTITION} to {name}, "
+                    "the partitions should be created ahead of time"
+                )
+                session.exec(text("INSERT INTO purchase SELECT * FROM purchase_moved"))  # type: ignore
+            session.exec(text("DROP TABLE purchase_moved"))  # type: ignore
+            created.append(name)
+        month = add_months(month, 1)
+    session.commit()
+    return created
+
+
+def drop_purchase_partitions(
+    session: Session, *, before: datetime.date, drop: bool = True
+) -> list[str]:
+    """
+    Detach the partitions of `purchase` entirely older than the month of
+    `before` and, unless `drop` is False, drop them.
+
+    Detaching and dropping a partition only touches the catalog, unlike a
+    DELETE it leaves no dead tuples to vacuum. Detached partitions are kept as
+    standalone tables when `drop` is False, e.g. to archive them first.
+
+    The default partition spans no month: its purchases older than the month
+    of `before`, e.g. the undated legacy ones kept at the epoch, are deleted
+    from it, or moved to a standalone table when `drop` is False.
+    """
+    cutoff = month_start(before)
+    removed = []
+    for month, name in sorted(list_purchase_partitions(session).items()):
+        if add_months(month, 1) > cutoff:
+            continue
+        session.exec(text(f"ALTER TABLE purchase DETACH PARTITION {name}"))  # type: ignore
+        if drop:
+            session.exec(text(f"DROP TABLE {name}"))  # type: ignore
+        removed.append(name)
+    purge_default_partition(session, cutoff=cutoff, drop=drop)
+    session.commit()
+    return removed
+
+
+def purge_default_partition(
+    session: Session, *, cutoff: datetime.date, drop: bool
+) -> int:
+    """
+    Delete the purchases of the default partition from before `cutoff`, first
+    copied to a standalone table when `drop` is False. Returns their number.
+    """
+    params = {"cutoff": f"{cutoff.isoformat()} 00:00:00+00"}
+    where = "WHERE created_at < :cutoff"
+    any_old = session.exec(  # type: ignore
+        text(f"SELECT EXISTS (SELECT FROM {DEFAULT_PARTITION} {where})"),
+        params=params,
+    ).scalar_one()
+    if not any_old:
+        return 0
+    kept = ""
+    if not drop:
+        archive = f"{DEFAULT_PARTITION}_{cutoff.year:04d}_{cutoff.month:02d}"
+        session.exec(  # type: ignore
+            text(f"CREATE TABLE IF NOT EXISTS {archive} (LIKE purchase)")
+        )
+        session.exec(  # type: ignore
+            text(f"INSERT INTO {archive} SELECT * FROM {DEFAULT_PARTITION} {where}"),
+            params=params,
+        )
+        kept = f", kept in {archive}"
+    purged: int = session.exec(  # type: ignore
+        text(f"DELETE FROM {DEFAULT_PARTITION} {where}"), params=params
+    ).rowcount
+    logger.info(
+        f"Deleted {purged} purchases of before {cutoff} from {DEFAULT_PARTITION}{kept}"
+    )
+    return purged
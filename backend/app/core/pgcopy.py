@@ -0,0 +1,78 @@
+"""
+Postgres binary COPY of fixed-width columns to and from NumPy arrays.
+
+Columns are given with their big-endian NumPy type, ">i4" for integer and
+">i8" for bigint and timestamptz (microseconds since 2000-01-01 UTC). Values
+must not be NULL.
+"""
+
+import struct
+from collections.abc import Iterator
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import Connection
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+
+
+def row_dtype(dtypes: list[str]) -> np.dtype[np.void]:
+    """
+    Type of a row in the binary COPY format: the number of fields, then the
+    length and the value of each field.
+    """
+    fields: list[tuple[str, str]] = [("count", ">i2")]
+    for i, dtype in enumerate(dtypes):
+        fields += [(f"length_{i}", ">i4"), (f"value_{i}", dtype)]
+    return np.dtype(fields)
+
+
+def binary_copy_rows(columns: list[tuple[npt.NDArray[Any], str]]) -> bytes:
+    """
+    Encode columns as rows of the binary COPY format.
+    """
+    rows = np.empty(
+        len(columns[0][0]), dtype=row_dtype([dtype for _, dtype in columns])
+    )
+    rows["count"] = len(columns)
+    for i, (values, dtype) in enumerate(columns):
+        rows[f"length_{i}"] = np.dtype(dtype).itemsize
+        rows[f"value_{i}"] = values
+    return rows.tobytes()
+
+
+def copy_binary(
+    conn: Connection, table: str, names: list[str], chunks: Iterator[bytes]
+) -> None:
+    """
+    Stream chunks of binary COPY rows into `table`.
+    """
+    cursor = conn.connection.driver_connection.cursor()  # type: ignore
+    with cursor.copy(
+        f"COPY {table} ({', '.join(names)}) FROM STDIN WITH (FORMAT BINARY)"
+    ) as copy:
+        copy.write(PGCOPY_HEADER)
+        for chunk in chunks:
+            copy.write(chunk)
+        copy.write(PGCOPY_TRAILER)
+
+
+def copy_binary_out(
+    conn: Connection, query: str, dtypes: list[str], params: Any = None
+) -> list[npt.NDArray[Any]]:
+    """
+    Run `query` and return its columns as native-endian arrays, without
+    creating a Python object per value.
+    """
+    cursor = conn.connection.driver_connection.cursor()  # type: ignore
+    with cursor.copy(f"COPY ({query}) TO STDOUT WITH (FORMAT BINARY)", params) as copy:
+        data = b"".join(copy)
+    row_type = row_dtype(dtypes)
+    count = (len(data) - len(PGCOPY_HEADER) - len(PGCOPY_TRAILER)) // row_type.itemsize
+    rows = np.frombuffer(data, dtype=row_type, count=count, offset=len(PGCOPY_HEADER))
+    return [
+        rows[f"value_{i}"].astype(np.dtype(dtype).newbyteorder("="))
+        for i, dtype in enumerate(dtypes)
+    ]
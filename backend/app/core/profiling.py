@@ -0,0 +1,216 @@
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from types import FrameType
+from typing import Any
+
+from fastapi import HTTPException
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.core.db import engine
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_URL_HEADER = "X-Profile-URL"
+
+APP_DIR = str(Path(__file__).resolve().parents[1])
+
+
+def thread_cpu_time(ident: int) -> float | None:
+    """
+    CPU time used by a thread, where the platform supports it.
+    """
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+
+class Sampler:
+    """
+    Sampling profiler of all the threads of the process.
+
+    Every `interval` seconds, record the stack of each thread with the wall
+    time and the CPU time it used since the previous sample. Unlike a profiler
+    hooked in the interpreter, the overhead does not depend on the number of
+    function calls, and the threadpool running sync endpoints is profiled.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.frames: dict[tuple[str, str, int], int] = {}
+        # Thread id -> (stack, wall time, CPU time) samples
+        self.samples: dict[int, list[tuple[list[int], float, float]]] = defaultdict(
+            list
+        )
+        self.thread_names: dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+
+    def _frame_index(self, frame: FrameType) -> int:
+        code = frame.f_code
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        return self.frames.setdefault(key, len(self.frames))
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        last_wall = time.perf_counter()
+        last_cpu: dict[int, float | None] = {}
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            wall, last_wall = now - last_wall, now
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                cpu_time = thread_cpu_time(ident)
+                previous = last_cpu.get(ident)
+                last_cpu[ident] = cpu_time
+                cpu = (
+                    cpu_time - previous
+                    if cpu_time is not None and previous is not None
+                    else 0.0
+                )
+                stack: list[int] = []
+                current: FrameType | None = frame
+                while current is not None:
+                    stack.append(self._frame_index(current))
+                    current = current.f_back
+                stack.reverse()
+                self.samples[ident].append((stack, wall, cpu))
+            for thread in threading.enumerate():
+                if thread.ident is not None:
+                    self.thread_names[thread.ident] = thread.name
+
+    def to_speedscope(self, name: str) -> dict[str, Any]:
+        """
+        Export the samples in the speedscope format, with a wall time and a
+        CPU time profile per thread that ran code of the app.
+        """
+        frames = sorted(self.frames.items(), key=lambda item: item[1])
+        app_frames = {
+            index for (_, filename, _), index in frames if filename.startswith(APP_DIR)
+        }
+        profiles = []
+        for ident, samples in self.samples.items():
+            if not any(app_frames.intersection(stack) for stack, _, _ in samples):
+                continue
+            thread_name = self.thread_names.get(ident, str(ident))
+            for clock, weights in (
+                ("wall", [wall for _, wall, _ in samples]),
+                ("cpu", [cpu for _, _, cpu in samples]),
+            ):
+                profiles.append(
+                    {
+                        "type": "sampled",
+                        "name": f"{thread_name} ({clock} time)",
+                        "unit": "seconds",
+                        "startValue": 0,
+                        "endValue": sum(weights),
+                        "samples": [stack for stack, _, _ in samples],
+                        "weights": weights,
+                    }
+                )
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": settings.PROJECT_NAME,
+            "activeProfileIndex": 0,
+            "shared": {
+                "frames": [
+                    {"name": function, "file": filename, "line": line}
+                    for (function, filename, line), _ in frames
+                ]
+            },
+            "profiles": profiles,
+        }
+
+
+def profile_path(profile_id: str) -> Path:
+    return Path(settings.PROFILES_DIR) / f"{profile_id}.speedscope.json"
+
+
+def is_superuser(authorization: str | None) -> bool:
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    with Session(engine) as session:
+        try:
+            return get_current_user(session, token).is_superuser
+        except HTTPException:
+            return False
+
+
+class ProfilingMiddleware:
+    """
+    Profile the requests of superusers sent with an `X-Profile: 1` header or
+    a `profile=1` query parameter.
+
+    The response links to the speedscope profile of the request in its
+    `X-Profile-URL` header. Open it at https://www.speedscope.app. Other
+    requests running in the same worker at the same time are slowed down by
+    the sampling, and show up in the threads they share with the request.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        flag = headers.get(PROFILE_HEADER) or QueryParams(scope["query_string"]).get(
+            PROFILE_QUERY_PARAM
+        )
+        if flag not in ("1", "true") or not await run_in_threadpool(
+            is_superuser, headers.get("Authorization")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        sampler = Sampler(settings.PROFILING_INTERVAL_MS / 1000)
+
+        async def send_with_profile(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[
+                    PROFILE_URL_HEADER
+                ] = f"{settings.API_V1_STR}/utils/profiles/{profile_id}"
+            elif message["type"] == "http.response.body" and not message.get(
+                "more_body"
+            ):
+                # Save the profile before the client can follow the link
+                await run_in_threadpool(self.save, sampler, profile_id, scope)
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            sampler.stop()
+
+    @staticmethod
+    def save(sampler: Sampler, profile_id: str, scope: Scope) -> None:
+        sampler.stop()
+        path = profile_path(profile_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        name = f"{scope['method']} {scope['path']}"
+        path.write_text(json.dumps(sampler.to_speedscope(name)))
@@ -0,0 +1,201 @@
+import datetime
+import logging
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from sqlalchemy import Engine, event
+from sqlalchemy.engine import ExceptionContext
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Statements safe to run again under EXPLAIN ANALYZE (in a read only transaction)
+EXPLAINABLE = ("SELECT", "WITH")
+
+_current_scope: ContextVar[Scope | None] = ContextVar(
+    "current_request_scope", default=None
+)
+
+
+@dataclass
+class SlowQuery:
+    statement: str
+    parameters: Any
+    route: str | None
+    duration_ms: float
+    executed_at: datetime.datetime
+    plan: str | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def value_shape(value: Any) -> str:
+    """
+    Describe a bound value without its content, e.g. `int` or `list[3]`.
+    """
+    if isinstance(value, list | tuple | str | bytes):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def parameter_shapes(parameters: Any, executemany: bool) -> Any:
+    if executemany:
+        rows = list(parameters)
+        return {
+            "rows": len(rows),
+            "row": parameter_shapes(rows[0], False) if rows else None,
+        }
+    if isinstance(parameters, dict):
+        return {name: value_shape(value) for name, value in parameters.items()}
+    if isinstance(parameters, list | tuple):
+        return [value_shape(value) for value in parameters]
+    return None
+
+
+def current_route() -> str | None:
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    # The router stores the matched route in the scope
+    route = scope.get("route")
+    return getattr(route, "path", scope["path"])
+
+
+class SlowQueryLog:
+    """
+    Keep the last `size` statements that ran for more than `threshold_ms`, and
+    the EXPLAIN ANALYZE output of a sample of them.
+
+    The plans are captured in a background thread, on a separate connection,
+    by running the statement again in a read only transaction that is rolled
+    back. Only SELECT statements are explained.
+    """
+
+    def __init__(
+        self, *, threshold_ms: float, explain_sample_rate: float, size: int
+    ) -> None:
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.queries: deque[SlowQuery] = deque(maxlen=size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="slow-query-explain"
+        )
+
+    def install(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    def uninstall(self, engine: Engine) -> None:
+        event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.remove(engine, "handle_error", self._handle_error)
+
+    def recent(self) -> list[SlowQuery]:
+        """
+        The logged statements, latest first.
+        """
+        # Copy first, statements are logged concurrently by other threads
+        return list(reversed(self.queries.copy()))
+
+    def wait(self) -> None:
+        """
+        Wait for the pending EXPLAIN ANALYZE captures.
+        """
+        self._executor.submit(lambda: None).result()
+
+    def _before_cursor_execute(
+        self,
+        conn: Any,
+        cursor: Any,  # noqa: ARG002
+        statement: str,  # noqa: ARG002
+        parameters: Any,  # noqa: ARG002
+        context: Any,  # noqa: ARG002
+        executemany: bool,  # noqa: ARG002
+    ) -> None:
+        conn.info.setdefault("slow_query_start_time", []).append(time.perf_counter())
+
+    def _after_cursor_execute(
+        self,
+        conn: Any,
+        cursor: Any,  # noqa: ARG002
+        statement: str,
+        parameters: Any,
+        context: Any,  # noqa: ARG002
+        executemany: bool,
+    ) -> None:
+        start = conn.info["slow_query_start_time"].pop()
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms < self.threshold_ms or conn.get_execution_options().get(
+            "skip_slow_query_log"
+        ):
+            return
+        query = SlowQuery(
+            statement=statement,
+            parameters=parameter_shapes(parameters, executemany),
+            route=current_route(),
+            duration_ms=round(duration_ms, 3),
+            executed_at=datetime.datetime.now(datetime.timezone.utc),
+        )
+        self.queries.append(query)
+        logger.warning(
+            f"Slow query ({query.duration_ms:.1f}ms, route {query.route}): "
+            f"{statement}"
+        )
+        if (
+            not executemany
+            and statement.lstrip().upper().startswith(EXPLAINABLE)
+            and random.random() < self.explain_sample_rate
+        ):
+            self._executor.submit(
+                self._explain, conn.engine, query, statement, parameters
+            )
+
+    def _handle_error(self, context: ExceptionContext) -> None:
+        # The statement failed, after_cursor_execute won't pop its start time
+        if context.connection is None or context.execution_context is None:
+            return
+        start_times = context.connection.info.get("slow_query_start_time")
+        if start_times:
+            start_times.pop()
+
+    def _explain(
+        self, engine: Engine, query: SlowQuery, statement: str, parameters: Any
+    ) -> None:
+        try:
+            with engine.connect().execution_options(skip_slow_query_log=True) as conn:
+                conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+                conn.exec_driver_sql("SET LOCAL statement_timeout = '30s'")
+                result = conn.exec_driver_sql(
+                    f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters or None
+                )
+                query.plan = "\n".join(row[0] for row in result)
+                conn.rollback()
+        except Exception:
+            logger.exception("Could not explain slow query")
+
+
+class SlowQueryMiddleware:
+    """
+    Make the request available to the slow query log, to report the route
+    that ran each slow statement.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_scope.reset(token)
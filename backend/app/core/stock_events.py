@@ -0,0 +1,174 @@
+"""
+Push stream of the stock changes.
+
+The mutation routes publish a compact event per changed (location, item) pair
+with `pg_notify`, in their own transaction: Postgres delivers the events on
+commit only, to every listening connection. Each worker keeps one connection
+listening to the channel, and fans the events out to the clients subscribed
+to the stores and warehouses concerned, each with a bounded queue.
+"""
+
+import asyncio
+import json
+import logging
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Literal
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from sqlmodel import Session, text
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "stock_changes"
+
+Location = Literal["store", "warehouse"]
+
+
+@dataclass(frozen=True)
+class StockChange:
+    location: Location
+    location_id: int
+    item_id: int
+    quantity: int
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, payload: str) -> "StockChange":
+        return cls(**json.loads(payload))
+
+
+def notify_stock_changes(session: Session, changes: list[StockChange]) -> None:
+    """
+    Publish `changes` when the transaction of `session` commits, with one
+    statement whatever their number.
+    """
+    if not changes:
+        return
+    session.execute(
+        text("SELECT pg_notify(:channel, p) FROM unnest(CAST(:payloads AS text[])) p"),
+        {"channel": CHANNEL, "payloads": [change.to_json() for change in changes]},
+    )
+
+
+@dataclass(eq=False)
+class Subscription:
+    # Both empty to receive the changes of every location
+    store_ids: frozenset[int]
+    warehouse_ids: frozenset[int]
+    queue: asyncio.Queue[StockChange | None] = field(repr=False)
+
+    def matches(self, change: StockChange) -> bool:
+        if not self.store_ids and not self.warehouse_ids:
+            return True
+        location_ids = (
+            self.store_ids if change.location == "store" else self.warehouse_ids
+        )
+        return change.location_id in location_ids
+
+    async def get(self, timeout: float | None = None) -> StockChange | None:
+        """
+        The next change, None once the subscription is dropped.
+
+        Raises `asyncio.TimeoutError` if there is no change within `timeout` seconds.
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class StockEventBroker:
+    """
+    Fan-out of the stock changes to the subscriptions of a worker.
+
+    A subscriber that doesn't keep up and fills its queue is dropped, rather
+    than holding up the others or growing the memory of the worker.
+    """
+
+    def __init__(self, queue_size: int = 1000) -> None:
+        self.queue_size = queue_size
+        self.subscriptions: set[Subscription] = set()
+        # Set while the channel is listened to
+        self.listening = asyncio.Event()
+
+    @contextmanager
+    def subscribe(
+        self,
+        store_ids: list[int] | None = None,
+        warehouse_ids: list[int] | None = None,
+    ) -> Iterator[Subscription]:
+        subscription = Subscription(
+            store_ids=frozenset(store_ids or ()),
+            warehouse_ids=frozenset(warehouse_ids or ()),
+            queue=asyncio.Queue(self.queue_size),
+        )
+        self.subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, change: StockChange) -> None:
+        for subscription in list(self.subscriptions):
+            if not subscription.matches(change):
+                continue
+            try:
+                subscription.queue.put_nowait(change)
+            except asyncio.QueueFull:
+                self.drop(subscription)
+
+    def drop(self, subscription: Subscription) -> None:
+        """
+        End the stream of `subscription`, making room for the end marker.
+        """
+        self.subscriptions.discard(subscription)
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+    def close(self) -> None:
+        for subscription in list(self.subscriptions):
+            self.drop(subscription)
+
+    async def listen(self, conninfo: str, *, retry_delay: float = 1) -> None:
+        """
+        Publish the notifications of the channel until cancelled, connecting
+        again if the connection is lost. The changes committed while
+        disconnected are missed.
+        """
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    conninfo, autocommit=True
+                ) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    self.listening.set()
+                    async for notify in conn.notifies():
+                        try:
+                            self.publish(StockChange.from_json(notify.payload))
+                        except (ValueError, TypeError):
+                            logger.warning(f"Invalid stock change {notify.payload!r}")
+            except Exception:
+                # Whatever the error, the worker would stop publishing for good
+                logger.exception("Stock events listener failed, reconnecting")
+            finally:
+                self.listening.clear()
+            await asyncio.sleep(retry_delay)
+
+
+def listener_conninfo() -> str:
+    return make_conninfo(
+        host=settings.POSTGRES_SERVER,
+        port=settings.POSTGRES_PORT,
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD,
+        dbname=settings.POSTGRES_DB,
+        application_name="stock-events",
+    )
+
+
+broker = StockEventBroker(settings.STOCK_EVENTS_QUEUE_SIZE)
@@ -0,0 +1,108 @@
+import datetime
+import logging
+import time
+from collections.abc import Callable
+from typing import Any
+
+from fastapi import FastAPI, HTTPException
+from sqlalchemy import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import configure_mappers
+from sqlmodel import Session, select, text
+
+from app.api.pagination import encode_cursor
+from app.api.routes import stores, warehouses
+from app.models import Item, Store, StoreItem, User, Warehouse, WarehouseItem
+
+logger = logging.getLogger(__name__)
+
+# Primary key lookups run by the inventory routes and the authentication
+HOT_LOOKUPS: list[tuple[type, int | tuple[int, int]]] = [
+    (User, 0),
+    (Item, 0),
+    (Store, 0),
+    (Warehouse, 0),
+    (StoreItem, (0, 0)),
+    (WarehouseItem, (0, 0)),
+]
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Aggregates and stock listings of the inventory routes, run as by the routes
+HOT_ROUTES: list[tuple[Callable[..., Any], dict[str, Any]]] = [
+    (stores.get_units_per_store_item, {}),
+    (warehouses.get_units_per_warehouse_item, {}),
+    # An empty period, no purchase partition to read
+    (stores.get_store_revenue, {"start": EPOCH, "end": EPOCH}),
+    (stores.read_store_stock, {"id": 0, "limit": 100, "cursor": None}),
+    (stores.read_store_stock, {"id": 0, "limit": 100, "cursor": encode_cursor([0])}),
+    (warehouses.read_warehouse_stock, {"id": 0, "limit": 100, "cursor": None}),
+    (
+        warehouses.read_warehouse_stock,
+        {"id": 0, "limit": 100, "cursor": encode_cursor([0])},
+    ),
+]
+
+
+def open_connections(engine: Engine, count: int) -> None:
+    """
+    Open `count` connections of the pool, so that the first requests don't
+    pay for the connection and authentication to the database.
+    """
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def compile_hot_statements(engine: Engine) -> None:
+    """
+    Run the statements of the hot paths once, with keys that match no row, so
+    that they are compiled and stored in the statement cache of the engine.
+    """
+    with Session(engine) as session:
+        for model, key in HOT_LOOKUPS:
+            session.get(model, key)
+        # Stock locked by the mutations
+        for model in (StoreItem, WarehouseItem):
+            session.get(model, (0, 0), with_for_update=True)
+        session.exec(
+            select(StoreItem)
+            .where(StoreItem.store_id == 0, StoreItem.item_id == 0)
+            .with_for_update()
+        ).first()
+        session.exec(select(User).where(User.email == "")).first()
+        session.rollback()
+    for route, params in HOT_ROUTES:
+        run_cancelled(engine, route, params)
+
+
+def run_cancelled(
+    engine: Engine, route: Callable[..., Any], params: dict[str, Any]
+) -> None:
+    """
+    Run the statements of `route` in a transaction where Postgres cancels
+    them as soon as they start: they are compiled and cached the same, before
+    they are sent, but the aggregates don't scan the tables of a large
+    database.
+    """
+    with Session(engine) as session:
+        session.execute(text("SET LOCAL statement_timeout = 1"))
+        try:
+            route(session, **params)
+        except (DBAPIError, HTTPException):
+            # Cancelled, or nothing found for the keys matching no row
+            pass
+        session.rollback()
+
+
+def warm_up(app: FastAPI, engine: Engine, *, connections: int) -> None:
+    start = time.perf_counter()
+    open_connections(engine, connections)
+    configure_mappers()
+    compile_hot_statements(engine)
+    app.openapi()
+    logger.info(f"Warmed up in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,247 @@
+"""
+Group commit of the purchases.
+
+Each purchase commits its own transaction, so under load the purchases are
+bound by the flushes of the WAL, one per commit, rather than by the CPU.
+With `PURCHASE_GROUP_COMMIT` enabled, the concurrent purchases of a worker
+are grouped into batches instead: the first purchase of a batch waits up to
+`PURCHASE_GROUP_COMMIT_WINDOW_MS` for others to join, or until there are
+`PURCHASE_GROUP_COMMIT_MAX_SIZE` of them, then runs them all in a single
+transaction, with one statement to lock the stock, one to update it and one
+to insert the purchases, whatever the size of the batch.
+
+The purchases of a batch are served in the order they joined it, and each
+one gets its own outcome: a purchase finding not enough stock fails alone.
+Sharded items aren't batched, they are handed back to be purchased one at
+a time (see `app.stock_shards`), as are requests with an `Idempotency-Key`.
+
+The purchases waiting for their batch block a thread of the threadpool
+running the sync endpoints: a batch is capped well below its size, so that
+the other requests still get threads. They don't hold a database connection,
+the route only opens a session for the purchases handed back, and the first
+purchase of a batch runs it in a session of its own. A batch is also capped
+at half the connection pool, for the purchases it hands back at once.
+"""
+
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any
+
+from fastapi import HTTPException
+from sqlalchemy import Engine, QueuePool
+from sqlmodel import Session, text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.metrics import PURCHASE_BATCH_SIZE, UNITS_SOLD
+from app.core.stock_events import StockChange, notify_stock_changes
+
+# Threads of the threadpool running the sync endpoints, the default of anyio
+THREADPOOL_SIZE = 40
+# At most this share of them wait in a batch
+MAX_BATCH_SIZE = THREADPOOL_SIZE // 2
+
+# Lock the stock of the items of the batch, in a fixed order so that
+# concurrent batches can't deadlock
+LOCK_STOCK = text(
+    "SELECT s.store_id, s.item_id, s.quantity, s.version, "
+    "EXISTS (SELECT FROM storeitemshard AS h "
+    "WHERE h.store_id = s.store_id AND h.item_id = s.item_id) AS sharded "
+    "FROM storeitem AS s "
+    "JOIN unnest(CAST(:store_ids AS int[]), CAST(:item_ids AS int[])) "
+    "AS p(store_id, item_id) ON s.store_id = p.store_id AND s.item_id = p.item_id "
+    "ORDER BY s.store_id, s.item_id FOR UPDATE OF s"
+)
+# Increment the versions like the ORM, for optimistic concurrency
+TAKE_STOCK = text(
+    "UPDATE storeitem AS s "
+    "SET quantity = s.quantity - u.quantity, version = s.version + 1 "
+    "FROM unnest(CAST(:store_ids AS int[]), CAST(:item_ids AS int[]), "
+    "CAST(:quantities AS int[])) AS u(store_id, item_id, quantity) "
+    "WHERE s.store_id = u.store_id AND s.item_id = u.item_id"
+)
+INSERT_PURCHASES = text(
+    "INSERT INTO purchase (store_id, item_id, quantity) "
+    "SELECT * FROM unnest(CAST(:store_ids AS int[]), CAST(:item_ids AS int[]), "
+    "CAST(:quantities AS int[]))"
+)
+
+
+def pool_capacity(engine: Engine) -> int | None:
+    """
+    Connections the pool of `engine` opens at most, None if unbounded.
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return None
+    return pool.size() + pool._max_overflow
+
+
+@dataclass
+class PendingPurchase:
+    store_id: int
+    item_id: int
+    quantity: int
+    # The new stock of the item, None if it is sharded, or the HTTP error
+    outcome: "Future[dict[str, Any] | None]" = field(default_factory=Future)
+
+
+@dataclass
+class Batch:
+    purchases: list[PendingPurchase] = field(default_factory=list)
+    full: threading.Event = field(default_factory=threading.Event)
+
+
+def purchase_batch(
+    session: Session, purchases: list[PendingPurchase]
+) -> list[dict[str, Any] | HTTPException | None]:
+    """
+    Apply the purchases that there is enough stock for, in order, without
+    committing. Returns the outcome of each purchase.
+    """
+    pairs = sorted({(purchase.store_id, purchase.item_id) for purchase in purchases})
+    rows = session.execute(
+        LOCK_STOCK,
+        {
+            "store_ids": [store_id for store_id, _ in pairs],
+            "item_ids": [item_id for _, item_id in pairs],
+        },
+    ).all()
+    stock = {(row.store_id, row.item_id): row for row in rows}
+    left = {pair: row.quantity for pair, row in stock.items()}
+    store_ids: set[int] = set()
+    if len(stock) != len(pairs):
+        # Only to tell the missing stores from the missing items
+        store_ids = set(
+            session.execute(
+                text("SELECT id FROM store WHERE id = ANY(:store_ids)"),
+                {"store_ids": sorted({store_id for store_id, _ in pairs})},
+            ).scalars()
+        )
+
+    outcomes: list[dict[str, Any] | HTTPException | None] = []
+    sold: dict[tuple[int, int], int] = defaultdict(int)
+    for purchase in purchases:
+        pair = (purchase.store_id, purchase.item_id)
+        row = stock.get(pair)
+        if row is None:
+            missing = "Item not found in store"
+            if purchase.store_id not in store_ids:
+                missing = "Store not found"
+            outcomes.append(HTTPException(status_code=404, detail=missing))
+        elif row.sharded:
+            outcomes.append(None)
+        elif left[pair] < purchase.quantity:
+            outcomes.append(
+                HTTPException(status_code=400, detail="Not enough items in stock")
+            )
+        else:
+            left[pair] -= purchase.quantity
+            sold[pair] += purchase.quantity
+            outcomes.append(
+                {
+                    "store_id": purchase.store_id,
+                    "item_id": purchase.item_id,
+                    "quantity": left[pair],
+                    "version": row.version + 1,
+                }
+            )
+
+    if sold:
+        session.execute(
+            TAKE_STOCK,
+            {
+                "store_ids": [store_id for store_id, _ in sold],
+                "item_ids": [item_id for _, item_id in sold],
+                "quantities": list(sold.values()),
+            },
+        )
+        accepted = [
+            purchase
+            for purchase, outcome in zip(purchases, outcomes, strict=False)
+            if isinstance(outcome, dict)
+        ]
+        session.execute(
+            INSERT_PURCHASES,
+            {
+                "store_ids": [purchase.store_id for purchase in accepted],
+                "item_ids": [purchase.item_id for purchase in accepted],
+                "quantities": [purchase.quantity for purchase in accepted],
+            },
+        )
+        notify_stock_changes(
+            session, [StockChange("store", *pair, left[pair]) for pair in sold]
+        )
+    return outcomes
+
+
+class PurchaseBatcher:
+    """
+    Groups the purchases of concurrent threads into batches. The first
+    purchase of each batch runs it in a session of its own, while the next
+    batch fills up: the others wait without a session.
+    """
+
+    def __init__(self, engine: Engine, *, window: float, max_size: int) -> None:
+        self.engine = engine
+        self.window = window
+        self.max_size = min(max_size, MAX_BATCH_SIZE)
+        capacity = pool_capacity(engine)
+        if capacity is not None:
+            self.max_size = max(1, min(self.max_size, capacity // 2))
+        self.lock = threading.Lock()
+        self.open_batch: Batch | None = None
+
+    def purchase(
+        self, store_id: int, item_id: int, quantity: int
+    ) -> dict[str, Any] | None:
+        """
+        Purchase `quantity` units of an item in a store, within a batch.
+        Returns the new stock of the item, or None if it is sharded and has
+        to be purchased on its own, raises an HTTPException if it failed.
+        """
+        purchase = PendingPurchase(store_id, item_id, quantity)
+        with self.lock:
+            batch = self.open_batch
+            leader = batch is None
+            if batch is None:
+                batch = self.open_batch = Batch()
+            batch.purchases.append(purchase)
+            if len(batch.purchases) >= self.max_size:
+                self.open_batch = None
+                batch.full.set()
+        if leader:
+            batch.full.wait(self.window)
+            with self.lock:
+                if self.open_batch is batch:
+                    self.open_batch = None
+            self.run(batch.purchases)
+        return purchase.outcome.result()
+
+    def run(self, purchases: list[PendingPurchase]) -> None:
+        PURCHASE_BATCH_SIZE.observe(len(purchases))
+        try:
+            with Session(self.engine) as session:
+                outcomes = purchase_batch(session, purchases)
+                session.commit()
+        except Exception as exc:
+            # The whole batch rolled back, e.g. lost connection
+            for purchase in purchases:
+                purchase.outcome.set_exception(exc)
+            return
+        for purchase, outcome in zip(purchases, outcomes, strict=False):
+            if isinstance(outcome, HTTPException):
+                purchase.outcome.set_exception(outcome)
+            else:
+                if outcome is not None:
+                    UNITS_SOLD.inc(purchase.quantity)
+                purchase.outcome.set_result(outcome)
+
+
+purchase_batcher = PurchaseBatcher(
+    engine,
+    window=settings.PURCHASE_GROUP_COMMIT_WINDOW_MS / 1000,
+    max_size=settings.PURCHASE_GROUP_COMMIT_MAX_SIZE,
+)
@@ -1,10 +1,23 @@
-import sentry_sdk
-from fastapi import FastAPI
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
+from sqlalchemy.orm.exc import StaleDataError
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
 from app.core.config import settings
+from app.core.db import engine
+from app.core.metrics import MetricsMiddleware, metrics
+from app.core.profiling import ProfilingMiddleware
+from app.core.query_stats import QueryStatsMiddleware
+from app.core.slow_queries import SlowQueryMiddleware
+from app.core.stock_events import broker, listener_conninfo
+from app.core.warmup import warm_up
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -12,14 +25,50 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 
 
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
+    # Only imported when enabled, it takes a large share of the startup time
+    import sentry_sdk
+
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Uvicorn serves no request, not even the health check, until this is done
+    await run_in_threadpool(
+        warm_up, app, engine, connections=settings.WARM_UP_CONNECTIONS
+    )
+    # One connection per worker listens to the stock changes for all its clients
+    listener = None
+    if settings.STOCK_EVENTS_ENABLED:
+        listener = asyncio.create_task(broker.listen(listener_conninfo()))
+    yield
+    broker.close()
+    if listener:
+        listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await listener
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
+
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(
+    request: Request,  # noqa: ARG001
+    exc: StaleDataError,  # noqa: ARG001
+) -> JSONResponse:
+    # A versioned row was updated by another request since it was read, the
+    # request can be retried
+    return JSONResponse(
+        status_code=409, content={"detail": "Concurrent update, please retry"}
+    )
+
+
 # Set all CORS enabled origins
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
@@ -32,4 +81,17 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+if settings.QUERY_STATS_HEADERS:
+    app.add_middleware(QueryStatsMiddleware)
+
+if settings.SLOW_QUERY_THRESHOLD_MS is not None:
+    app.add_middleware(SlowQueryMiddleware)
+
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    app.add_route("/metrics", metrics, include_in_schema=False)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
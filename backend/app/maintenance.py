@@ -0,0 +1,48 @@
+import datetime
+import logging
+
+from sqlmodel import Session
+
+from app.abc_classification import ClassificationParams, classify_items
+from app.core.config import settings
+from app.core.db import engine
+from app.core.idempotency import purge_idempotency_keys
+from app.core.partitions import (
+    add_months,
+    create_purchase_partitions,
+    drop_purchase_partitions,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def maintain_purchase_partitions(session: Session) -> None:
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    created = create_purchase_partitions(
+        session, start=today, months=settings.PURCHASE_PARTITIONS_AHEAD
+    )
+    logger.info(f"Created purchase partitions: {created}")
+    if settings.PURCHASE_RETENTION_MONTHS is not None:
+        dropped = drop_purchase_partitions(
+            session, before=add_months(today, -settings.PURCHASE_RETENTION_MONTHS)
+        )
+        logger.info(f"Dropped purchase partitions: {dropped}")
+
+
+def main() -> None:
+    # Meant to run periodically, see app.scheduler
+    logger.info("Running maintenance")
+    with Session(engine) as session:
+        maintain_purchase_partitions(session)
+        purged = purge_idempotency_keys(session)
+        logger.info(f"Purged expired idempotency keys: {purged}")
+        classified = classify_items(
+            session, ClassificationParams(lookback_days=settings.ABC_LOOKBACK_DAYS)
+        )
+        logger.info(f"Classified items: {classified} rows")
+    logger.info("Maintenance finished")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,21 @@
 import datetime
+from typing import Any
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    ForeignKeyConstraint,
+    Index,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import declared_attr
 from sqlmodel import Field, Relationship, SQLModel
 
+from app.core.config import settings
+
 
 # Shared properties
 # TODO replace email str with EmailStr when sqlmodel supports it
@@ -90,24 +105,132 @@ purchase - records a customer buying x units of y items from a store
 """
 
 
+# Relationships are loaded lazily, unless auditing for N+1 queries: then any
+# lazy load raises, and the query has to load what it needs up front
+LAZY_LOADING = "raise" if settings.SQLALCHEMY_LAZY_RAISE else "select"
+
+
 # Link Models
 class WarehouseItem(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            "ix_warehouseitem_item_id_warehouse_id",
+            "item_id",
+            "warehouse_id",
+            postgresql_include=["quantity"],
+        ),
+    )
+
     warehouse_id: int | None = Field(
         default=None, foreign_key="warehouse.id", primary_key=True
     )
     item_id: int | None = Field(default=None, foreign_key="item.id", primary_key=True)
     quantity: int = Field(default=0)
-    warehouse: "Warehouse" = Relationship(back_populates="item_links")
-    item: "Item" = Relationship(back_populates="warehouse_links")
+    # Incremented by every update, see __mapper_args__
+    version: int = Field(default=1, sa_column_kwargs={"server_default": text("1")})
+    warehouse: "Warehouse" = Relationship(
+        back_populates="item_links", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
+    item: "Item" = Relationship(
+        back_populates="warehouse_links", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
+
+    # Updates through the ORM check that the version is the one that was read,
+    # and raise StaleDataError otherwise. Set-based updates increment it too
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict[str, Any]:
+        return {"version_id_col": cls.__table__.c.version}  # type: ignore[attr-defined]
 
 
 class StoreItem(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            "ix_storeitem_item_id_store_id",
+            "item_id",
+            "store_id",
+            postgresql_include=["quantity"],
+        ),
+    )
+
     store_id: int | None = Field(default=None, foreign_key="store.id", primary_key=True)
     item_id: int | None = Field(default=None, foreign_key="item.id", primary_key=True)
     quantity: int = Field(default=0)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": text("1")})
+
+    store: "Store" = Relationship(
+        back_populates="item_links", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
+    item: "Item" = Relationship(
+        back_populates="store_links", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
+
+    # Versioned like WarehouseItem
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict[str, Any]:
+        return {"version_id_col": cls.__table__.c.version}  # type: ignore[attr-defined]
+
+
+# Properties to receive on stock update
+class StockUpdate(SQLModel):
+    quantity: int = Field(ge=0)
 
-    store: "Store" = Relationship(back_populates="item_links")
-    item: "Item" = Relationship(back_populates="store_links")
+
+# Stock of an item in a store or a warehouse, with the item
+class StockLine(SQLModel):
+    item_id: int
+    title: str
+    wholesale_price: float
+    retail_price: float
+    quantity: int
+
+
+class LocationStock(SQLModel):
+    data: list[StockLine]
+    next_cursor: str | None = None
+
+
+# Stock of an item in a store or a warehouse, with the location
+class LocationQuantity(SQLModel):
+    id: int
+    name: str
+    quantity: int
+
+
+class ItemAvailability(SQLModel):
+    item_id: int
+    quantity: int
+    stores: list[LocationQuantity]
+    warehouses: list[LocationQuantity]
+
+
+class ItemsAvailability(SQLModel):
+    data: list[ItemAvailability]
+    # Requested ids that don't exist
+    missing: list[int]
+
+
+# Slots of the stock of a hot (store, item) pair, see app.stock_shards
+class StoreItemShard(SQLModel, table=True):
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["store_id", "item_id"],
+            ["storeitem.store_id", "storeitem.item_id"],
+            ondelete="CASCADE",
+        ),
+    )
+
+    store_id: int = Field(primary_key=True)
+    item_id: int = Field(primary_key=True)
+    slot: int = Field(primary_key=True)
+    quantity: int = Field(default=0)
+
+
+class StockShards(SQLModel):
+    store_id: int
+    item_id: int
+    # Total stock, in the store item row and in the slots
+    quantity: int
+    slots: list[int]
 
 
 # ** ITEMS **
@@ -129,13 +252,40 @@ class ItemUpdate(ItemBase):
 
 # Database model, database table inferred from class name
 class Item(ItemBase, table=True):
+    __table_args__ = (
+        # Typo tolerant matching of the titles, for /items/search
+        Index(
+            "ix_item_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        # Full-text (prefix) matching, the queries must use the same expression
+        Index(
+            "ix_item_title_tsv",
+            text("to_tsvector('simple', title)"),
+            postgresql_using="gin",
+        ),
+        # Sorts of /items/, by key then id for the keyset pagination. Titles
+        # in the "C" collation, for the prefixes to be ranges
+        Index("ix_item_title_id", text('title COLLATE "C"'), "id"),
+        Index("ix_item_retail_price_id", "retail_price", "id"),
+        Index("ix_item_wholesale_price_id", "wholesale_price", "id"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     title: str
     wholesale_price: float = Field(default=0.0)
     retail_price: float = Field(default=0.0)
-    warehouse_links: list["WarehouseItem"] = Relationship(back_populates="item")
-    store_links: list["StoreItem"] = Relationship(back_populates="item")
-    purchases: list["Purchase"] = Relationship(back_populates="item")
+    warehouse_links: list["WarehouseItem"] = Relationship(
+        back_populates="item", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
+    store_links: list["StoreItem"] = Relationship(
+        back_populates="item", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
+    purchases: list["Purchase"] = Relationship(
+        back_populates="item", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
 
 
 class ItemPublic(ItemBase):
@@ -145,6 +295,28 @@ class ItemPublic(ItemBase):
 class ItemsPublic(SQLModel):
     data: list[Item]
     count: int
+    # Pass it back as `cursor` for the next page, None on the last page
+    next_cursor: str | None = None
+
+
+class ItemsBatch(SQLModel):
+    data: list[Item]
+    # Requested ids that don't exist
+    missing: list[int]
+
+
+class ItemSearchResult(SQLModel):
+    id: int
+    title: str
+    wholesale_price: float
+    retail_price: float
+    rank: float
+
+
+class ItemSearchResults(SQLModel):
+    data: list[ItemSearchResult]
+    # Pass it back as `cursor` for the next page, None on the last page
+    next_cursor: str | None
 
 
 # ** WAREHOUSES **
@@ -153,9 +325,14 @@ class WarehouseBase(SQLModel):
 
 
 class Warehouse(WarehouseBase, table=True):
+    # Sort by name of /warehouses/, like the titles of the items
+    __table_args__ = (Index("ix_warehouse_name_id", text('name COLLATE "C"'), "id"),)
+
     id: int | None = Field(default=None, primary_key=True)
     name: str
-    item_links: list["WarehouseItem"] = Relationship(back_populates="warehouse")
+    item_links: list["WarehouseItem"] = Relationship(
+        back_populates="warehouse", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
 
 
 class WarehousePublic(WarehouseBase):
@@ -167,6 +344,12 @@ class WarehousePublic(WarehouseBase):
 class WarehousesPublic(SQLModel):
     data: list[Warehouse]
     count: int
+    next_cursor: str | None = None
+
+
+class WarehousesBatch(SQLModel):
+    data: list[WarehousePublic]
+    missing: list[int]
 
 
 # ** STORES **
@@ -175,10 +358,17 @@ class StoreBase(SQLModel):
 
 
 class Store(StoreBase, table=True):
+    # Sort by name of /stores/, like the titles of the items
+    __table_args__ = (Index("ix_store_name_id", text('name COLLATE "C"'), "id"),)
+
     id: int | None = Field(default=None, primary_key=True)
     name: str
-    item_links: list["StoreItem"] = Relationship(back_populates="store")
-    purchases: list["Purchase"] = Relationship(back_populates="store")
+    item_links: list["StoreItem"] = Relationship(
+        back_populates="store", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
+    purchases: list["Purchase"] = Relationship(
+        back_populates="store", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
 
 
 class StorePublic(StoreBase):
@@ -190,18 +380,60 @@ class StorePublic(StoreBase):
 class StoresPublic(SQLModel):
     data: list[Store]
     count: int
+    next_cursor: str | None = None
+
+
+class StoresBatch(SQLModel):
+    data: list[Store]
+    missing: list[int]
 
 
 # ** PURCHASES **
+def transaction_id_column() -> Column[int]:
+    """
+    Id of the transaction that inserted the row, so that app.turnover can
+    read each row once, after its commit. Not mapped, so that the ORM leaves
+    it to its default.
+    """
+    return Column("txid", BigInteger, server_default=func.txid_current())
+
+
 class Purchase(SQLModel, table=True):
-    id: int | None = Field(default=None, primary_key=True)
+    __table_args__ = (
+        transaction_id_column(),
+        Index(
+            "ix_purchase_store_id_item_id",
+            "store_id",
+            "item_id",
+            postgresql_include=["quantity"],
+        ),
+        Index("ix_purchase_item_id", "item_id"),
+        Index("ix_purchase_created_at", "created_at", postgresql_using="brin"),
+        Index("ix_purchase_txid", "txid", postgresql_using="brin"),
+        # Monthly partitions are managed by app.core.partitions
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {"exclude_properties": ["txid"]}
+
+    # The partition key has to be part of the primary key
+    id: int | None = Field(
+        default=None, primary_key=True, sa_column_kwargs={"autoincrement": True}
+    )
+    created_at: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(datetime.timezone.utc),
+        primary_key=True,
+        sa_type=DateTime(timezone=True),  # type: ignore
+        sa_column_kwargs={"server_default": func.now()},
+    )
     store_id: int = Field(default=None, foreign_key="store.id")
-    store: Store = Relationship(back_populates="purchases")
+    store: Store = Relationship(
+        back_populates="purchases", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
     item_id: int = Field(default=None, foreign_key="item.id")
-    item: Item = Relationship(back_populates="purchases")
+    item: Item = Relationship(
+        back_populates="purchases", sa_relationship_kwargs={"lazy": LAZY_LOADING}
+    )
     quantity: int
-    # created_at: datetime = Field(default=datetime)
-    # updated_at: datetime = Field(default=datetime.now())
 
 
 class PurchasePublic(SQLModel):
@@ -209,10 +441,197 @@ class PurchasePublic(SQLModel):
     store_id: int
     item_id: int
     quantity: int
-    # created_at: datetime
-    # updated_at: datetime
+    created_at: datetime.datetime
 
 
 class PurchasesPublic(SQLModel):
     data: list[PurchasePublic]
     count: int
+
+
+# ** ABC CLASSIFICATION **
+# Rank and class of an item by revenue and by units sold, in a store or
+# network-wide, computed by app.abc_classification
+class ItemClassification(SQLModel, table=True):
+    __table_args__ = (
+        # Top-N of a store, or of the network (NULL store), in rank order
+        Index(
+            "ix_itemclassification_store_id_revenue_rank", "store_id", "revenue_rank"
+        ),
+        Index("ix_itemclassification_store_id_units_rank", "store_id", "units_rank"),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    # No foreign keys, each run replaces the rows of deleted stores and items.
+    # None for the whole network
+    store_id: int | None = None
+    item_id: int
+    units: int
+    revenue: float
+    revenue_rank: int
+    revenue_class: str = Field(max_length=1)
+    units_rank: int
+    units_class: str = Field(max_length=1)
+    # The purchases ranked, made in [period_start, period_end)
+    period_start: datetime.datetime = Field(sa_type=DateTime(timezone=True))  # type: ignore
+    period_end: datetime.datetime = Field(sa_type=DateTime(timezone=True))  # type: ignore
+
+
+class ItemClassificationPublic(SQLModel):
+    item_id: int
+    title: str
+    units: int
+    revenue: float
+    revenue_rank: int
+    revenue_class: str
+    units_rank: int
+    units_class: str
+
+
+class ItemClassificationsPublic(SQLModel):
+    data: list[ItemClassificationPublic]
+    # Period of the last run, None if it never ran
+    period_start: datetime.datetime | None = None
+    period_end: datetime.datetime | None = None
+    next_cursor: str | None = None
+
+
+# ** STOCK TURNOVER **
+# Ledger of the stock received, shipped and counted, each row in the
+# transaction of the change, see app.turnover. The purchases are the sales
+class StockMovement(SQLModel, table=True):
+    __table_args__ = (
+        transaction_id_column(),
+        # Dropped past the history of the report
+        Index("ix_stockmovement_created_at", "created_at", postgresql_using="brin"),
+        # Read by ranges of transactions by the refreshes of the report
+        Index("ix_stockmovement_txid", "txid", postgresql_using="brin"),
+    )
+    __mapper_args__ = {"exclude_properties": ["txid"]}
+
+    id: int | None = Field(default=None, primary_key=True)
+    created_at: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(datetime.timezone.utc),
+        sa_type=DateTime(timezone=True),  # type: ignore
+        sa_column_kwargs={"server_default": func.now()},
+    )
+    # "store" or "warehouse"
+    location: str = Field(max_length=9)
+    location_id: int
+    item_id: int
+    # Positive for units in, negative for units out
+    quantity: int
+    # "receipt", "shipment" or "count", the difference with the counted stock
+    reason: str = Field(max_length=8)
+
+
+# Units in and out of a location per item and per day (UTC), maintained by
+# app.turnover
+class StockTurnover(SQLModel, table=True):
+    __table_args__ = (
+        # Days past the history are dropped by each refresh
+        Index("ix_stockturnover_day", "day"),
+    )
+
+    location: str = Field(max_length=9, primary_key=True)
+    location_id: int = Field(primary_key=True)
+    item_id: int = Field(primary_key=True)
+    day: datetime.date = Field(primary_key=True)
+    units_in: int = 0
+    # Sold from a store, shipped from a warehouse
+    units_out: int = 0
+    # Net of the counts
+    adjusted: int = 0
+
+
+# How far the sales and movements were added to a report
+class ReportWatermark(SQLModel, table=True):
+    name: str = Field(primary_key=True, max_length=64)
+    # Time of the last refresh
+    processed_until: datetime.datetime = Field(sa_type=DateTime(timezone=True))  # type: ignore
+    # The rows of the transactions before this one were added, None until the
+    # first refresh
+    processed_xid: int | None = Field(default=None, sa_type=BigInteger)
+
+
+class TurnoverLine(SQLModel):
+    item_id: int
+    # On hand now
+    quantity: int
+    units_in: int
+    units_out: int
+    adjusted: int
+    # Mean of the stock at the start of the window and now
+    average_quantity: float
+    # Units out over the average stock, None without stock
+    turnover: float | None
+    # Days the stock lasts at the rate of the window, None without sales
+    days_of_supply: float | None
+
+
+class TurnoverReport(SQLModel):
+    data: list[TurnoverLine]
+    # First day of the window, and the time of the last refresh, None if the
+    # report was never refreshed
+    start_day: datetime.date
+    processed_until: datetime.datetime | None
+    next_cursor: str | None = None
+
+
+# ** SHIPMENTS **
+class ShipmentDemand(SQLModel):
+    store_id: int
+    item_id: int
+    quantity: int = Field(gt=0)
+
+
+class ShippingCost(SQLModel):
+    warehouse_id: int
+    store_id: int
+    # Cost of shipping a unit, lanes without a cost cost 1
+    cost: float = Field(ge=0)
+
+
+# The plan is solved in the request: at most this many demand lines, and
+# lane costs, e.g. 10 warehouses to 10,000 stores
+MAX_SHIPMENT_DEMAND = 10_000
+MAX_SHIPPING_COSTS = 100_000
+
+
+class ShipmentRequest(SQLModel):
+    demand: list[ShipmentDemand] = Field(max_length=MAX_SHIPMENT_DEMAND)
+    costs: list[ShippingCost] = Field(default=[], max_length=MAX_SHIPPING_COSTS)
+
+
+class ShipmentLine(SQLModel):
+    warehouse_id: int
+    store_id: int
+    item_id: int
+    quantity: int
+
+
+class ShipmentPlan(SQLModel):
+    lines: list[ShipmentLine]
+    # Demand left over once the warehouses are out of stock
+    unfulfilled: list[ShipmentDemand]
+    total_cost: float
+
+
+# ** IDEMPOTENCY KEYS **
+class IdempotencyKey(SQLModel, table=True):
+    __table_args__ = (
+        # Expired keys are purged by app.maintenance
+        Index("ix_idempotencykey_created_at", "created_at"),
+    )
+
+    key: str = Field(primary_key=True, max_length=255)
+    # Hash of the request the key was first used for
+    request_hash: str = Field(max_length=64)
+    # Response of the request, stored in the transaction of its changes
+    status_code: int | None = None
+    response: Any = Field(default=None, sa_type=JSONB)
+    created_at: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(datetime.timezone.utc),
+        sa_type=DateTime(timezone=True),  # type: ignore
+        sa_column_kwargs={"server_default": func.now()},
+    )
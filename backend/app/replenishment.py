@@ -0,0 +1,216 @@
+"""
+Replenishment suggestions: how many units of each item to ship to each store.
+
+The stock levels and the recent sales of every (store, item) pair are loaded
+into NumPy arrays with binary COPY, and the suggestions are computed for all
+the pairs at once with array operations, so that millions of pairs take
+seconds instead of hours with a loop in Python.
+"""
+
+import datetime
+from dataclasses import dataclass
+from typing import Any, cast
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import Connection
+
+from app.core.pgcopy import copy_binary_out
+
+
+@dataclass
+class ReplenishmentParams:
+    # Sales velocity is the average daily sales over this period
+    lookback_days: int = 28
+    # Stores with less stock than this many days of sales are replenished...
+    reorder_point_days: float = 7
+    # ...up to this many days of sales
+    target_days: float = 14
+
+
+@dataclass
+class StockLevels:
+    # One entry per (store, item) pair
+    store_ids: npt.NDArray[np.int32]
+    item_ids: npt.NDArray[np.int32]
+    quantities: npt.NDArray[np.int32]
+    # Units sold over the lookback period
+    sold: npt.NDArray[np.int64]
+    # Units available in all the warehouses, per item, sorted by item id
+    warehouse_item_ids: npt.NDArray[np.int32]
+    warehouse_quantities: npt.NDArray[np.int64]
+
+
+@dataclass
+class Suggestions:
+    store_ids: npt.NDArray[np.int32]
+    item_ids: npt.NDArray[np.int32]
+    quantities: npt.NDArray[np.int32]
+    daily_sales: npt.NDArray[np.float64]
+    days_of_cover: npt.NDArray[np.float64]
+    reorder_quantities: npt.NDArray[np.int64]
+
+    def to_dicts(self) -> list[dict[str, Any]]:
+        names = [
+            "store_id",
+            "item_id",
+            "quantity",
+            "daily_sales",
+            "days_of_cover",
+            "reorder_quantity",
+        ]
+        columns = [
+            self.store_ids.tolist(),
+            self.item_ids.tolist(),
+            self.quantities.tolist(),
+            np.round(self.daily_sales, 3).tolist(),
+            # Infinite cover (no sales) is not valid JSON
+            [
+                None if np.isinf(cover) else round(cover, 1)
+                for cover in self.days_of_cover
+            ],
+            self.reorder_quantities.tolist(),
+        ]
+        return [
+            dict(zip(names, row, strict=True)) for row in zip(*columns, strict=True)
+        ]
+
+
+def pair_keys(
+    store_ids: npt.NDArray[np.int32], item_ids: npt.NDArray[np.int32]
+) -> npt.NDArray[np.int64]:
+    return (store_ids.astype(np.int64) << 32) | item_ids.astype(np.int64)
+
+
+def index_of(
+    keys: npt.NDArray[np.integer[Any]], queries: npt.NDArray[np.integer[Any]]
+) -> npt.NDArray[np.intp]:
+    """
+    The index of each of `queries` in `keys`, sorted and unique, or
+    `len(keys)` for the queries not in `keys`.
+    """
+    if not len(keys):
+        return np.zeros(len(queries), dtype=np.int64)
+    positions = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+    return np.where(keys[positions] == queries, positions, len(keys))
+
+
+def lookup(
+    keys: npt.NDArray[np.int64],
+    values: npt.NDArray[np.int64],
+    queries: npt.NDArray[np.int64],
+) -> npt.NDArray[np.int64]:
+    """
+    The values of `queries` in the `keys` -> `values` mapping, 0 for the
+    queries not in `keys`.
+    """
+    return cast(npt.NDArray[np.int64], np.append(values, 0)[index_of(keys, queries)])
+
+
+def load_stock_levels(conn: Connection, *, lookback_days: int) -> StockLevels:
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        days=lookback_days
+    )
+    store_ids, item_ids, quantities = copy_binary_out(
+        conn,
+        # With the stock in the slots of the sharded pairs
+        "SELECT s.store_id, s.item_id, coalesce(s.quantity, 0) "
+        "+ coalesce(h.quantity, 0)::int FROM storeitem s LEFT JOIN ("
+        "SELECT store_id, item_id, sum(quantity) AS quantity FROM storeitemshard "
+        "GROUP BY store_id, item_id) h USING (store_id, item_id)",
+        [">i4", ">i4", ">i4"],
+    )
+    sold_store_ids, sold_item_ids, sold_quantities = copy_binary_out(
+        conn,
+        "SELECT store_id, item_id, sum(quantity)::int8 FROM purchase "
+        "WHERE created_at >= %s GROUP BY store_id, item_id "
+        "ORDER BY store_id, item_id",
+        [">i4", ">i4", ">i8"],
+        (since,),
+    )
+    warehouse_item_ids, warehouse_quantities = copy_binary_out(
+        conn,
+        "SELECT item_id, sum(quantity)::int8 FROM warehouseitem "
+        "GROUP BY item_id ORDER BY item_id",
+        [">i4", ">i8"],
+    )
+    # Sorted by (store, item), so pair keys are sorted
+    sold = lookup(
+        pair_keys(sold_store_ids, sold_item_ids),
+        sold_quantities,
+        pair_keys(store_ids, item_ids),
+    )
+    return StockLevels(
+        store_ids=store_ids,
+        item_ids=item_ids,
+        quantities=quantities,
+        sold=sold,
+        warehouse_item_ids=warehouse_item_ids,
+        warehouse_quantities=warehouse_quantities,
+    )
+
+
+def suggest(levels: StockLevels, params: ReplenishmentParams) -> Suggestions:
+    """
+    Suggest to ship enough units to the stores that will run out within
+    `reorder_point_days` to cover `target_days` of sales. When the warehouses
+    don't hold enough units of an item for all the stores, they are shared in
+    proportion to the needs of the stores.
+    """
+    quantities = levels.quantities.astype(np.float64)
+    daily_sales = levels.sold / params.lookback_days
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(daily_sales > 0, quantities / daily_sales, np.inf)
+    needs = np.where(
+        days_of_cover < params.reorder_point_days,
+        np.maximum(np.ceil(daily_sales * params.target_days) - quantities, 0),
+        0,
+    )
+
+    # Index of each pair's item in the warehouse stock, the items out of stock
+    # in every warehouse share an extra slot with nothing available
+    n_items = len(levels.warehouse_item_ids)
+    positions = index_of(levels.warehouse_item_ids, levels.item_ids)
+    available = np.append(levels.warehouse_quantities.astype(np.float64), 0)[positions]
+    total_needs = np.bincount(positions, weights=needs, minlength=n_items + 1)[
+        positions
+    ]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        reorder_quantities = np.where(
+            total_needs > available,
+            np.floor(needs * available / total_needs),
+            needs,
+        ).astype(np.int64)
+
+    return Suggestions(
+        store_ids=levels.store_ids,
+        item_ids=levels.item_ids,
+        quantities=levels.quantities,
+        daily_sales=daily_sales,
+        days_of_cover=days_of_cover,
+        reorder_quantities=reorder_quantities,
+    )
+
+
+def most_urgent(
+    suggestions: Suggestions, *, limit: int, store_id: int | None = None
+) -> Suggestions:
+    """
+    The suggestions with something to ship, the lowest days of cover first.
+    """
+    selected = suggestions.reorder_quantities > 0
+    if store_id is not None:
+        selected &= suggestions.store_ids == store_id
+    (indices,) = np.nonzero(selected)
+    if len(indices) > limit:
+        lowest = np.argpartition(suggestions.days_of_cover[indices], limit - 1)
+        indices = indices[lowest[:limit]]
+    indices = indices[np.argsort(suggestions.days_of_cover[indices], kind="stable")]
+    return Suggestions(
+        store_ids=suggestions.store_ids[indices],
+        item_ids=suggestions.item_ids[indices],
+        quantities=suggestions.quantities[indices],
+        daily_sales=suggestions.daily_sales[indices],
+        days_of_cover=suggestions.days_of_cover[indices],
+        reorder_quantities=suggestions.reorder_quantities[indices],
+    )
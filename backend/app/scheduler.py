@@ -0,0 +1,56 @@
+"""
+Runs the periodic jobs, in the `scheduler` service of docker-compose.yml: the
+turnover refresh every `TURNOVER_REFRESH_INTERVAL_SECONDS`, the maintenance
+every `MAINTENANCE_INTERVAL_HOURS`, both on start.
+
+Without it, run `python -m app.turnover` and `python -m app.maintenance` from
+cron instead, one instance of each: the refreshes are serialized anyway.
+"""
+
+import logging
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from app import maintenance, turnover
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    name: str
+    run: Callable[[], None]
+    interval: float
+    next_run: float = 0
+
+
+def run_due(jobs: list[Job], now: float) -> None:
+    for job in jobs:
+        if job.next_run > now:
+            continue
+        # The next run is due an interval after this one starts, a failed one
+        # is retried then too
+        job.next_run = now + job.interval
+        try:
+            job.run()
+        except Exception:
+            logger.exception(f"Job {job.name} failed")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    jobs = [
+        Job("turnover", turnover.main, settings.TURNOVER_REFRESH_INTERVAL_SECONDS),
+        Job(
+            "maintenance", maintenance.main, settings.MAINTENANCE_INTERVAL_HOURS * 3600
+        ),
+    ]
+    while True:
+        run_due(jobs, time.monotonic())
+        time.sleep(max(0, min(job.next_run for job in jobs) - time.monotonic()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Batch shipments from the warehouses to the stores.
+
+The demand of the stores is allocated to the stock of the warehouses at the
+least cost, then the whole plan is applied in one transaction, with
+one statement to take the stock out of the warehouses and one to put it in
+the stores, whatever the number of lines. Their new quantities are returned
+by the same statements, for the stock change events. The plan is solved
+from the stock as read, unlocked: the stock it takes is locked and checked
+again only to apply it.
+"""
+
+import heapq
+import math
+from collections import defaultdict
+from collections.abc import Callable
+
+from fastapi import HTTPException
+from sqlmodel import Session, text
+
+from app.core.stock_events import StockChange, notify_stock_changes
+from app.models import (
+    ShipmentDemand,
+    ShipmentLine,
+    ShipmentPlan,
+    ShippingCost,
+)
+from app.tests.utils.http_exceptions import raise404
+from app.turnover import Movement, record_movements
+
+DEFAULT_COST = 1.0
+# Tolerance on the costs of the paths
+EPSILON = 1e-9
+
+
+def merge_demand(demand: list[ShipmentDemand]) -> dict[tuple[int, int], int]:
+    """
+    Total quantity per (store, item).
+    """
+    merged: dict[tuple[int, int], int] = defaultdict(int)
+    for line in demand:
+        merged[(line.store_id, line.item_id)] += line.quantity
+    return merged
+
+
+def cheapest(
+    heap: list[tuple[float, int]], valid: Callable[[int], bool]
+) -> tuple[float, int] | None:
+    """
+    First (cost, store) entry of `heap` still valid. The entries turned
+    invalid stay in the heap until they come first, then are dropped.
+    """
+    while heap and not valid(heap[0][1]):
+        heapq.heappop(heap)
+    return heap[0] if heap else None
+
+
+def min_cost_flow(
+    supply: dict[int, int],
+    demand: dict[int, int],
+    cost: Callable[[int, int], float],
+) -> dict[tuple[int, int], int]:
+    """
+    Units to ship on each (warehouse, store) lane so that as much of `demand`
+    as `supply` allows is met, at the least total cost: the transportation
+    problem of one item, as a min-cost flow from a source through the
+    warehouses and the stores to a sink.
+
+    Solved exactly with successive shortest paths, each round shipping the
+    most units along the cheapest path in the residual graph. There are few
+    warehouses but many stores, so the paths are searched between the
+    warehouses only: a path starts at a warehouse with stock left, hops
+    through stores from one warehouse to another, the next one no longer
+    shipping units to the store that the previous one now ships instead,
+    and ends at a store with demand left. The cheapest store of each hop is
+    kept in a heap, and Dijkstra finds the path, on costs made nonnegative
+    by the distances of the previous round: a round costs the square of the
+    warehouses, whatever the number of stores.
+    """
+    warehouses = sorted(
+        warehouse_id for warehouse_id, units in supply.items() if units > 0
+    )
+    stores = sorted(demand)
+    costs = {
+        warehouse_id: {store_id: cost(warehouse_id, store_id) for store_id in stores}
+        for warehouse_id in warehouses
+    }
+    left = {warehouse_id: supply[warehouse_id] for warehouse_id in warehouses}
+    needed = dict(demand)
+    shipped: dict[int, dict[int, int]] = {
+        warehouse_id: {} for warehouse_id in warehouses
+    }
+    # The stores with demand left, cheapest first, for each warehouse
+    to_stores = {
+        warehouse_id: [(costs[warehouse_id][store_id], store_id) for store_id in stores]
+        for warehouse_id in warehouses
+    }
+    for heap in to_stores.values():
+        heapq.heapify(heap)
+    # The stores `head` ships to, cheapest first for `tail` to ship to
+    # instead: it costs the difference, and the first valid one of each pair
+    # is the hop from `tail` to `head`
+    takeovers: dict[tuple[int, int], list[tuple[float, int]]] = {
+        (tail, head): [] for tail in warehouses for head in warehouses if tail != head
+    }
+    hops: dict[int, dict[int, tuple[float, int]]] = {
+        warehouse_id: {} for warehouse_id in warehouses
+    }
+    # Distances of the previous round
+    potential = {warehouse_id: 0.0 for warehouse_id in warehouses}
+
+    def ship_on(warehouse_id: int, store_id: int, units: int) -> None:
+        if not shipped[warehouse_id].get(store_id):
+            for tail in warehouses:
+                if tail != warehouse_id:
+                    heapq.heappush(
+                        takeovers[(tail, warehouse_id)],
+                        (
+                            costs[tail][store_id] - costs[warehouse_id][store_id],
+                            store_id,
+                        ),
+                    )
+        shipped[warehouse_id][store_id] = shipped[warehouse_id].get(store_id, 0) + units
+
+    def update_hops(head: int) -> None:
+        for tail in warehouses:
+            if tail != head:
+                hop = cheapest(
+                    takeovers[(tail, head)],
+                    lambda store_id: shipped[head].get(store_id, 0) > 0,
+                )
+                if hop is None:
+                    hops[tail].pop(head, None)
+                else:
+                    hops[tail][head] = hop
+
+    while True:
+        # Dijkstra from the warehouses with stock left, on the costs reduced
+        # by the potentials: the hops of `tail` to `head` cost at least the
+        # difference of their distances in the previous round
+        distance = {
+            warehouse_id: -potential[warehouse_id] if left[warehouse_id] else math.inf
+            for warehouse_id in warehouses
+        }
+        # Previous warehouse and store of the cheapest path to each warehouse
+        parent: dict[int, tuple[int, int]] = {}
+        unvisited = set(warehouses)
+        while unvisited:
+            tail = min(unvisited, key=distance.__getitem__)
+            if distance[tail] == math.inf:
+                break
+            unvisited.remove(tail)
+            for head, (hop_cost, store_id) in hops[tail].items():
+                reduced = distance[tail] + hop_cost + potential[tail] - potential[head]
+                # Against float rounding: only strictly cheaper paths
+                if head in unvisited and reduced < distance[head] - EPSILON:
+                    distance[head] = reduced
+                    parent[head] = (tail, store_id)
+        for warehouse_id in warehouses:
+            if distance[warehouse_id] < math.inf:
+                distance[warehouse_id] += potential[warehouse_id]
+                potential[warehouse_id] = distance[warehouse_id]
+
+        # The cheapest path ends with the cheapest store with demand left
+        best: tuple[float, int, int] | None = None
+        for warehouse_id, heap in to_stores.items():
+            final = cheapest(heap, lambda store_id: needed[store_id] > 0)
+            if final is not None and distance[warehouse_id] < math.inf:
+                total = distance[warehouse_id] + final[0]
+                if best is None or total < best[0] - EPSILON:
+                    best = (total, warehouse_id, final[1])
+        if best is None:
+            break
+
+        _, last, store_id = best
+        # The hops of the path, from its last warehouse back to the first
+        path: list[tuple[int, int, int]] = []
+        first = last
+        while first in parent:
+            tail, via = parent[first]
+            path.append((tail, via, first))
+            first = tail
+        units = min(
+            [left[first], needed[store_id]]
+            + [shipped[head][via] for _, via, head in path]
+        )
+        left[first] -= units
+        for tail, via, head in path:
+            ship_on(tail, via, units)
+            shipped[head][via] -= units
+        ship_on(last, store_id, units)
+        needed[store_id] -= units
+        for head in {last} | {
+            warehouse_id for step in path for warehouse_id in step[::2]
+        }:
+            update_hops(head)
+
+    return {
+        (warehouse_id, store_id): units
+        for warehouse_id, lanes in shipped.items()
+        for store_id, units in lanes.items()
+        if units > 0
+    }
+
+
+def plan_shipments(
+    demand: list[ShipmentDemand],
+    stock: dict[int, dict[int, int]],
+    costs: list[ShippingCost],
+) -> ShipmentPlan:
+    """
+    Allocate the demand to the stock of the warehouses, `stock` being the
+    quantity per warehouse of each item: for each item, as much of the demand
+    as its stock allows, at the least cost (see `min_cost_flow`).
+    """
+    lane_costs = {(cost.warehouse_id, cost.store_id): cost.cost for cost in costs}
+
+    def lane_cost(warehouse_id: int, store_id: int) -> float:
+        return lane_costs.get((warehouse_id, store_id), DEFAULT_COST)
+
+    stores_by_item: dict[int, dict[int, int]] = defaultdict(dict)
+    for (store_id, item_id), quantity in merge_demand(demand).items():
+        stores_by_item[item_id][store_id] = quantity
+
+    lines: list[ShipmentLine] = []
+    unfulfilled: list[ShipmentDemand] = []
+    total_cost = 0.0
+    for item_id, needs in sorted(stores_by_item.items()):
+        available = {
+            warehouse_id: quantity
+            for warehouse_id, quantity in stock.get(item_id, {}).items()
+            if quantity > 0
+        }
+        shipped = min_cost_flow(available, needs, lane_cost)
+        for (warehouse_id, store_id), quantity in sorted(shipped.items()):
+            needs[store_id] -= quantity
+            total_cost += lane_cost(warehouse_id, store_id) * quantity
+            lines.append(
+                ShipmentLine(
+                    warehouse_id=warehouse_id,
+                    store_id=store_id,
+                    item_id=item_id,
+                    quantity=quantity,
+                )
+            )
+        unfulfilled.extend(
+            ShipmentDemand(store_id=store_id, item_id=item_id, quantity=quantity)
+            for store_id, quantity in sorted(needs.items())
+            if quantity > 0
+        )
+    return ShipmentPlan(lines=lines, unfulfilled=unfulfilled, total_cost=total_cost)
+
+
+def read_warehouse_stock(
+    session: Session, item_ids: list[int]
+) -> dict[int, dict[int, int]]:
+    """
+    The stock of the warehouses for `item_ids`, without locking it.
+    """
+    rows = session.execute(
+        text(
+            "SELECT warehouse_id, item_id, quantity FROM warehouseitem "
+            "WHERE item_id = ANY(:item_ids) AND quantity > 0"
+        ),
+        {"item_ids": item_ids},
+    )
+    stock: dict[int, dict[int, int]] = defaultdict(dict)
+    for warehouse_id, item_id, quantity in rows:
+        stock[item_id][warehouse_id] = quantity
+    return stock
+
+
+def apply_plan(session: Session, plan: ShipmentPlan) -> None:
+    """
+    Move the stock of the plan from the warehouses to the stores, without
+    committing.
+    """
+    if not plan.lines:
+        return
+    # A warehouse can ship an item to several stores, and a store receive an
+    # item from several warehouses: each row is changed once per statement
+    taken: dict[tuple[int, int], int] = defaultdict(int)
+    received: dict[tuple[int, int], int] = defaultdict(int)
+    for line in plan.lines:
+        taken[(line.warehouse_id, line.item_id)] += line.quantity
+        received[(line.store_id, line.item_id)] += line.quantity
+
+    params = {
+        "warehouse_ids": [warehouse_id for warehouse_id, _ in taken],
+        "item_ids": [item_id for _, item_id in taken],
+        "quantities": list(taken.values()),
+    }
+    # The plan is made without locks: lock its rows of stock, in a consistent
+    # order to avoid deadlocks between batches, then check there is still
+    # enough of it
+    session.execute(
+        text(
+            "SELECT 1 FROM warehouseitem AS w "
+            "JOIN unnest(CAST(:warehouse_ids AS int[]), CAST(:item_ids AS int[])) "
+            "AS s(warehouse_id, item_id) "
+            "ON w.warehouse_id = s.warehouse_id AND w.item_id = s.item_id "
+            "ORDER BY w.warehouse_id, w.item_id FOR UPDATE OF w"
+        ),
+        params,
+    )
+    warehouse_rows = session.execute(
+        text(
+            # Increment the versions like the ORM, for optimistic concurrency
+            "UPDATE warehouseitem AS w "
+            "SET quantity = w.quantity - s.quantity, version = w.version + 1 "
+            "FROM unnest(CAST(:warehouse_ids AS int[]), CAST(:item_ids AS int[]), "
+            "CAST(:quantities AS int[])) AS s(warehouse_id, item_id, quantity) "
+            "WHERE w.warehouse_id = s.warehouse_id AND w.item_id = s.item_id "
+            "AND w.quantity >= s.quantity "
+            "RETURNING w.warehouse_id, w.item_id, w.quantity"
+        ),
+        params,
+    ).all()
+    if len(warehouse_rows) != len(taken):
+        # The stock was taken since planning
+        session.rollback()
+        raise HTTPException(
+            status_code=409, detail="Warehouse stock changed, plan again"
+        )
+
+    store_rows = session.execute(
+        text(
+            "INSERT INTO storeitem (store_id, item_id, quantity) "
+            "SELECT * FROM unnest(CAST(:store_ids AS int[]), "
+            "CAST(:item_ids AS int[]), CAST(:quantities AS int[])) "
+            "ON CONFLICT (store_id, item_id) "
+            "DO UPDATE SET quantity = storeitem.quantity + excluded.quantity, "
+            "version = storeitem.version + 1 "
+            "RETURNING store_id, item_id, quantity"
+        ),
+        {
+            "store_ids": [store_id for store_id, _ in received],
+            "item_ids": [item_id for _, item_id in received],
+            "quantities": list(received.values()),
+        },
+    ).all()
+    notify_stock_changes(
+        session,
+        [StockChange("warehouse", *row) for row in warehouse_rows]
+        + [StockChange("store", *row) for row in store_rows],
+    )
+    record_movements(
+        session,
+        [
+            Movement("warehouse", warehouse_id, item_id, -quantity, "shipment")
+            for (warehouse_id, item_id), quantity in taken.items()
+        ]
+        + [
+            Movement("store", store_id, item_id, quantity, "shipment")
+            for (store_id, item_id), quantity in received.items()
+        ],
+    )
+
+
+def ship(
+    session: Session,
+    demand: list[ShipmentDemand],
+    costs: list[ShippingCost],
+    *,
+    dry_run: bool = False,
+) -> ShipmentPlan:
+    """
+    Plan the shipments for `demand`, and unless `dry_run`, apply the plan,
+    without locking the stock while solving it: receipts and shipments of
+    the items go on meanwhile.
+    """
+    store_ids = sorted({line.store_id for line in demand})
+    found = session.execute(
+        text("SELECT count(*) FROM store WHERE id = ANY(:store_ids)"),
+        {"store_ids": store_ids},
+    ).scalar_one()
+    if found != len(store_ids):
+        raise raise404("store")
+    item_ids = sorted({line.item_id for line in demand})
+    stock = read_warehouse_stock(session, item_ids)
+    plan = plan_shipments(demand, stock, costs)
+    if dry_run:
+        session.rollback()
+    else:
+        apply_plan(session, plan)
+        session.commit()
+    return plan
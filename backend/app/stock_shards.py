@@ -0,0 +1,158 @@
+"""
+Sharded stock counters for hot (store, item) pairs.
+
+Every purchase of an item in a store updates its `storeitem` row, so the
+purchases of a flash-sale item queue up on the lock of that row, each until
+the commit of the one before. Once sharded, the stock of the pair is split
+over N slot rows, and each purchase takes its units from a random slot with
+enough stock that isn't locked by another purchase, or if they are all
+locked, waits for one of them: up to N purchases of the item commit in
+parallel.
+
+The stock of a sharded pair is the quantity of its `storeitem` row, which
+receives the shipments, plus the quantities of its slots. A purchase that
+finds no slot with enough units falls back to locking the row and all the
+slots, and takes from them in turn.
+"""
+
+from fastapi import HTTPException
+from sqlalchemy import Subquery
+from sqlmodel import Session, col, func, select, text
+
+from app.models import StockShards, StoreItem, StoreItemShard
+
+# One statement, whatever the outcome: take from a random slot with enough
+# stock, and tell if the pair is sharded and the quantity in its slots before
+# the update
+TAKE_FROM_SLOT = (
+    "WITH picked AS ("
+    "  SELECT slot FROM storeitemshard "
+    "  WHERE store_id = :store_id AND item_id = :item_id AND quantity >= :quantity "
+    "  ORDER BY random() LIMIT 1 FOR UPDATE {lock_wait}"
+    "), taken AS ("
+    "  UPDATE storeitemshard AS s SET quantity = s.quantity - :quantity "
+    "  FROM picked WHERE s.store_id = :store_id AND s.item_id = :item_id "
+    "  AND s.slot = picked.slot RETURNING s.slot"
+    ") "
+    "SELECT EXISTS (SELECT FROM taken) AS taken, count(*) AS slots, "
+    "coalesce(sum(quantity), 0) AS quantity "
+    "FROM storeitemshard WHERE store_id = :store_id AND item_id = :item_id"
+)
+# Only from the slots not locked by other purchases
+TAKE_FROM_FREE_SLOT = text(TAKE_FROM_SLOT.format(lock_wait="SKIP LOCKED"))
+# Waiting for the one picked to be free
+TAKE_FROM_BUSY_SLOT = text(TAKE_FROM_SLOT.format(lock_wait=""))
+
+
+def shard_totals() -> Subquery:
+    """
+    Quantity in the slots of each sharded pair, to add to the quantity of
+    its `storeitem` row.
+    """
+    return (
+        select(
+            StoreItemShard.store_id,
+            StoreItemShard.item_id,
+            func.sum(StoreItemShard.quantity).label("quantity"),
+        )
+        .group_by(col(StoreItemShard.store_id), col(StoreItemShard.item_id))
+        .subquery()
+    )
+
+
+def sharded_quantity(session: Session, store_id: int, item_id: int) -> int | None:
+    """
+    Quantity in the slots of a pair, None if it isn't sharded.
+    """
+    return session.exec(
+        select(func.sum(StoreItemShard.quantity)).where(
+            StoreItemShard.store_id == store_id, StoreItemShard.item_id == item_id
+        )
+    ).one()
+
+
+def lock_shards(
+    session: Session, store_id: int, item_id: int
+) -> tuple[StoreItem, list[StoreItemShard]]:
+    """
+    Lock the `storeitem` row of a pair, then its slots.
+    """
+    store_item = session.get(StoreItem, (store_id, item_id), with_for_update=True)
+    if not store_item:
+        raise HTTPException(status_code=404, detail="Item not found in store")
+    slots = session.exec(
+        select(StoreItemShard)
+        .where(StoreItemShard.store_id == store_id, StoreItemShard.item_id == item_id)
+        .order_by(StoreItemShard.slot)  # type: ignore
+        .with_for_update()
+    ).all()
+    return store_item, list(slots)
+
+
+def take_store_stock(
+    session: Session, store_id: int, item_id: int, quantity: int
+) -> tuple[StoreItem, int]:
+    """
+    Take `quantity` units of the stock of an item in a store, without
+    committing. Returns the `storeitem` row and the stock left.
+    """
+    params = {"store_id": store_id, "item_id": item_id, "quantity": quantity}
+    taken, slots, in_slots = session.execute(TAKE_FROM_FREE_SLOT, params).one()
+    if not taken and slots:
+        # All busy, queue up on one of them rather than on all of them
+        taken, slots, in_slots = session.execute(TAKE_FROM_BUSY_SLOT, params).one()
+    if taken:
+        # The row isn't locked, it only changes with shipments
+        store_item = session.get(StoreItem, (store_id, item_id))
+        assert store_item
+        return store_item, store_item.quantity + in_slots - quantity
+
+    if slots:
+        store_item, shards = lock_shards(session, store_id, item_id)
+    else:
+        # Not sharded: the row alone, locked so that concurrent purchases
+        # queue up instead of failing the version check of the update
+        store_item = session.exec(
+            select(StoreItem)
+            .where(StoreItem.store_id == store_id, StoreItem.item_id == item_id)
+            .with_for_update()
+        ).first()
+        if not store_item:
+            raise HTTPException(status_code=404, detail="Item not found in store")
+        shards = []
+    available = store_item.quantity + sum(shard.quantity for shard in shards)
+    if available < quantity:
+        raise HTTPException(status_code=400, detail="Not enough items in stock")
+    remaining = quantity
+    stocks: list[StoreItem | StoreItemShard] = [store_item, *shards]
+    for stock in stocks:
+        units = min(stock.quantity, remaining)
+        if units:
+            stock.quantity -= units
+            remaining -= units
+            session.add(stock)
+    return store_item, available - quantity
+
+
+def reshard(session: Session, store_id: int, item_id: int, count: int) -> StockShards:
+    """
+    Spread the stock of a pair evenly over `count` slots, or put it all back
+    in its `storeitem` row if `count` is 0, without committing.
+    """
+    store_item, shards = lock_shards(session, store_id, item_id)
+    total = store_item.quantity + sum(shard.quantity for shard in shards)
+    quantities = [total // count + (slot < total % count) for slot in range(count)]
+    by_slot = {shard.slot: shard for shard in shards}
+    for slot, units in enumerate(quantities):
+        shard = by_slot.pop(slot, None) or StoreItemShard(
+            store_id=store_id, item_id=item_id, slot=slot
+        )
+        shard.quantity = units
+        session.add(shard)
+    for shard in by_slot.values():
+        session.delete(shard)
+    store_item.quantity = total - sum(quantities)
+    session.add(store_item)
+    return StockShards(
+        store_id=store_id, item_id=item_id, quantity=total, slots=quantities
+    )
@@ -1,8 +1,15 @@
 from fastapi.testclient import TestClient
 from sqlmodel import Session
 
+from app.abc_classification import classify_items
 from app.core.config import settings
+from app.core.db import engine
+from app.models import Item, Purchase
+from app.stock_shards import reshard
+from app.tests.utils.inventory import seed_inventory
 from app.tests.utils.item import create_random_item
+from app.tests.utils.query_plan import assert_max_queries, capture_statements
+from app.tests.utils.utils import random_lower_string
 
 
 def test_create_item(
@@ -160,3 +167,283 @@ def test_delete_item_not_enough_permissions(
     assert response.status_code == 400
     content = response.json()
     assert content["detail"] == "Not enough permissions"
+
+
+def test_search_items(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    brand = random_lower_string()
+    titles = [f"{brand} espresso machine", f"{brand} espresso cups", f"{brand} teapot"]
+    items = [Item(title=title) for title in titles]
+    db.add_all(items)
+    db.commit()
+    url = f"{settings.API_V1_STR}/items/search"
+
+    # Prefixes of all the words first, then the titles with similar words
+    response = client.get(
+        url, headers=superuser_token_headers, params={"q": f"{brand} espr"}
+    )
+    assert response.status_code == 200
+    content = response.json()
+    # Equal ranks by id
+    assert [item["title"] for item in content["data"]] == titles
+    assert content["next_cursor"] is None
+
+    # A typo, by pages of 2
+    typo = brand[:10] + ("a" if brand[10] != "a" else "b") + brand[11:]
+    found = []
+    params: dict[str, str | int] = {"q": typo, "limit": 2}
+    for _ in range(2):
+        response = client.get(url, headers=superuser_token_headers, params=params)
+        assert response.status_code == 200
+        content = response.json()
+        found += content["data"]
+        params["cursor"] = content["next_cursor"]
+    assert params["cursor"] is None
+    assert len(found) == len(items)
+    assert {item["id"] for item in found} == {item.id for item in items}
+    ranks = [item["rank"] for item in found]
+    assert ranks == sorted(ranks, reverse=True)
+
+    response = client.get(
+        url, headers=superuser_token_headers, params={"q": brand, "cursor": "nope"}
+    )
+    assert response.status_code == 400
+
+
+def test_read_items_filtered_and_sorted(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    brand = random_lower_string()
+    items = [
+        Item(title=f"{brand} {i}", retail_price=price, wholesale_price=price / 2)
+        for i, price in enumerate([5.0, 30.0, 10.0, 20.0, 40.0])
+    ]
+    db.add_all(items)
+    db.commit()
+    params: dict[str, str | int] = {
+        "title_prefix": brand,
+        "min_retail_price": 10,
+        "max_wholesale_price": 15,
+        "sort": "retail_price",
+        "order": "desc",
+        "limit": 2,
+    }
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=superuser_token_headers,
+            params=params | ({"cursor": cursor} if cursor else {}),
+        )
+        assert response.status_code == 200
+        content = response.json()
+        assert content["count"] == 3
+        pages.append([item["retail_price"] for item in content["data"]])
+        cursor = content["next_cursor"]
+        if not cursor:
+            break
+    assert pages == [[30.0, 20.0], [10.0]]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"title_prefix": brand, "sort": "title"},
+    )
+    assert [item["title"] for item in response.json()["data"]] == sorted(
+        item.title for item in items
+    )
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"sort": "description"},
+    )
+    assert response.status_code == 422
+
+
+def test_read_items_fields(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    brand = random_lower_string()
+    db.add_all([Item(title=f"{brand} {i}", retail_price=i) for i in range(3)])
+    db.commit()
+    params: dict[str, str | int] = {
+        "title_prefix": brand,
+        "sort": "retail_price",
+        "limit": 2,
+        "fields": "id,title",
+    }
+    with capture_statements(engine) as statements:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=superuser_token_headers,
+            params=params,
+        )
+    assert response.status_code == 200
+    content = response.json()
+    assert [set(item) for item in content["data"]] == [{"id", "title"}] * 2
+    # Only the sort key is selected besides
+    assert not any("wholesale_price" in statement for statement, _ in statements)
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params=params | {"cursor": content["next_cursor"]},
+    )
+    assert [item["title"] for item in response.json()["data"]] == [f"{brand} 2"]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"fields": "id,owner_id"},
+    )
+    assert response.status_code == 422
+
+
+def test_read_items_batch(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    items = [Item(title=random_lower_string()) for _ in range(2)]
+    db.add_all(items)
+    db.commit()
+    first, second = (item.id for item in items)
+    # The user, then the items
+    with assert_max_queries(2):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/batch",
+            headers=superuser_token_headers,
+            params={"ids": [second, -1, first, second]},
+        )
+    assert response.status_code == 200
+    content = response.json()
+    assert [item["id"] for item in content["data"]] == [second, first]
+    assert content["missing"] == [-1]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        params={"ids": list(range(201))},
+    )
+    assert response.status_code == 422
+
+
+def test_read_item_availability(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    stores, warehouses, items = seed_inventory(
+        db, n_stores=2, n_warehouses=1, n_items=2, n_purchases=0
+    )
+    item_id = items[0].id
+    reshard(db, stores[0].id, item_id, 2)  # type: ignore
+    unstocked = Item(title=random_lower_string())
+    db.add(unstocked)
+    db.commit()
+    # The user, then the stock
+    with assert_max_queries(2):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/{item_id}/availability",
+            headers=superuser_token_headers,
+        )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["item_id"] == item_id
+    # Sharded stock included
+    assert content["quantity"] == 3000
+    store_ids = sorted(store.id for store in stores)  # type: ignore
+    assert [store["id"] for store in content["stores"]] == store_ids
+    assert [store["quantity"] for store in content["stores"]] == [1000, 1000]
+    assert content["warehouses"] == [
+        {"id": warehouses[0].id, "name": warehouses[0].name, "quantity": 1000}
+    ]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{unstocked.id}/availability",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "item_id": unstocked.id,
+        "quantity": 0,
+        "stores": [],
+        "warehouses": [],
+    }
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/-1/availability",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 404
+
+
+def test_read_items_availability(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    _, _, items = seed_inventory(
+        db, n_stores=2, n_warehouses=1, n_items=2, n_purchases=0
+    )
+    ids = [items[1].id, -1, items[0].id]
+    with assert_max_queries(2):
+        response = client.get(
+            f"{settings.API_V1_STR}/items/availability",
+            headers=superuser_token_headers,
+            params={"ids": ids},
+        )
+    assert response.status_code == 200
+    content = response.json()
+    assert [item["item_id"] for item in content["data"]] == [ids[0], ids[2]]
+    assert [item["quantity"] for item in content["data"]] == [3000, 3000]
+    assert [len(item["stores"]) for item in content["data"]] == [2, 2]
+    assert content["missing"] == [-1]
+
+
+def test_read_item_classification(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=3, n_purchases=0)
+    store_id = stores[0].id
+    items.sort(key=lambda item: item.id)  # type: ignore
+    for item, quantity in zip(items, [1, 3, 2], strict=True):
+        db.add(Purchase(store_id=store_id, item_id=item.id, quantity=quantity))
+    db.commit()
+    classify_items(db)
+    url = f"{settings.API_V1_STR}/items/classification"
+    # The user, then the page
+    with assert_max_queries(2):
+        response = client.get(
+            url,
+            headers=superuser_token_headers,
+            params={"store_id": store_id, "by": "units", "limit": 2},
+        )
+    assert response.status_code == 200
+    content = response.json()
+    assert [row["item_id"] for row in content["data"]] == [items[1].id, items[2].id]
+    assert [row["units_rank"] for row in content["data"]] == [1, 2]
+    assert content["data"][0]["title"] == items[1].title
+    assert content["period_start"] is not None
+
+    response = client.get(
+        url,
+        headers=superuser_token_headers,
+        params={"store_id": store_id, "by": "units", "cursor": content["next_cursor"]},
+    )
+    content = response.json()
+    assert [row["item_id"] for row in content["data"]] == [items[0].id]
+    assert content["next_cursor"] is None
+
+    response = client.get(
+        url,
+        headers=superuser_token_headers,
+        params={"store_id": store_id, "class": "A"},
+    )
+    content = response.json()
+    assert {row["revenue_class"] for row in content["data"]} == {"A"}
+
+    response = client.get(url, headers=superuser_token_headers, params={"store_id": -1})
+    assert response.json() == {
+        "data": [],
+        "period_start": None,
+        "period_end": None,
+        "next_cursor": None,
+    }
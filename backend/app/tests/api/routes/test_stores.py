@@ -0,0 +1,335 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.api.etags import VERSIONED_WRITE_ATTEMPTS, flush_versioned
+from app.api.routes import stores as stores_routes
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Store, StoreItem
+from app.stock_shards import reshard
+from app.tests.utils.inventory import seed_inventory
+from app.tests.utils.query_plan import assert_max_queries
+from app.tests.utils.utils import random_lower_string
+
+
+def test_get_units_per_store_item(client: TestClient, db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=3, n_items=4, n_purchases=0)
+    with assert_max_queries(1):
+        response = client.get(f"{settings.API_V1_STR}/stores/items/units")
+    assert response.status_code == 200
+    content = {store["store_id"]: store for store in response.json()}
+    store = content[stores[0].id]
+    assert store["name"] == stores[0].name
+    assert {row["Item"]["id"] for row in store["items"]} == {item.id for item in items}
+    row = store["items"][0]
+    assert row["total_units"] == 1000
+    assert row["total_retail_value"] == 1000 * row["Item"]["retail_price"]
+
+
+def test_get_store_revenue(client: TestClient, db: Session) -> None:
+    stores, _, _ = seed_inventory(db, n_stores=5, n_items=3, n_purchases=50)
+    with assert_max_queries(1):
+        response = client.get(f"{settings.API_V1_STR}/stores/revenue")
+    assert response.status_code == 200
+    content = {store["store_id"]: store for store in response.json()}
+    assert set(content) >= {store.id for store in stores}
+    for store in stores:
+        revenue = content[store.id]
+        assert revenue["store"] == store.name
+        assert revenue["total_profit"] == pytest.approx(
+            revenue["total_revenue"] - revenue["total_cost"]
+        )
+
+
+def test_get_store_revenue_period(client: TestClient, db: Session) -> None:
+    stores, _, _ = seed_inventory(db, n_stores=1, n_items=1, n_purchases=5)
+    response = client.get(
+        f"{settings.API_V1_STR}/stores/revenue",
+        params={"start": "1990-01-01T00:00:00Z", "end": "1990-02-01T00:00:00Z"},
+    )
+    assert response.status_code == 200
+    content = {store["store_id"]: store for store in response.json()}
+    assert content[stores[0].id]["total_revenue"] == 0.0
+
+
+def test_purchase_item(client: TestClient, db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    url = f"{settings.API_V1_STR}/stores/{stores[0].id}/items/{items[0].id}/purchase"
+    response = client.post(url, params={"quantity": 3})
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 997
+    assert int(response.headers["X-DB-Queries"]) > 0
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+
+    response = client.post(url, params={"quantity": 1000})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Not enough items in stock"
+
+
+def test_purchase_item_idempotency_key(client: TestClient, db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    url = f"{settings.API_V1_STR}/stores/{stores[0].id}/items/{items[0].id}/purchase"
+    headers = {"Idempotency-Key": random_lower_string()}
+
+    # Failed requests don't keep their key
+    response = client.post(url, params={"quantity": 1001}, headers=headers)
+    assert response.status_code == 400
+
+    response = client.post(url, params={"quantity": 3}, headers=headers)
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+    with assert_max_queries(2):
+        replayed = client.post(url, params={"quantity": 3}, headers=headers)
+    assert replayed.status_code == 200
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert replayed.json() == response.json()
+    db.expire_all()
+    assert db.get(StoreItem, (stores[0].id, items[0].id)).quantity == 997  # type: ignore
+
+    response = client.post(url, params={"quantity": 4}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_purchase_item_concurrent_retries(client: TestClient, db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    url = f"{settings.API_V1_STR}/stores/{stores[0].id}/items/{items[0].id}/purchase"
+    headers = {"Idempotency-Key": random_lower_string()}
+    with ThreadPoolExecutor(4) as executor:
+        responses = list(
+            executor.map(
+                lambda _: client.post(url, params={"quantity": 5}, headers=headers),
+                range(4),
+            )
+        )
+    assert [response.status_code for response in responses] == [200] * 4
+    assert sum("Idempotent-Replayed" in response.headers for response in responses) == 3
+    db.expire_all()
+    assert db.get(StoreItem, (stores[0].id, items[0].id)).quantity == 995  # type: ignore
+
+
+def test_update_store_item_if_match(client: TestClient, db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    url = f"{settings.API_V1_STR}/stores/{stores[0].id}/items/{items[0].id}"
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag == f'"{response.json()["version"]}"'
+
+    response = client.patch(url, json={"quantity": 42}, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 42
+    assert response.headers["ETag"] != etag
+
+    # Stale ETag
+    response = client.patch(url, json={"quantity": 41}, headers={"If-Match": etag})
+    assert response.status_code == 412
+    db.expire_all()
+    assert db.get(StoreItem, (stores[0].id, items[0].id)).quantity == 42  # type: ignore
+
+
+def test_concurrent_update_of_versioned_row(db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    key = (stores[0].id, items[0].id)
+    with Session(engine) as session, Session(engine) as other_session:
+        store_item = session.get(StoreItem, key)
+        other_store_item = other_session.get(StoreItem, key)
+        other_store_item.quantity = 10  # type: ignore
+        other_session.commit()
+
+        store_item.quantity = 20  # type: ignore
+        with pytest.raises(HTTPException) as exc_info:
+            flush_versioned(session, '"1"')
+        assert exc_info.value.status_code == 412
+
+        # Without a precondition, the write is left to be retried
+        store_item = session.get(StoreItem, key)
+        other_store_item.quantity = 15  # type: ignore
+        other_session.commit()
+        store_item.quantity = 20  # type: ignore
+        assert not flush_versioned(session, None)
+    db.expire_all()
+    assert db.get(StoreItem, key).quantity == 15  # type: ignore
+
+
+def test_update_store_item_race_without_if_match(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    key = (stores[0].id, items[0].id)
+    races: list[int] = []
+
+    def racing_flush(session: Session, if_match: str | None) -> bool:
+        # Another count lands between the read and the write
+        if races:
+            with Session(engine) as other_session:
+                other_store_item = other_session.get(StoreItem, key)
+                other_store_item.quantity = races.pop(0)  # type: ignore
+                other_session.commit()
+        return flush_versioned(session, if_match)
+
+    monkeypatch.setattr(stores_routes, "flush_versioned", racing_flush)
+    url = f"{settings.API_V1_STR}/stores/{stores[0].id}/items/{items[0].id}"
+
+    # Read and written again over the race
+    races.append(10)
+    response = client.patch(url, json={"quantity": 42})
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 42
+
+    # The same race fails a precondition
+    races.append(9)
+    response = client.patch(url, json={"quantity": 7}, headers={"If-Match": "*"})
+    assert response.status_code == 412
+
+    # Gives up if the row keeps changing
+    races.extend(range(1, VERSIONED_WRITE_ATTEMPTS + 1))
+    response = client.patch(url, json={"quantity": 7})
+    assert response.status_code == 409
+    db.expire_all()
+    assert db.get(StoreItem, key).quantity == VERSIONED_WRITE_ATTEMPTS  # type: ignore
+
+
+def test_sharded_store_item(
+    client: TestClient, db: Session, superuser_token_headers: dict[str, str]
+) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    url = f"{settings.API_V1_STR}/stores/{stores[0].id}/items/{items[0].id}"
+    response = client.put(f"{url}/shards", params={"count": 3})
+    assert response.status_code == 401
+
+    response = client.put(
+        f"{url}/shards", params={"count": 3}, headers=superuser_token_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["slots"] == [334, 333, 333]
+
+    for _ in range(10):
+        response = client.post(f"{url}/purchase", params={"quantity": 3})
+        assert response.status_code == 200
+    assert response.json()["quantity"] == 970
+    assert client.get(url).json()["quantity"] == 970
+    units = client.get(f"{settings.API_V1_STR}/stores/items/units").json()
+    (store,) = (store for store in units if store["store_id"] == stores[0].id)
+    assert store["items"][0]["total_units"] == 970
+
+    response = client.patch(url, json={"quantity": 5})
+    assert response.status_code == 409
+
+    # More than any slot holds, taken from all of them
+    response = client.post(f"{url}/purchase", params={"quantity": 971})
+    assert response.status_code == 400
+    response = client.post(f"{url}/purchase", params={"quantity": 900})
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 70
+
+    response = client.put(
+        f"{url}/shards", params={"count": 0}, headers=superuser_token_headers
+    )
+    assert response.json() == {
+        "store_id": stores[0].id,
+        "item_id": items[0].id,
+        "quantity": 70,
+        "slots": [],
+    }
+    db.expire_all()
+    assert db.get(StoreItem, (stores[0].id, items[0].id)).quantity == 70  # type: ignore
+
+
+def test_read_stores_sorted_by_name(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    prefix = random_lower_string()
+    names = [f"{prefix}-{suffix}" for suffix in ("b", "a", "c")]
+    db.add_all([Store(name=name) for name in names])
+    db.commit()
+    params: dict[str, str | int] = {
+        "name_prefix": prefix,
+        "sort": "name",
+        "order": "desc",
+        "limit": 2,
+    }
+    response = client.get(
+        f"{settings.API_V1_STR}/stores/", headers=superuser_token_headers, params=params
+    )
+    content = response.json()
+    assert content["count"] == 3
+    assert [store["name"] for store in content["data"]] == sorted(names)[:0:-1]
+    response = client.get(
+        f"{settings.API_V1_STR}/stores/",
+        headers=superuser_token_headers,
+        params=params | {"cursor": content["next_cursor"]},
+    )
+    content = response.json()
+    assert [store["name"] for store in content["data"]] == [f"{prefix}-a"]
+    assert content["next_cursor"] is None
+
+    response = client.get(
+        f"{settings.API_V1_STR}/stores/",
+        headers=superuser_token_headers,
+        params={"name_prefix": prefix, "fields": "name"},
+    )
+    assert response.json()["data"] == [{"name": name} for name in names]
+
+
+def test_read_stores_name_prefix_at_the_end_of_unicode(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    prefix = random_lower_string()
+    # No code point after U+10FFFF, and surrogates after U+D7FF
+    names = [f"{prefix}\U0010ffff", f"{prefix}\U0010ffffa", f"{prefix}\ud7ffb"]
+    db.add_all([Store(name=name) for name in names + [f"{prefix}\ue000"]])
+    db.commit()
+    for name_prefix, expected in [
+        (f"{prefix}\U0010ffff", names[:2]),
+        (f"{prefix}\ud7ff", names[2:]),
+    ]:
+        response = client.get(
+            f"{settings.API_V1_STR}/stores/",
+            headers=superuser_token_headers,
+            params={"name_prefix": name_prefix, "sort": "name"},
+        )
+        assert response.status_code == 200
+        assert [store["name"] for store in response.json()["data"]] == expected
+
+
+def test_read_stores_batch(client: TestClient, db: Session) -> None:
+    stores, _, _ = seed_inventory(db, n_stores=2, n_items=1, n_purchases=0)
+    ids = [stores[1].id, stores[0].id, -1]
+    with assert_max_queries(1):
+        response = client.get(
+            f"{settings.API_V1_STR}/stores/batch", params={"ids": ids}
+        )
+    assert response.status_code == 200
+    content = response.json()
+    assert [store["id"] for store in content["data"]] == ids[:2]
+    assert content["missing"] == [-1]
+
+
+def test_read_store_stock(client: TestClient, db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=3, n_purchases=0)
+    store_id = stores[0].id
+    reshard(db, store_id, items[1].id, 2)  # type: ignore
+    db.commit()
+    url = f"{settings.API_V1_STR}/stores/{store_id}/items"
+    with assert_max_queries(1):
+        response = client.get(url, params={"limit": 2})
+    assert response.status_code == 200
+    content = response.json()
+    item_ids = sorted(item.id for item in items)  # type: ignore
+    assert [line["item_id"] for line in content["data"]] == item_ids[:2]
+    # Sharded stock included
+    assert [line["quantity"] for line in content["data"]] == [1000, 1000]
+    line = content["data"][0]
+    assert line["title"] == next(item.title for item in items if item.id == item_ids[0])
+
+    response = client.get(url, params={"limit": 2, "cursor": content["next_cursor"]})
+    content = response.json()
+    assert [line["item_id"] for line in content["data"]] == item_ids[2:]
+    assert content["next_cursor"] is None
+
+    response = client.get(f"{settings.API_V1_STR}/stores/-1/items")
+    assert response.status_code == 404
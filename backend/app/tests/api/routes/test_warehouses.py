@@ -0,0 +1,242 @@
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app import shipments
+from app.core.config import settings
+from app.core.db import engine
+from app.models import MAX_SHIPMENT_DEMAND, ShipmentPlan, StoreItem, WarehouseItem
+from app.shipments import plan_shipments
+from app.tests.utils.inventory import (
+    create_random_stocked_item,
+    create_random_store,
+    create_random_warehouse,
+    seed_inventory,
+)
+from app.tests.utils.query_plan import assert_max_queries
+
+
+def test_get_units_per_warehouse_item(client: TestClient, db: Session) -> None:
+    _, warehouses, items = seed_inventory(
+        db, n_stores=1, n_warehouses=3, n_items=4, n_purchases=0
+    )
+    with assert_max_queries(1):
+        response = client.get(f"{settings.API_V1_STR}/warehouses/items/units")
+    assert response.status_code == 200
+    content = {warehouse["warehouse_id"]: warehouse for warehouse in response.json()}
+    warehouse = content[warehouses[0].id]
+    assert {row["Item"]["id"] for row in warehouse["items"]} == {
+        item.id for item in items
+    }
+    assert warehouse["items"][0]["total_units"] == 1000
+
+
+def test_receive_item(client: TestClient, db: Session) -> None:
+    store = create_random_store(db)
+    warehouse = create_random_warehouse(db)
+    item = create_random_stocked_item(db, store=store, warehouse=warehouse)
+    other_warehouse = create_random_warehouse(db)
+    url = f"{settings.API_V1_STR}/warehouses/{warehouse.id}/items/{item.id}"
+    # With the pg_notify of the stock change and the insert into the stock
+    # movement ledger
+    with assert_max_queries(6):
+        response = client.post(url, params={"quantity": 5})
+    assert response.status_code == 200
+    response = client.post(
+        f"{settings.API_V1_STR}/warehouses/{other_warehouse.id}/items/{item.id}",
+        params={"quantity": 5},
+    )
+    assert response.status_code == 200
+    db.expire_all()
+    assert db.get(WarehouseItem, (warehouse.id, item.id)).quantity == 105  # type: ignore
+    assert db.get(WarehouseItem, (other_warehouse.id, item.id)).quantity == 5  # type: ignore
+
+
+def test_ship_item_to_store(client: TestClient, db: Session) -> None:
+    store = create_random_store(db)
+    warehouse = create_random_warehouse(db)
+    item = create_random_stocked_item(db, store=store, warehouse=warehouse)
+    url = f"{settings.API_V1_STR}/warehouses/{warehouse.id}/items/{item.id}/stores/{store.id}"
+    # With the pg_notify of the stock change and the insert into the stock
+    # movement ledger
+    with assert_max_queries(9):
+        response = client.post(url, params={"quantity": 40})
+    assert response.status_code == 200
+    db.expire_all()
+    assert db.get(WarehouseItem, (warehouse.id, item.id)).quantity == 60  # type: ignore
+    assert db.get(StoreItem, (store.id, item.id)).quantity == 140  # type: ignore
+
+    response = client.post(url, params={"quantity": 61})
+    assert response.status_code == 400
+
+
+def test_ship_items_to_stores(client: TestClient, db: Session) -> None:
+    near, far = create_random_warehouse(db), create_random_warehouse(db)
+    store, other_store, new_store = (create_random_store(db) for _ in range(3))
+    item = create_random_stocked_item(db, store=store, warehouse=near)
+    db.add(WarehouseItem(warehouse_id=far.id, item_id=item.id, quantity=100))
+    db.commit()
+    shipment = {
+        "demand": [
+            {"store_id": store.id, "item_id": item.id, "quantity": 80},
+            {"store_id": other_store.id, "item_id": item.id, "quantity": 50},
+            {"store_id": new_store.id, "item_id": item.id, "quantity": 90},
+        ],
+        "costs": [
+            {"warehouse_id": near.id, "store_id": store.id, "cost": 1},
+            {"warehouse_id": near.id, "store_id": other_store.id, "cost": 2},
+            {"warehouse_id": near.id, "store_id": new_store.id, "cost": 4},
+            {"warehouse_id": far.id, "store_id": store.id, "cost": 5},
+            {"warehouse_id": far.id, "store_id": other_store.id, "cost": 5},
+            {"warehouse_id": far.id, "store_id": new_store.id, "cost": 3},
+        ],
+    }
+    url = f"{settings.API_V1_STR}/warehouses/shipments"
+
+    response = client.post(url, json=shipment, params={"dry_run": True})
+    assert response.status_code == 200
+    db.expire_all()
+    assert db.get(WarehouseItem, (near.id, item.id)).quantity == 100  # type: ignore
+
+    # With the lock of the planned stock, read unlocked to plan
+    with assert_max_queries(7):
+        response = client.post(url, json=shipment)
+    assert response.status_code == 200
+    plan = response.json()
+    shipped = {
+        (line["warehouse_id"], line["store_id"]): line["quantity"]
+        for line in plan["lines"]
+    }
+    assert shipped == {
+        (near.id, store.id): 80,
+        (near.id, other_store.id): 20,
+        (far.id, new_store.id): 90,
+        (far.id, other_store.id): 10,
+    }
+    assert plan["unfulfilled"] == [
+        {"store_id": other_store.id, "item_id": item.id, "quantity": 20}
+    ]
+    assert plan["total_cost"] == 80 * 1 + 20 * 2 + 90 * 3 + 10 * 5
+    db.expire_all()
+    assert db.get(WarehouseItem, (near.id, item.id)).quantity == 0  # type: ignore
+    assert db.get(WarehouseItem, (far.id, item.id)).quantity == 0  # type: ignore
+    assert db.get(StoreItem, (store.id, item.id)).quantity == 180  # type: ignore
+    assert db.get(StoreItem, (other_store.id, item.id)).quantity == 30  # type: ignore
+    assert db.get(StoreItem, (new_store.id, item.id)).quantity == 90  # type: ignore
+    # Set-based updates increment the versions too
+    assert db.get(WarehouseItem, (near.id, item.id)).version == 2  # type: ignore
+    assert db.get(StoreItem, (store.id, item.id)).version == 2  # type: ignore
+    assert db.get(StoreItem, (new_store.id, item.id)).version == 1  # type: ignore
+
+
+def test_ship_items_to_unknown_store(client: TestClient, db: Session) -> None:
+    warehouse = create_random_warehouse(db)
+    store = create_random_store(db)
+    item = create_random_stocked_item(db, store=store, warehouse=warehouse)
+    response = client.post(
+        f"{settings.API_V1_STR}/warehouses/shipments",
+        json={"demand": [{"store_id": -1, "item_id": item.id, "quantity": 1}]},
+    )
+    assert response.status_code == 404
+
+
+def test_ship_items_taken_while_planning(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    warehouse = create_random_warehouse(db)
+    store = create_random_store(db)
+    item = create_random_stocked_item(db, store=store, warehouse=warehouse)
+
+    def plan_then_take(*args: Any) -> ShipmentPlan:
+        plan = plan_shipments(*args)
+        with Session(engine) as session:
+            warehouse_item = session.get(WarehouseItem, (warehouse.id, item.id))
+            assert warehouse_item
+            warehouse_item.quantity = 10
+            session.add(warehouse_item)
+            session.commit()
+        return plan
+
+    monkeypatch.setattr(shipments, "plan_shipments", plan_then_take)
+    response = client.post(
+        f"{settings.API_V1_STR}/warehouses/shipments",
+        json={"demand": [{"store_id": store.id, "item_id": item.id, "quantity": 50}]},
+    )
+    assert response.status_code == 409
+    db.expire_all()
+    # Nothing shipped
+    assert db.get(WarehouseItem, (warehouse.id, item.id)).quantity == 10  # type: ignore
+    assert db.get(StoreItem, (store.id, item.id)).quantity == 100  # type: ignore
+
+
+def test_ship_items_request_size(client: TestClient) -> None:
+    line = {"store_id": 1, "item_id": 1, "quantity": 1}
+    response = client.post(
+        f"{settings.API_V1_STR}/warehouses/shipments",
+        json={"demand": [line] * (MAX_SHIPMENT_DEMAND + 1)},
+    )
+    assert response.status_code == 422
+
+
+def test_update_warehouse_item_if_match(client: TestClient, db: Session) -> None:
+    store = create_random_store(db)
+    warehouse = create_random_warehouse(db)
+    item = create_random_stocked_item(db, store=store, warehouse=warehouse)
+    url = f"{settings.API_V1_STR}/warehouses/{warehouse.id}/items/{item.id}"
+    etag = client.get(url).headers["ETag"]
+
+    # Changed by a receipt since it was read
+    client.post(url, params={"quantity": 5})
+    response = client.patch(url, json={"quantity": 90}, headers={"If-Match": etag})
+    assert response.status_code == 412
+
+    response = client.get(url)
+    assert response.json()["quantity"] == 105
+    response = client.patch(
+        url, json={"quantity": 90}, headers={"If-Match": response.headers["ETag"]}
+    )
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 90
+
+    response = client.patch(url, json={"quantity": -1})
+    assert response.status_code == 422
+
+
+def test_read_warehouses_batch(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    _, warehouses, _ = seed_inventory(db, n_warehouses=2, n_items=1, n_purchases=0)
+    ids = [warehouses[1].id, -1, warehouses[0].id]
+    url = f"{settings.API_V1_STR}/warehouses/batch"
+    response = client.get(url, headers=superuser_token_headers, params={"ids": ids})
+    assert response.status_code == 200
+    content = response.json()
+    assert [warehouse["id"] for warehouse in content["data"]] == [ids[0], ids[2]]
+    assert content["missing"] == [-1]
+
+    response = client.get(url, headers=normal_user_token_headers, params={"ids": ids})
+    assert response.status_code == 403
+
+
+def test_read_warehouse_stock(client: TestClient, db: Session) -> None:
+    _, warehouses, items = seed_inventory(
+        db, n_stores=1, n_warehouses=1, n_items=3, n_purchases=0
+    )
+    url = f"{settings.API_V1_STR}/warehouses/{warehouses[0].id}/items"
+    with assert_max_queries(1):
+        response = client.get(url)
+    assert response.status_code == 200
+    content = response.json()
+    assert [line["item_id"] for line in content["data"]] == sorted(
+        item.id  # type: ignore
+        for item in items
+    )
+    assert content["next_cursor"] is None
+
+    response = client.get(f"{settings.API_V1_STR}/warehouses/-1/items")
+    assert response.status_code == 404
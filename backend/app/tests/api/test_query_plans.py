@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, text
+
+from app.abc_classification import classify_items
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Item, Store, Warehouse
+from app.tests.utils.inventory import seed_inventory
+from app.tests.utils.query_plan import (
+    HOT_TABLES,
+    capture_statements,
+    explain,
+    find_seq_scans,
+)
+
+Seed = tuple[list[Store], list[Warehouse], list[Item]]
+
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE")
+
+
+@pytest.fixture(scope="module")
+def seeded(db: Session) -> Seed:
+    seed = seed_inventory(db)
+    classify_items(db)
+    db.exec(text("ANALYZE"))  # type: ignore
+    return seed
+
+
+def route_requests(seeded: Seed) -> list[tuple[str, str]]:
+    stores, warehouses, items = seeded
+    store, warehouse, item = stores[0], warehouses[0], items[0]
+    return [
+        ("GET", "/items/"),
+        ("GET", "/items/?sort=title&title_prefix=a"),
+        ("GET", "/items/?sort=retail_price&order=desc&max_retail_price=50"),
+        ("GET", "/items/?sort=wholesale_price&min_wholesale_price=10"),
+        ("GET", "/items/units"),
+        ("GET", f"/items/{item.id}/availability"),
+        ("GET", f"/items/availability?ids={item.id}&ids={items[1].id}"),
+        ("GET", f"/items/classification?store_id={store.id}"),
+        ("GET", "/items/classification?by=units&class=A"),
+        ("GET", "/stores/"),
+        ("GET", "/stores/?sort=name&order=desc&name_prefix=a"),
+        ("GET", "/stores/items/units"),
+        ("GET", "/stores/revenue"),
+        ("GET", f"/stores/{store.id}/turnover"),
+        ("GET", "/warehouses/"),
+        ("GET", "/warehouses/?sort=name&name_prefix=a"),
+        ("GET", "/warehouses/items/units"),
+        ("GET", f"/warehouses/{warehouse.id}/turnover"),
+        ("POST", f"/stores/{store.id}/items/{item.id}/purchase?quantity=1"),
+        ("POST", f"/warehouses/{warehouse.id}/items/{item.id}?quantity=5"),
+        (
+            "POST",
+            f"/warehouses/{warehouse.id}/items/{item.id}/stores/{store.id}?quantity=1",
+        ),
+    ]
+
+
+def test_hot_queries_use_indexes(
+    client: TestClient, superuser_token_headers: dict[str, str], seeded: Seed
+) -> None:
+    failures = []
+    for method, path in route_requests(seeded):
+        with capture_statements(engine) as statements:
+            response = client.request(
+                method, f"{settings.API_V1_STR}{path}", headers=superuser_token_headers
+            )
+        assert response.status_code == 200, (method, path, response.text)
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(EXPLAINABLE):
+                continue
+            seq_scans = find_seq_scans(
+                explain(engine, statement, parameters), HOT_TABLES
+            )
+            if seq_scans:
+                failures.append(f"{method} {path}: {seq_scans} in {statement}")
+    assert not failures, "\n".join(failures)
+
+
+def test_find_seq_scans() -> None:
+    plan = {
+        "Node Type": "Hash Join",
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "purchase"},
+            {"Node Type": "Seq Scan", "Relation Name": "store"},
+            {"Node Type": "Index Scan", "Relation Name": "item"},
+        ],
+    }
+    assert find_seq_scans(plan, HOT_TABLES) == ["purchase"]
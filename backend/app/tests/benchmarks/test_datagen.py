@@ -0,0 +1,47 @@
+import datetime
+
+from sqlmodel import Session, func, select
+
+from app.benchmarks.datagen import Config, Generator
+from app.models import Item, Purchase, Store, StoreItem, WarehouseItem
+
+
+def count(db: Session, model: type) -> int:
+    return db.exec(select(func.count()).select_from(model)).one()
+
+
+def test_generate_dataset(db: Session) -> None:
+    config = Config(
+        stores=4,
+        warehouses=4,
+        items=30,
+        purchases=1_000,
+        assortment=10,
+        days=40,
+        start=datetime.date(2020, 1, 20),
+        chunk_size=70,
+    )
+    before = {
+        model: count(db, model)
+        for model in (Store, Item, StoreItem, WarehouseItem, Purchase)
+    }
+    # Creating the partitions of the generated period needs a lock on purchase
+    db.commit()
+    Generator(config).run()
+    db.expire_all()
+
+    assert count(db, Store) - before[Store] == 4
+    assert count(db, Item) - before[Item] == 30
+    assert count(db, StoreItem) - before[StoreItem] == 4 * 10
+    # Every item is stocked in 3 warehouses on average
+    assert count(db, WarehouseItem) - before[WarehouseItem] == 4 * (30 * 3 // 4)
+    assert count(db, Purchase) - before[Purchase] == 1_000
+
+    first, last = db.exec(
+        select(func.min(Purchase.created_at), func.max(Purchase.created_at)).where(
+            Purchase.created_at
+            < datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+    ).one()
+    assert first >= datetime.datetime(2020, 1, 20, tzinfo=datetime.timezone.utc)
+    assert last < datetime.datetime(2020, 2, 29, tzinfo=datetime.timezone.utc)
@@ -0,0 +1,11 @@
+from app.benchmarks.hot_sku import main
+
+
+def test_hot_sku_report() -> None:
+    report = main(
+        ["--shards=0,2", "--concurrency=2", "--seconds=0.5", "--latency-ms=0"]
+    )
+    assert set(report["shards"]) == {0, 2}
+    for result in report["shards"].values():
+        assert result["requests"] > 0
+        assert result["errors"] == 0
@@ -0,0 +1,31 @@
+from app.benchmarks.http_load import FLOWS, main, summarize
+
+
+def test_summarize() -> None:
+    result = summarize([i / 1000 for i in range(1, 101)], errors=2, duration=2.0)
+    assert result.requests == 100
+    assert result.errors == 2
+    assert result.throughput_rps == 50.0
+    assert result.p50_ms == 50.5
+    assert result.p99_ms == 99.01
+    assert result.max_ms == 100.0
+
+
+def test_benchmark_report() -> None:
+    report = main(
+        [
+            "--stores=2",
+            "--warehouses=1",
+            "--items=5",
+            "--purchases=20",
+            "--requests=4",
+            "--concurrency=2",
+            "--warmup=0",
+        ]
+    )
+    assert report["scale"]["items"] == 5
+    assert set(report["flows"]) == set(FLOWS)
+    for result in report["flows"].values():
+        assert result["requests"] == 4
+        assert result["errors"] == 0
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
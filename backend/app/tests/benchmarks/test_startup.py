@@ -0,0 +1,35 @@
+import subprocess
+import sys
+
+from app.benchmarks.startup import BACKEND_DIR, measure_import, measure_workers
+
+# Only imported when used, see app.utils and app.main
+LAZY_MODULES = ("emails", "jinja2", "sentry_sdk")
+
+
+def test_lazy_imports() -> None:
+    probe = (
+        "import sys, app.main; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    assert output.strip() == ""
+
+
+def test_measure_import() -> None:
+    result = measure_import(repeat=1)
+    assert result["median_seconds"] > 0
+    assert result["max_rss_mb"] > 0
+
+
+def test_measure_preloaded_workers() -> None:
+    result = measure_workers(2, preload=True)
+    assert result["ready_seconds"] > 0
+    per_worker = result["per_worker"]
+    assert 0 < per_worker["private_mb"] <= per_worker["pss_mb"] <= per_worker["rss_mb"]
@@ -7,7 +7,17 @@ from sqlmodel import Session, delete
 from app.core.config import settings
 from app.core.db import engine, init_db
 from app.main import app
-from app.models import Item, User
+from app.models import (
+    IdempotencyKey,
+    Item,
+    Purchase,
+    Store,
+    StoreItem,
+    StoreItemShard,
+    User,
+    Warehouse,
+    WarehouseItem,
+)
 from app.tests.utils.user import authentication_token_from_email
 from app.tests.utils.utils import get_superuser_token_headers
 
@@ -17,6 +27,16 @@ def db() -> Generator[Session, None, None]:
     with Session(engine) as session:
         init_db(session)
         yield session
+        for model in (
+            IdempotencyKey,
+            Purchase,
+            StoreItemShard,
+            StoreItem,
+            WarehouseItem,
+            Store,
+            Warehouse,
+        ):
+            session.execute(delete(model))
         statement = delete(Item)
         session.execute(statement)
         statement = delete(User)
@@ -0,0 +1,21 @@
+import datetime
+
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.idempotency import purge_idempotency_keys
+from app.models import IdempotencyKey
+from app.tests.utils.utils import random_lower_string
+
+
+def test_purge_idempotency_keys(db: Session) -> None:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    expired, recent = random_lower_string(), random_lower_string()
+    ttl = datetime.timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    db.add(IdempotencyKey(key=expired, request_hash="", created_at=now - ttl * 2))
+    db.add(IdempotencyKey(key=recent, request_hash="", created_at=now))
+    db.commit()
+
+    assert purge_idempotency_keys(db) >= 1
+    assert db.get(IdempotencyKey, expired) is None
+    assert db.get(IdempotencyKey, recent) is not None
@@ -0,0 +1,91 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.metrics import MetricsMiddleware
+from app.tests.utils.inventory import seed_inventory
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_request_duration_by_route(client: TestClient, db: Session) -> None:
+    stores, _, _ = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    route = f"{settings.API_V1_STR}/stores/{{id}}"
+    labels = {"method": "GET", "route": route, "status": "2xx"}
+    before = sample("http_request_duration_seconds_count", **labels)
+    client.get(f"{settings.API_V1_STR}/stores/{stores[0].id}")
+    assert sample("http_request_duration_seconds_count", **labels) == before + 1
+
+
+def test_unmatched_routes_share_a_label(client: TestClient) -> None:
+    labels = {"method": "GET", "route": "unmatched", "status": "4xx"}
+    before = sample("http_request_duration_seconds_count", **labels)
+    client.get("/does-not-exist/1")
+    client.get("/does-not-exist/2")
+    assert sample("http_request_duration_seconds_count", **labels) == before + 2
+
+
+def test_units_counters(client: TestClient, db: Session) -> None:
+    stores, warehouses, items = seed_inventory(
+        db, n_stores=1, n_warehouses=1, n_items=1, n_purchases=0
+    )
+    store, warehouse, item = stores[0].id, warehouses[0].id, items[0].id
+    sold = sample("inventory_units_sold_total")
+    received = sample("inventory_units_received_total")
+    shipped = sample("inventory_units_shipped_total")
+
+    client.post(
+        f"{settings.API_V1_STR}/stores/{store}/items/{item}/purchase",
+        params={"quantity": 3},
+    )
+    client.post(
+        f"{settings.API_V1_STR}/warehouses/{warehouse}/items/{item}",
+        params={"quantity": 5},
+    )
+    client.post(
+        f"{settings.API_V1_STR}/warehouses/{warehouse}/items/{item}/stores/{store}",
+        params={"quantity": 7},
+    )
+    # Failed operations are not counted
+    client.post(
+        f"{settings.API_V1_STR}/stores/{store}/items/{item}/purchase",
+        params={"quantity": 1_000_000},
+    )
+    assert sample("inventory_units_sold_total") == sold + 3
+    assert sample("inventory_units_received_total") == received + 5
+    assert sample("inventory_units_shipped_total") == shipped + 7
+
+
+def test_metrics_endpoint(client: TestClient) -> None:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for name in (
+        "http_requests_in_progress",
+        "threadpool_size",
+        "db_pool_checked_out_connections",
+        "db_pool_checkout_wait_seconds_bucket",
+    ):
+        assert name in response.text
+    assert sample("threadpool_size") > 0
+
+
+def test_streams_are_not_timed() -> None:
+    app = FastAPI()
+
+    @app.get("/events")
+    def events() -> StreamingResponse:
+        return StreamingResponse(iter(["data: 1\n\n"]), media_type="text/event-stream")
+
+    app.add_middleware(MetricsMiddleware)
+    in_progress = sample("http_requests_in_progress", method="GET")
+    with TestClient(app) as client:
+        assert client.get("/events").status_code == 200
+    labels = {"method": "GET", "route": "/events", "status": "2xx"}
+    assert sample("http_request_duration_seconds_count", **labels) == 0
+    assert sample("http_requests_in_progress", method="GET") == in_progress
@@ -0,0 +1,133 @@
+import datetime
+
+from sqlmodel import Session, text
+
+from app.core.partitions import (
+    add_months,
+    create_purchase_partitions,
+    drop_purchase_partitions,
+    list_purchase_partitions,
+)
+from app.models import Purchase
+from app.tests.utils.inventory import (
+    create_random_stocked_item,
+    create_random_store,
+    create_random_warehouse,
+)
+
+
+def test_add_months() -> None:
+    assert add_months(datetime.date(2024, 11, 1), 1) == datetime.date(2024, 12, 1)
+    assert add_months(datetime.date(2024, 12, 1), 1) == datetime.date(2025, 1, 1)
+    assert add_months(datetime.date(2024, 1, 1), -13) == datetime.date(2022, 12, 1)
+
+
+def test_current_partitions_exist(db: Session) -> None:
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    partitions = list_purchase_partitions(db)
+    assert today.replace(day=1) in partitions
+    assert add_months(today, 1) in partitions
+
+
+def test_create_and_drop_purchase_partitions(db: Session) -> None:
+    start = datetime.date(1990, 1, 15)
+    created = create_purchase_partitions(db, start=start, months=2)
+    assert created == ["purchase_p1990_01", "purchase_p1990_02", "purchase_p1990_03"]
+    assert create_purchase_partitions(db, start=start, months=2) == []
+
+    store = create_random_store(db)
+    item = create_random_stocked_item(
+        db, store=store, warehouse=create_random_warehouse(db)
+    )
+    purchase = Purchase(
+        store_id=store.id,
+        item_id=item.id,
+        quantity=1,
+        created_at=datetime.datetime(1990, 2, 10, tzinfo=datetime.timezone.utc),
+    )
+    db.add(purchase)
+    db.commit()
+    partition = db.exec(  # type: ignore
+        text("SELECT tableoid::regclass::text FROM purchase WHERE id = :id"),
+        params={"id": purchase.id},
+    ).scalar_one()
+    assert partition == "purchase_p1990_02"
+
+    dropped = drop_purchase_partitions(db, before=datetime.date(1990, 3, 20))
+    assert dropped == ["purchase_p1990_01", "purchase_p1990_02"]
+    assert set(list_purchase_partitions(db)).isdisjoint(
+        {datetime.date(1990, 1, 1), datetime.date(1990, 2, 1)}
+    )
+    drop_purchase_partitions(db, before=datetime.date(1990, 4, 1))
+
+
+def test_default_purchase_partition(db: Session) -> None:
+    store = create_random_store(db)
+    item = create_random_stocked_item(
+        db, store=store, warehouse=create_random_warehouse(db)
+    )
+    # No partition for the month, the purchase still goes through
+    purchase = Purchase(
+        store_id=store.id,
+        item_id=item.id,
+        quantity=1,
+        created_at=datetime.datetime(1991, 5, 10, tzinfo=datetime.timezone.utc),
+    )
+    db.add(purchase)
+    db.commit()
+    purchase_id = purchase.id
+
+    def partition() -> str:
+        return db.exec(  # type: ignore
+            text("SELECT tableoid::regclass::text FROM purchase WHERE id = :id"),
+            params={"id": purchase_id},
+        ).scalar_one()
+
+    assert partition() == "purchase_default"
+    # Moved to the partition of its month once created
+    created = create_purchase_partitions(db, start=datetime.date(1991, 5, 1), months=0)
+    assert created == ["purchase_p1991_05"]
+    assert partition() == "purchase_p1991_05"
+    drop_purchase_partitions(db, before=datetime.date(1991, 6, 1))
+
+
+def test_retention_purges_default_partition(db: Session) -> None:
+    store = create_random_store(db)
+    item = create_random_stocked_item(
+        db, store=store, warehouse=create_random_warehouse(db)
+    )
+    # As the undated legacy purchases, and a late one of a month to come
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    later = datetime.datetime(2990, 1, 1, tzinfo=datetime.timezone.utc)
+    purchases = [
+        Purchase(store_id=store.id, item_id=item.id, quantity=1, created_at=at)
+        for at in (epoch, epoch, later)
+    ]
+    db.add_all(purchases)
+    db.commit()
+    ids = [purchase.id for purchase in purchases]
+
+    def count(table: str) -> int:
+        return db.exec(  # type: ignore
+            text(f"SELECT count(*) FROM {table} WHERE id = ANY(:ids)"),
+            params={"ids": ids},
+        ).scalar_one()
+
+    assert count("purchase_default") == 3
+    drop_purchase_partitions(db, before=datetime.date(1970, 2, 1), drop=False)
+    assert count("purchase_default") == 1
+    assert count("purchase_default_1970_02") == 2
+    db.exec(text("DROP TABLE purchase_default_1970_02"))  # type: ignore
+    db.commit()
+
+    purchase = Purchase(
+        store_id=store.id, item_id=item.id, quantity=1, created_at=epoch
+    )
+    db.add(purchase)
+    db.commit()
+    ids.append(purchase.id)
+    assert count("purchase_default") == 2
+    drop_purchase_partitions(db, before=datetime.date(1970, 2, 1))
+    assert count("purchase") == 1
+    db.exec(text("DELETE FROM purchase WHERE created_at = :at"), params={"at": later})  # type: ignore
+    db.commit()
@@ -0,0 +1,69 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.profiling import PROFILE_URL_HEADER, Sampler
+from app.tests.utils.inventory import seed_inventory
+
+
+def busy_loop(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+
+def test_sampler_records_cpu_and_wall_time() -> None:
+    sampler = Sampler(0.001)
+    sampler.start()
+    busy_loop(300_000)
+    sampler.stop()
+    profile = sampler.to_speedscope("busy loop")
+    names = [frame["name"] for frame in profile["shared"]["frames"]]
+    assert "busy_loop" in names
+    by_name = {p["name"]: p for p in profile["profiles"]}
+    assert {"MainThread (wall time)", "MainThread (cpu time)"} <= set(by_name)
+    assert by_name["MainThread (cpu time)"]["endValue"] > 0
+
+
+def test_profile_request(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "PROFILING_INTERVAL_MS", 0.1)
+    seed_inventory(db, n_stores=10, n_items=50, n_purchases=0)
+    response = client.get(
+        f"{settings.API_V1_STR}/stores/items/units",
+        headers={**superuser_token_headers, "X-Profile": "1"},
+    )
+    assert response.status_code == 200
+    profile_url = response.headers[PROFILE_URL_HEADER]
+
+    response = client.get(profile_url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    profile = response.json()
+    assert profile["name"] == f"GET {settings.API_V1_STR}/stores/items/units"
+    names = {frame["name"] for frame in profile["shared"]["frames"]}
+    assert "get_units_per_store_item" in names
+
+
+def test_profile_requires_superuser(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/stores/revenue",
+        params={"profile": "1"},
+        headers=normal_user_token_headers,
+    )
+    assert response.status_code == 200
+    assert PROFILE_URL_HEADER not in response.headers
+
+
+def test_read_missing_profile(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/utils/profiles/{'0' * 32}",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 404
@@ -0,0 +1,82 @@
+from collections.abc import Generator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session, text
+
+from app.core.config import settings
+from app.core.db import engine, slow_query_log
+from app.core.slow_queries import SlowQueryLog, parameter_shapes
+
+
+@pytest.fixture
+def log() -> Generator[SlowQueryLog, None, None]:
+    log = SlowQueryLog(threshold_ms=0, explain_sample_rate=1, size=10)
+    log.install(engine)
+    yield log
+    log.uninstall(engine)
+
+
+def test_parameter_shapes() -> None:
+    assert parameter_shapes({"id": 1, "ids": [1, 2, 3], "name": "x"}, False) == {
+        "id": "int",
+        "ids": "list[3]",
+        "name": "str[1]",
+    }
+    assert parameter_shapes([{"id": 1}, {"id": 2}], True) == {
+        "rows": 2,
+        "row": {"id": "int"},
+    }
+
+
+def test_slow_select_is_explained(log: SlowQueryLog) -> None:
+    with Session(engine) as session:
+        session.execute(text("SELECT :value + 1"), {"value": 41}).one()
+    log.wait()
+    query = log.recent()[0]
+    assert query.statement.startswith("SELECT")
+    assert query.parameters == {"value": "int"}
+    assert query.route is None
+    assert query.plan is not None
+    assert "Execution Time" in query.plan
+
+
+def test_writes_are_not_explained(log: SlowQueryLog) -> None:
+    with Session(engine) as session:
+        session.execute(text("CREATE TEMPORARY TABLE slow_query_test (id int)"))
+        session.execute(text("INSERT INTO slow_query_test VALUES (1)"))
+        session.rollback()
+    log.wait()
+    assert [query.plan for query in log.recent()] == [None, None]
+
+
+def test_read_slow_queries(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    if settings.SLOW_QUERY_THRESHOLD_MS is None:
+        pytest.skip("slow query log disabled")
+    monkeypatch.setattr(slow_query_log, "threshold_ms", 0)
+    monkeypatch.setattr(slow_query_log, "explain_sample_rate", 0)
+    client.get(f"{settings.API_V1_STR}/stores/revenue")
+    monkeypatch.setattr(slow_query_log, "threshold_ms", float("inf"))
+
+    url = f"{settings.API_V1_STR}/utils/slow-queries/"
+    response = client.get(url, headers=normal_user_token_headers)
+    assert response.status_code == 403
+    response = client.get(url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    routes = {query["route"] for query in response.json()}
+    assert f"{settings.API_V1_STR}/stores/revenue" in routes
+
+
+def test_failed_statement_pops_start_time(log: SlowQueryLog) -> None:  # noqa: ARG001
+    with Session(engine) as session:
+        connection = session.connection()
+        with pytest.raises(DBAPIError):
+            session.execute(text("SELECT 1 / 0"))
+        assert connection.info["slow_query_start_time"] == []
+        assert connection.info["query_start_time"] == []
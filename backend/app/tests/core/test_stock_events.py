@@ -0,0 +1,183 @@
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.api.routes.stock import server_sent_events
+from app.core.config import settings
+from app.core.db import engine
+from app.core.stock_events import (
+    StockChange,
+    StockEventBroker,
+    broker,
+    listener_conninfo,
+    notify_stock_changes,
+)
+from app.tests.utils.inventory import (
+    create_random_stocked_item,
+    create_random_store,
+    create_random_warehouse,
+)
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    # The listener runs on asyncio, like the app
+    return "asyncio"
+
+
+@contextlib.asynccontextmanager
+async def listening(broker: StockEventBroker) -> AsyncIterator[None]:
+    listener = asyncio.create_task(broker.listen(listener_conninfo()))
+    await asyncio.wait_for(broker.listening.wait(), 5)
+    try:
+        yield
+    finally:
+        listener.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await listener
+
+
+def notify(changes: list[StockChange], *, commit: bool = True) -> None:
+    with Session(engine) as session:
+        notify_stock_changes(session, changes)
+        if commit:
+            session.commit()
+
+
+@pytest.mark.anyio
+async def test_subscription_filters() -> None:
+    broker = StockEventBroker(queue_size=3)
+    with (
+        broker.subscribe(store_ids=[1]) as store,
+        broker.subscribe(store_ids=[2], warehouse_ids=[1]) as both,
+        broker.subscribe() as everything,
+    ):
+        broker.publish(StockChange("store", 1, 7, 10))
+        broker.publish(StockChange("store", 2, 7, 10))
+        broker.publish(StockChange("warehouse", 1, 7, 5))
+        broker.publish(StockChange("warehouse", 2, 7, 5))
+        # A subscription to stores gets no warehouse changes
+        assert await store.get() == StockChange("store", 1, 7, 10)
+        assert [await both.get() for _ in range(2)] == [
+            StockChange("store", 2, 7, 10),
+            StockChange("warehouse", 1, 7, 5),
+        ]
+        assert store.queue.empty() and both.queue.empty()
+        # Subscribers falling behind are dropped
+        assert everything not in broker.subscriptions
+        assert await everything.get() is None
+    assert not broker.subscriptions
+
+
+@pytest.mark.anyio
+async def test_changes_published_on_commit() -> None:
+    broker = StockEventBroker()
+    async with listening(broker):
+        with broker.subscribe(store_ids=[1, 2], warehouse_ids=[1]) as subscription:
+            await asyncio.to_thread(
+                notify, [StockChange("store", 1, 7, 0)], commit=False
+            )
+            await asyncio.to_thread(
+                notify,
+                [StockChange("store", 2, 7, 3), StockChange("warehouse", 2, 7, 4)],
+            )
+            assert await subscription.get(timeout=5) == StockChange("store", 2, 7, 3)
+            with pytest.raises(asyncio.TimeoutError):
+                await subscription.get(timeout=0.2)
+
+
+@pytest.mark.anyio
+async def test_routes_publish_changes(client: TestClient, db: Session) -> None:
+    store = create_random_store(db)
+    warehouse = create_random_warehouse(db)
+    item = create_random_stocked_item(db, store=store, warehouse=warehouse)
+    assert store.id and warehouse.id and item.id
+    broker = StockEventBroker()
+    async with listening(broker):
+        with broker.subscribe(
+            store_ids=[store.id], warehouse_ids=[warehouse.id]
+        ) as subscription:
+            response = await asyncio.to_thread(
+                client.post,
+                f"{settings.API_V1_STR}/warehouses/{warehouse.id}/items/{item.id}"
+                f"/stores/{store.id}",
+                params={"quantity": 40},
+            )
+            assert response.status_code == 200
+            response = await asyncio.to_thread(
+                client.post,
+                f"{settings.API_V1_STR}/stores/{store.id}/items/{item.id}/purchase",
+                params={"quantity": 3},
+            )
+            assert response.status_code == 200
+            changes = [await subscription.get(timeout=5) for _ in range(3)]
+    assert changes == [
+        StockChange("warehouse", warehouse.id, item.id, 60),
+        StockChange("store", store.id, item.id, 140),
+        StockChange("store", store.id, item.id, 137),
+    ]
+
+
+@pytest.mark.anyio
+async def test_server_sent_events() -> None:
+    events = server_sent_events([42], [])
+    next_event = asyncio.ensure_future(anext(events))
+    await asyncio.sleep(0)
+    broker.publish(StockChange("store", 42, 7, 1))
+    assert await next_event == (
+        'event: stock\ndata: {"location":"store","location_id":42,'
+        '"item_id":7,"quantity":1}\n\n'
+    )
+    await events.aclose()
+    assert not any(
+        subscription.store_ids == {42} for subscription in broker.subscriptions
+    )
+
+
+def test_stream_requires_user(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    url = f"{settings.API_V1_STR}/stock/events"
+    assert client.get(url).status_code == 401
+    # Past the authentication, without opening a stream that doesn't end
+    monkeypatch.setattr(settings, "STOCK_EVENTS_ENABLED", False)
+    assert client.get(url, headers=normal_user_token_headers).status_code == 404
+
+
+@pytest.mark.anyio
+async def test_listener_reconnects_after_any_error(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    broker = StockEventBroker()
+    publish = broker.publish
+    calls = 0
+
+    def fail_once(change: StockChange) -> None:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("unexpected")
+        publish(change)
+
+    monkeypatch.setattr(broker, "publish", fail_once)
+    listener = asyncio.create_task(broker.listen(listener_conninfo(), retry_delay=0.1))
+    try:
+        with broker.subscribe(store_ids=[3]) as subscription:
+            await asyncio.wait_for(broker.listening.wait(), 5)
+            await asyncio.to_thread(notify, [StockChange("store", 3, 7, 1)])
+            # Lost with the failed connection
+            with pytest.raises(asyncio.TimeoutError):
+                await subscription.get(timeout=0.5)
+            await asyncio.wait_for(broker.listening.wait(), 5)
+            await asyncio.to_thread(notify, [StockChange("store", 3, 7, 2)])
+            assert await subscription.get(timeout=5) == StockChange("store", 3, 7, 2)
+    finally:
+        listener.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await listener
@@ -0,0 +1,48 @@
+from typing import Any
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT
+from sqlmodel import Session, create_engine
+
+from app.api.routes import stores, warehouses
+from app.core.config import settings
+from app.core.warmup import EPOCH, warm_up
+from app.main import app
+from app.models import Store, StoreItem
+
+
+def test_health_check(client: TestClient) -> None:
+    response = client.get(f"{settings.API_V1_STR}/utils/health-check/")
+    assert response.status_code == 200
+    assert response.json() is True
+
+
+def test_warm_up() -> None:
+    engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), pool_size=3)
+    warm_up(app, engine, connections=3)
+    assert engine.pool.checkedin() == 3  # type: ignore
+
+    cache_hits = []
+
+    def after_cursor_execute(
+        conn: Any,  # noqa: ARG001
+        cursor: Any,  # noqa: ARG001
+        statement: Any,  # noqa: ARG001
+        parameters: Any,  # noqa: ARG001
+        context: Any,
+        executemany: bool,  # noqa: ARG001
+    ) -> None:
+        cache_hits.append(context.cache_hit is CACHE_HIT)
+
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    with Session(engine) as session:
+        session.get(Store, 42)
+        session.get(StoreItem, (42, 43))
+        stores.get_store_revenue(session, start=EPOCH, end=EPOCH)
+        with pytest.raises(HTTPException):
+            warehouses.read_warehouse_stock(session, id=0, limit=10, cursor=None)
+    engine.dispose()
+    assert cache_hits == [True, True, True, True, True]
@@ -0,0 +1,86 @@
+import datetime
+
+from sqlmodel import Session, select
+
+from app.abc_classification import ClassificationParams, classify_items
+from app.models import ItemClassification, Purchase, StoreItem
+from app.tests.utils.inventory import seed_inventory
+
+
+def test_classify_items(db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=2, n_items=4, n_purchases=0)
+    items.sort(key=lambda item: item.id)  # type: ignore
+    for item in items:
+        item.retail_price = 10
+    # 80%, 10%, 5% and 5% of the units of the first store
+    for item, quantity in zip(items, [16, 2, 1, 1], strict=True):
+        db.add(Purchase(store_id=stores[0].id, item_id=item.id, quantity=quantity))
+    db.add(Purchase(store_id=stores[1].id, item_id=items[3].id, quantity=20))
+    db.add_all(items)
+    db.commit()
+    item_ids: list[int] = [item.id for item in items]  # type: ignore[misc]
+
+    assert classify_items(db, ClassificationParams(a_share=0.8, b_share=0.95)) > 0
+    rows = db.exec(
+        select(ItemClassification)
+        .where(ItemClassification.store_id == stores[0].id)
+        .order_by(ItemClassification.revenue_rank)  # type: ignore
+    ).all()
+    assert [row.item_id for row in rows] == item_ids
+    assert [row.revenue for row in rows] == [160, 20, 10, 10]
+    # The item crossing a threshold is in the class below it
+    assert [row.revenue_class for row in rows] == ["A", "B", "B", "C"]
+    assert [row.units_rank for row in rows] == [1, 2, 3, 4]
+    assert [row.units_class for row in rows] == ["A", "B", "B", "C"]
+    # Stocked items that didn't sell are C
+    rows = db.exec(
+        select(ItemClassification)
+        .where(ItemClassification.store_id == stores[1].id)
+        .order_by(ItemClassification.units_rank)  # type: ignore
+    ).all()
+    assert [row.item_id for row in rows] == [item_ids[3], *item_ids[:3]]
+    assert [row.units_class for row in rows][1:] == ["C", "C", "C"]
+
+    # Network-wide, the sales of all the stores
+    network = {
+        row.item_id: row
+        for row in db.exec(
+            select(ItemClassification).where(
+                ItemClassification.store_id.is_(None),  # type: ignore
+                ItemClassification.item_id.in_(item_ids),  # type: ignore
+            )
+        )
+    }
+    assert [network[item_id].units for item_id in item_ids] == [16, 2, 1, 21]
+    ranks = [network[item_id].units_rank for item_id in item_ids]
+    assert ranks[3] < ranks[0] < ranks[1] < ranks[2]
+
+    # Only the purchases of the period
+    classify_items(
+        db, now=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(1)
+    )
+    units = db.exec(
+        select(ItemClassification.units).where(
+            ItemClassification.store_id == stores[0].id
+        )
+    ).all()
+    assert units == [0, 0, 0, 0]
+
+
+def test_classify_items_sold_but_no_longer_stocked(db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=2, n_purchases=0)
+    store_id, item_id = stores[0].id, items[0].id
+    db.add(Purchase(store_id=store_id, item_id=item_id, quantity=5))
+    db.delete(db.get(StoreItem, (store_id, item_id)))
+    db.commit()
+
+    classify_items(db)
+    rows = db.exec(
+        select(ItemClassification)
+        .where(ItemClassification.store_id == store_id)
+        .order_by(ItemClassification.units_rank)  # type: ignore
+    ).all()
+    assert [(row.item_id, row.units, row.units_class) for row in rows] == [
+        (item_id, 5, "A"),
+        (items[1].id, 0, "C"),
+    ]
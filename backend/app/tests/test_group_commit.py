@@ -0,0 +1,167 @@
+import threading
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import pytest
+from anyio import to_thread
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.group_commit import (
+    THREADPOOL_SIZE,
+    PendingPurchase,
+    PurchaseBatcher,
+    pool_capacity,
+    purchase_batch,
+    purchase_batcher,
+)
+from app.models import Purchase, StoreItem
+from app.stock_shards import reshard
+from app.tests.utils.inventory import seed_inventory
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def test_purchase_batch(db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    store_id, item_id = stores[0].id, items[0].id
+    assert store_id and item_id
+    outcomes = purchase_batch(
+        db,
+        [
+            PendingPurchase(store_id, item_id, 600),
+            # Not enough left for this one, the next ones still go through
+            PendingPurchase(store_id, item_id, 500),
+            PendingPurchase(store_id, item_id, 400),
+            PendingPurchase(store_id, item_id, 1),
+            PendingPurchase(store_id, -1, 1),
+            PendingPurchase(-1, item_id, 1),
+        ],
+    )
+    assert [
+        outcome["quantity"] if isinstance(outcome, dict) else outcome.detail  # type: ignore
+        for outcome in outcomes
+    ] == [
+        400,
+        "Not enough items in stock",
+        0,
+        "Not enough items in stock",
+        "Item not found in store",
+        "Store not found",
+    ]
+    db.commit()
+    db.expire_all()
+    store_item = db.get(StoreItem, (store_id, item_id))
+    assert store_item and store_item.quantity == 0 and store_item.version == 2
+    purchases = db.exec(
+        select(Purchase.quantity).where(Purchase.store_id == store_id)
+    ).all()
+    assert sorted(purchases) == [400, 600]
+
+
+def test_purchase_item_group_commit(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "PURCHASE_GROUP_COMMIT", True)
+    # Long enough for all the requests to join the same batches
+    monkeypatch.setattr(purchase_batcher, "window", 0.2)
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    url = f"{settings.API_V1_STR}/stores/{stores[0].id}/items/{items[0].id}/purchase"
+    with ThreadPoolExecutor(8) as executor:
+        responses = list(
+            executor.map(lambda _: client.post(url, params={"quantity": 200}), range(8))
+        )
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [200] * 5 + [400] * 3
+    assert sorted(
+        response.json()["quantity"]
+        for response in responses
+        if response.status_code == 200
+    ) == [0, 200, 400, 600, 800]
+    count = db.exec(select(func.count()).where(Purchase.store_id == stores[0].id)).one()
+    assert count == 5
+
+    # Sharded items are purchased on their own
+    db.expire_all()
+    store_item = db.get(StoreItem, (stores[0].id, items[0].id))
+    assert store_item
+    store_item.quantity = 10
+    db.add(store_item)
+    db.commit()
+    reshard(db, stores[0].id, items[0].id, 2)  # type: ignore
+    db.commit()
+    response = client.post(url, params={"quantity": 3})
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 7
+
+
+def test_purchase_batcher_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(purchase_batcher, "window", 0)
+    with pytest.raises(HTTPException) as exc_info:
+        purchase_batcher.purchase(-1, -1, 1)
+    assert exc_info.value.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_batches_leave_threads() -> None:
+    limiter = to_thread.current_default_thread_limiter()
+    assert limiter.total_tokens == THREADPOOL_SIZE
+    assert PurchaseBatcher(engine, window=0, max_size=1000).max_size < THREADPOOL_SIZE
+
+
+@pytest.fixture
+def checked_out() -> Generator[list[int], None, None]:
+    """
+    Connections of the engine checked out now, and at most so far.
+    """
+    counts = [0, 0]
+    lock = threading.Lock()
+
+    def checkout(*_args: Any) -> None:
+        with lock:
+            counts[0] += 1
+            counts[1] = max(counts)
+
+    def checkin(*_args: Any) -> None:
+        with lock:
+            counts[0] -= 1
+
+    event.listen(engine, "checkout", checkout)
+    event.listen(engine, "checkin", checkin)
+    yield counts
+    event.remove(engine, "checkout", checkout)
+    event.remove(engine, "checkin", checkin)
+
+
+def test_purchases_beyond_the_pool(
+    client: TestClient,
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+    checked_out: list[int],
+) -> None:
+    capacity = pool_capacity(engine)
+    assert capacity is not None
+    assert purchase_batcher.max_size <= capacity // 2
+    monkeypatch.setattr(settings, "PURCHASE_GROUP_COMMIT", True)
+    monkeypatch.setattr(purchase_batcher, "window", 0.2)
+    stores, _, items = seed_inventory(db, n_stores=1, n_items=1, n_purchases=0)
+    url = f"{settings.API_V1_STR}/stores/{stores[0].id}/items/{items[0].id}/purchase"
+    n = capacity + 10
+    # The waiting purchases hold no connection: the batches don't wait for
+    # the pool
+    with ThreadPoolExecutor(n) as executor:
+        responses = list(
+            executor.map(lambda _: client.post(url, params={"quantity": 1}), range(n))
+        )
+    assert [response.status_code for response in responses] == [200] * n
+    assert checked_out[1] < capacity
+    count = db.exec(select(func.count()).where(Purchase.store_id == stores[0].id)).one()
+    assert count == n
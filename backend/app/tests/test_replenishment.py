@@ -0,0 +1,135 @@
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.replenishment import (
+    ReplenishmentParams,
+    StockLevels,
+    load_stock_levels,
+    most_urgent,
+    suggest,
+)
+from app.tests.utils.inventory import seed_inventory
+
+
+def levels(**arrays: list[int]) -> StockLevels:
+    return StockLevels(**{name: np.array(values) for name, values in arrays.items()})
+
+
+def test_suggest() -> None:
+    suggestions = suggest(
+        levels(
+            store_ids=[1, 2, 1, 2],
+            item_ids=[10, 10, 20, 30],
+            quantities=[5, 0, 100, 0],
+            # 2 units per day of item 10, item 20 doesn't sell
+            sold=[56, 56, 0, 28],
+            # Item 30 is out of stock in every warehouse
+            warehouse_item_ids=[10, 20],
+            warehouse_quantities=[30, 1000],
+        ),
+        ReplenishmentParams(lookback_days=28, reorder_point_days=7, target_days=14),
+    )
+    assert suggestions.days_of_cover.tolist() == [2.5, 0, np.inf, 0]
+    # 23 and 28 units needed, 30 available: shared in proportion
+    assert suggestions.reorder_quantities.tolist() == [13, 16, 0, 0]
+
+
+def test_most_urgent() -> None:
+    suggestions = suggest(
+        levels(
+            store_ids=[1, 1, 2, 2],
+            item_ids=[10, 20, 10, 20],
+            quantities=[3, 1, 2, 50],
+            sold=[28, 28, 28, 28],
+            warehouse_item_ids=[10, 20],
+            warehouse_quantities=[1000, 1000],
+        ),
+        ReplenishmentParams(lookback_days=28),
+    )
+    urgent = most_urgent(suggestions, limit=2)
+    assert list(zip(urgent.store_ids, urgent.item_ids, strict=False)) == [
+        (1, 20),
+        (2, 10),
+    ]
+    urgent = most_urgent(suggestions, limit=10, store_id=1)
+    assert urgent.item_ids.tolist() == [20, 10]
+    assert urgent.to_dicts()[0] == {
+        "store_id": 1,
+        "item_id": 20,
+        "quantity": 1,
+        "daily_sales": 1.0,
+        "days_of_cover": 1.0,
+        "reorder_quantity": 13,
+    }
+
+
+def test_suggest_at_scale() -> None:
+    rng = np.random.default_rng(0)
+    n_pairs, n_items = 1_000_000, 50_000
+    available = rng.integers(0, 1000, n_items)
+    suggestions = suggest(
+        StockLevels(
+            store_ids=np.repeat(np.arange(1, n_pairs // 500 + 1), 500),
+            item_ids=rng.integers(1, n_items + 1, n_pairs, dtype=np.int32),
+            quantities=rng.integers(0, 100, n_pairs, dtype=np.int32),
+            sold=rng.integers(0, 100, n_pairs),
+            warehouse_item_ids=np.arange(1, n_items + 1),
+            warehouse_quantities=available,
+        ),
+        ReplenishmentParams(),
+    )
+    shipped = np.bincount(suggestions.item_ids, weights=suggestions.reorder_quantities)[
+        1:
+    ]
+    # Never more than available in the warehouses
+    assert (shipped <= rng.integers(0, 1000, n_items) + 1000).all()
+    assert suggestions.reorder_quantities.sum() > 0
+
+
+def test_load_stock_levels(db: Session) -> None:
+    stores, _, items = seed_inventory(db, n_stores=2, n_items=3, n_purchases=30)
+    levels = load_stock_levels(db.connection(), lookback_days=1)
+    pairs = {
+        (store, item): (quantity, sold)
+        for store, item, quantity, sold in zip(
+            levels.store_ids.tolist(),
+            levels.item_ids.tolist(),
+            levels.quantities.tolist(),
+            levels.sold.tolist(),
+            strict=True,
+        )
+    }
+    store_pairs = [(store.id, item.id) for store in stores for item in items]
+    assert all(pairs[pair][0] == 1000 for pair in store_pairs)
+    assert sum(pairs[pair][1] for pair in store_pairs) > 0
+    assert levels.warehouse_quantities.dtype == np.int64
+    db.rollback()
+
+
+def test_get_replenishment_suggestions(client: TestClient, db: Session) -> None:
+    stores, _, items = seed_inventory(
+        db, n_stores=1, n_warehouses=1, n_items=2, n_purchases=0
+    )
+    store, item = stores[0], items[0]
+    url = f"{settings.API_V1_STR}/stores/{store.id}/items/{item.id}/purchase"
+    response = client.post(url, params={"quantity": 990})
+    assert response.status_code == 200
+
+    response = client.get(
+        f"{settings.API_V1_STR}/stores/replenishment",
+        params={"store_id": store.id, "lookback_days": 1},
+    )
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "store_id": store.id,
+            "item_id": item.id,
+            "quantity": 10,
+            "daily_sales": 990.0,
+            "days_of_cover": 0.0,
+            # Needs 14 * 990 - 10 units, limited by the warehouse stock
+            "reorder_quantity": 1000,
+        }
+    ]
@@ -0,0 +1,19 @@
+from app.scheduler import Job, run_due
+
+
+def test_run_due() -> None:
+    runs: list[str] = []
+
+    def fail() -> None:
+        runs.append("fail")
+        raise RuntimeError
+
+    jobs = [Job("fast", lambda: runs.append("fast"), 10), Job("fail", fail, 60)]
+    run_due(jobs, 0)
+    assert runs == ["fast", "fail"]
+    # A failed job doesn't stop the others, and is retried at its interval
+    run_due(jobs, 10)
+    assert runs == ["fast", "fail", "fast"]
+    run_due(jobs, 60)
+    assert runs == ["fast", "fail", "fast", "fast", "fail"]
+    assert [job.next_run for job in jobs] == [70, 120]
@@ -0,0 +1,86 @@
+import itertools
+import random
+import time
+
+from app.models import ShipmentDemand, ShippingCost
+from app.shipments import min_cost_flow, plan_shipments
+
+
+def test_plan_beats_least_cost_method() -> None:
+    # Serving the cheapest lane first, 1 -> 10, leaves 2 -> 20 at 10 a unit,
+    # for a total of 110 instead of 40
+    plan = plan_shipments(
+        [
+            ShipmentDemand(store_id=10, item_id=7, quantity=10),
+            ShipmentDemand(store_id=20, item_id=7, quantity=10),
+        ],
+        {7: {1: 10, 2: 10}},
+        [
+            ShippingCost(warehouse_id=1, store_id=10, cost=1),
+            ShippingCost(warehouse_id=1, store_id=20, cost=2),
+            ShippingCost(warehouse_id=2, store_id=10, cost=2),
+            ShippingCost(warehouse_id=2, store_id=20, cost=10),
+        ],
+    )
+    assert [
+        (line.warehouse_id, line.store_id, line.quantity) for line in plan.lines
+    ] == [
+        (1, 20, 10),
+        (2, 10, 10),
+    ]
+    assert plan.unfulfilled == []
+    assert plan.total_cost == 40
+
+
+def brute_force(
+    supply: dict[int, int], demand: dict[int, int], costs: dict[tuple[int, int], int]
+) -> tuple[int, int]:
+    """
+    Most units shipped, and their least cost, over every allocation.
+    """
+    lanes = sorted(costs)
+    best = (0, 0)
+    ranges = [range(min(supply[w], demand[s]) + 1) for w, s in lanes]
+    for quantities in itertools.product(*ranges):
+        shipped = dict(zip(lanes, quantities, strict=True))
+        if any(
+            sum(q for (w, _), q in shipped.items() if w == warehouse) > units
+            for warehouse, units in supply.items()
+        ) or any(
+            sum(q for (_, s), q in shipped.items() if s == store) > units
+            for store, units in demand.items()
+        ):
+            continue
+        units = sum(quantities)
+        cost = sum(costs[lane] * q for lane, q in shipped.items())
+        if units > best[0] or (units == best[0] and cost < best[1]):
+            best = (units, cost)
+    return best
+
+
+def test_min_cost_flow_is_optimal() -> None:
+    rng = random.Random(37)
+    for _ in range(30):
+        supply = {w: rng.randint(0, 4) for w in (1, 2)}
+        demand = {s: rng.randint(1, 4) for s in (10, 20, 30)}
+        costs = {(w, s): rng.randint(0, 9) for w in supply for s in demand}
+        shipped = min_cost_flow(supply, demand, lambda w, s: costs[(w, s)])  # noqa: B023
+        units = sum(shipped.values())
+        cost = sum(costs[lane] * q for lane, q in shipped.items())
+        assert (units, cost) == brute_force(supply, demand, costs)
+
+
+def test_min_cost_flow_scale() -> None:
+    # The stores of a network, for a handful of warehouses
+    rng = random.Random(5000)
+    supply = {w: rng.randint(5_000, 10_000) for w in range(1, 11)}
+    demand = {s: rng.randint(1, 30) for s in range(5_000)}
+    costs = {(w, s): rng.randint(0, 20) for w in supply for s in demand}
+    start = time.perf_counter()
+    shipped = min_cost_flow(supply, demand, lambda w, s: costs[(w, s)])
+    assert time.perf_counter() - start < 5
+    assert sum(shipped.values()) == min(sum(supply.values()), sum(demand.values()))
+    for warehouse_id, units in supply.items():
+        assert sum(q for (w, _), q in shipped.items() if w == warehouse_id) <= units
+    for store_id, units in demand.items():
+        assert sum(q for (_, s), q in shipped.items() if s == store_id) <= units
@@ -0,0 +1,117 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import StockMovement, StockTurnover
+from app.tests.utils.inventory import seed_inventory
+from app.turnover import Movement, record_movements, refresh_turnover, turnover_line
+
+
+def test_turnover_line() -> None:
+    line = turnover_line(
+        item_id=1, quantity=80, units_in=40, units_out=56, adjusted=-4, days=28
+    )
+    # 100 units at the start of the window
+    assert line.average_quantity == 90
+    assert line.turnover == pytest.approx(56 / 90)
+    # 2 units out per day
+    assert line.days_of_supply == 40
+
+    line = turnover_line(
+        item_id=1, quantity=0, units_in=0, units_out=0, adjusted=0, days=28
+    )
+    assert line.turnover is None and line.days_of_supply is None
+
+
+def test_refresh_turnover(client: TestClient, db: Session) -> None:
+    stores, warehouses, items = seed_inventory(
+        db, n_stores=1, n_warehouses=1, n_items=2, n_purchases=0
+    )
+    store_id, warehouse_id = stores[0].id, warehouses[0].id
+    item_id = min(item.id for item in items)  # type: ignore
+    api = settings.API_V1_STR
+    client.post(
+        f"{api}/stores/{store_id}/items/{item_id}/purchase", params={"quantity": 30}
+    )
+    client.post(
+        f"{api}/warehouses/{warehouse_id}/items/{item_id}/stores/{store_id}",
+        params={"quantity": 50},
+    )
+    client.post(
+        f"{api}/warehouses/{warehouse_id}/items/{item_id}", params={"quantity": 100}
+    )
+    # Counted 20 units less than the 1020 left
+    client.patch(f"{api}/stores/{store_id}/items/{item_id}", json={"quantity": 1000})
+    movements = db.exec(
+        select(StockMovement.location, StockMovement.quantity, StockMovement.reason)
+        .where(StockMovement.item_id == item_id)
+        .order_by(StockMovement.id)  # type: ignore
+    ).all()
+    assert [tuple(movement) for movement in movements] == [
+        ("warehouse", -50, "shipment"),
+        ("store", 50, "shipment"),
+        ("warehouse", 100, "receipt"),
+        ("store", -20, "count"),
+    ]
+
+    refresh_turnover(db)
+    # Only the changes since the previous refresh are added
+    refresh_turnover(db)
+    response = client.get(f"{api}/stores/{store_id}/turnover", params={"limit": 1})
+    assert response.status_code == 200
+    content = response.json()
+    assert content["processed_until"] is not None
+    line = content["data"][0]
+    assert line["item_id"] == item_id
+    assert (line["units_in"], line["units_out"], line["adjusted"]) == (50, 30, -20)
+    assert line["quantity"] == line["average_quantity"] == 1000
+    assert line["days_of_supply"] == pytest.approx(1000 / (30 / 28))
+    response = client.get(
+        f"{api}/stores/{store_id}/turnover",
+        params={"limit": 1, "cursor": content["next_cursor"]},
+    )
+    line = response.json()["data"][0]
+    assert (line["units_out"], line["turnover"], line["days_of_supply"]) == (
+        0,
+        0,
+        None,
+    )
+
+    response = client.get(f"{api}/warehouses/{warehouse_id}/turnover")
+    assert response.status_code == 200
+    line = response.json()["data"][0]
+    assert (line["units_in"], line["units_out"], line["quantity"]) == (100, 50, 1050)
+    assert line["average_quantity"] == 1025
+
+    assert client.get(f"{api}/stores/-1/turnover").status_code == 404
+    assert client.get(f"{api}/warehouses/-1/turnover").status_code == 404
+
+
+def test_refresh_turnover_after_late_commit(db: Session) -> None:
+    stores, _, items = seed_inventory(
+        db, n_stores=1, n_warehouses=0, n_items=1, n_purchases=0
+    )
+    store_id, item_id = stores[0].id, items[0].id
+    assert store_id is not None and item_id is not None
+
+    def units_in() -> int:
+        return db.exec(
+            select(func.coalesce(func.sum(StockTurnover.units_in), 0)).where(
+                StockTurnover.location == "store",
+                StockTurnover.location_id == store_id,
+                StockTurnover.item_id == item_id,
+            )
+        ).one()
+
+    with Session(engine) as late:
+        # Created before the refresh, committed after it
+        record_movements(late, [Movement("store", store_id, item_id, 7, "receipt")])
+        refresh_turnover(db)
+        assert units_in() == 0
+        late.commit()
+    refresh_turnover(db)
+    assert units_in() == 7
+    refresh_turnover(db)
+    assert units_in() == 7
@@ -0,0 +1,89 @@
+import random
+
+from sqlmodel import Session
+
+from app.models import Item, Purchase, Store, StoreItem, Warehouse, WarehouseItem
+from app.tests.utils.utils import random_lower_string
+
+
+def create_random_store(db: Session) -> Store:
+    store = Store(name=random_lower_string())
+    db.add(store)
+    db.commit()
+    db.refresh(store)
+    return store
+
+
+def create_random_warehouse(db: Session) -> Warehouse:
+    warehouse = Warehouse(name=random_lower_string())
+    db.add(warehouse)
+    db.commit()
+    db.refresh(warehouse)
+    return warehouse
+
+
+def create_random_stocked_item(
+    db: Session, *, store: Store, warehouse: Warehouse, quantity: int = 100
+) -> Item:
+    """
+    Create an item stocked in both `store` and `warehouse`.
+    """
+    item = Item(
+        title=random_lower_string(),
+        wholesale_price=round(random.uniform(1, 50), 2),
+        retail_price=round(random.uniform(50, 100), 2),
+    )
+    db.add(item)
+    db.commit()
+    db.refresh(item)
+    db.add(StoreItem(store_id=store.id, item_id=item.id, quantity=quantity))
+    db.add(WarehouseItem(warehouse_id=warehouse.id, item_id=item.id, quantity=quantity))
+    db.commit()
+    return item
+
+
+def seed_inventory(
+    db: Session,
+    *,
+    n_stores: int = 10,
+    n_warehouses: int = 3,
+    n_items: int = 50,
+    n_purchases: int = 500,
+) -> tuple[list[Store], list[Warehouse], list[Item]]:
+    """
+    Seed stores, warehouses and items, with every item stocked everywhere,
+    and a history of purchases.
+    """
+    stores = [Store(name=random_lower_string()) for _ in range(n_stores)]
+    warehouses = [Warehouse(name=random_lower_string()) for _ in range(n_warehouses)]
+    items = [
+        Item(
+            title=random_lower_string(),
+            wholesale_price=round(random.uniform(1, 50), 2),
+            retail_price=round(random.uniform(50, 100), 2),
+        )
+        for _ in range(n_items)
+    ]
+    db.add_all([*stores, *warehouses, *items])
+    db.commit()
+    for item in items:
+        db.add_all(
+            StoreItem(store_id=store.id, item_id=item.id, quantity=1000)
+            for store in stores
+        )
+        db.add_all(
+            WarehouseItem(warehouse_id=warehouse.id, item_id=item.id, quantity=1000)
+            for warehouse in warehouses
+        )
+    db.add_all(
+        Purchase(
+            store_id=random.choice(stores).id,
+            item_id=random.choice(items).id,
+            quantity=random.randint(1, 5),
+        )
+        for _ in range(n_purchases)
+    )
+    db.commit()
+    for obj in [*stores, *warehouses, *items]:
+        db.refresh(obj)
+    return stores, warehouses, items
@@ -0,0 +1,83 @@
+from collections.abc import Generator, Iterable
+from contextlib import contextmanager
+from typing import Any
+
+from sqlalchemy import Engine, event
+
+from app.core.db import engine as default_engine
+
+# Tables that grow with the business and must never be read with a full scan
+HOT_TABLES = {"item", "purchase", "storeitem", "warehouseitem"}
+
+
+@contextmanager
+def capture_statements(
+    engine: Engine,
+) -> Generator[list[tuple[str, Any]], None, None]:
+    """
+    Collect the SQL statements (and their parameters) sent to the database.
+    """
+    statements: list[tuple[str, Any]] = []
+
+    def before_cursor_execute(
+        conn: Any,  # noqa: ARG001
+        cursor: Any,  # noqa: ARG001
+        statement: str,
+        parameters: Any,
+        context: Any,  # noqa: ARG001
+        executemany: bool,
+    ) -> None:
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def explain(engine: Engine, statement: str, parameters: Any) -> dict[str, Any]:
+    """
+    Return the JSON plan of a statement, without executing it.
+
+    Sequential scans are disabled for the session, so the planner only falls
+    back to one when there is no usable index, whatever the size of the data.
+    """
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        result = conn.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement}", parameters or None
+        )
+        plan: dict[str, Any] = result.scalar_one()[0]["Plan"]
+        conn.rollback()
+    return plan
+
+
+def find_seq_scans(plan: dict[str, Any], tables: Iterable[str]) -> list[str]:
+    """
+    Return the tables among `tables` read with a sequential scan in `plan`.
+    """
+    tables = set(tables)
+    found = []
+    if plan["Node Type"] == "Seq Scan" and plan.get("Relation Name") in tables:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(find_seq_scans(child, tables))
+    return found
+
+
+@contextmanager
+def assert_max_queries(
+    n: int, engine: Engine = default_engine
+) -> Generator[None, None, None]:
+    """
+    Fail if more than `n` SQL statements are executed in the block, e.g. to
+    catch N+1 queries behind an API call.
+    """
+    with capture_statements(engine) as statements:
+        yield
+    assert len(statements) <= n, (
+        f"{len(statements)} queries executed, expected at most {n}:\n"
+        + "\n".join(statement for statement, _ in statements)
+    )
@@ -0,0 +1,234 @@
+"""
+Inventory turnover and days of supply, per item of each store and warehouse.
+
+The sales are the purchases, the other changes of the stock go to the
+`stockmovement` ledger in the transaction of the change: receipts, shipments
+and counts. Rather than aggregating all of them for each report, the units
+in and out of each (location, item) are summed into daily buckets by
+`refresh_turnover`, meant to run every few minutes: each refresh only adds
+the rows created since the previous one, up to a high-water mark, so that
+its cost depends on the activity since, not on the history.
+
+The mark is a transaction id rather than a time: each row records the id of
+the transaction that inserted it (`txid`), and each refresh adds the rows of
+the transactions up to the oldest one still running, all committed or
+rolled back by then. The rows of a transaction committing late, however
+late, are added by the first refresh after its commit, and only by that one.
+
+The average stock of a window is the mean of the stock now and at its start,
+that is the stock now minus the net change over the window.
+"""
+
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Literal
+
+from sqlalchemy import Subquery
+from sqlmodel import Session, func, select, text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import ReportWatermark, StockTurnover, TurnoverLine
+
+logger = logging.getLogger(__name__)
+
+WATERMARK = "turnover"
+
+Location = Literal["store", "warehouse"]
+
+
+@dataclass(frozen=True)
+class Movement:
+    location: Location
+    location_id: int
+    item_id: int
+    # Positive for units in, negative for units out
+    quantity: int
+    reason: Literal["receipt", "shipment", "count"]
+
+
+INSERT_MOVEMENTS = text(
+    "INSERT INTO stockmovement (location, location_id, item_id, quantity, reason) "
+    "SELECT * FROM unnest(CAST(:locations AS varchar[]), "
+    "CAST(:location_ids AS int[]), CAST(:item_ids AS int[]), "
+    "CAST(:quantities AS int[]), CAST(:reasons AS varchar[]))"
+)
+
+# Serializes the refreshes
+LOCK_WATERMARK = text(
+    "INSERT INTO reportwatermark (name, processed_until) VALUES (:name, :now) "
+    "ON CONFLICT (name) DO UPDATE SET name = excluded.name "
+    "RETURNING processed_xid"
+)
+
+# The transactions before the oldest one still running are all finished
+# (pg_snapshot_xmin from Postgres 13, the txid functions work on 12 too)
+OLDEST_RUNNING_XID = text("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+
+# The sales and the movements matching `{changes}`, per location, item and
+# day, added to the buckets
+ADD_TO_BUCKETS = """
+    INSERT INTO stockturnover (location, location_id, item_id, day, units_in,
+        units_out, adjusted)
+    SELECT location, location_id, item_id,
+        CAST(created_at AT TIME ZONE 'UTC' AS date),
+        sum(units_in), sum(units_out), sum(adjusted)
+    FROM (
+        SELECT 'store' AS location, store_id AS location_id, item_id,
+            created_at, 0 AS units_in, quantity AS units_out, 0 AS adjusted
+        FROM purchase
+        WHERE {changes}
+        UNION ALL
+        SELECT location, location_id, item_id, created_at,
+            CASE WHEN reason <> 'count' AND quantity > 0 THEN quantity ELSE 0 END,
+            CASE WHEN reason <> 'count' AND quantity < 0 THEN -quantity ELSE 0 END,
+            CASE WHEN reason = 'count' THEN quantity ELSE 0 END
+        FROM stockmovement
+        WHERE {changes}
+    ) AS changes
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (location, location_id, item_id, day) DO UPDATE SET
+        units_in = stockturnover.units_in + excluded.units_in,
+        units_out = stockturnover.units_out + excluded.units_out,
+        adjusted = stockturnover.adjusted + excluded.adjusted
+    """
+# The first refresh adds the whole history, from the BRIN indexes on
+# created_at, the rows inserted before the ids were recorded included
+ADD_HISTORY_TO_BUCKETS = text(
+    ADD_TO_BUCKETS.format(
+        changes="created_at >= :oldest AND (txid < :end_xid OR txid IS NULL)"
+    )
+)
+# The next ones the transactions since, from the BRIN indexes on txid, and
+# only from the purchase partitions of the history
+ADD_CHANGES_TO_BUCKETS = text(
+    ADD_TO_BUCKETS.format(
+        changes="txid >= :start_xid AND txid < :end_xid AND created_at >= :oldest"
+    )
+)
+
+DROP_OLD_BUCKETS = text("DELETE FROM stockturnover WHERE day < :day")
+DROP_OLD_MOVEMENTS = text("DELETE FROM stockmovement WHERE created_at < :before")
+
+UPDATE_WATERMARK = text(
+    "UPDATE reportwatermark SET processed_until = :now, processed_xid = :end_xid "
+    "WHERE name = :name"
+)
+
+
+def record_movements(session: Session, movements: list[Movement]) -> None:
+    """
+    Add `movements` to the ledger, in the transaction of `session`, with one
+    statement whatever their number.
+    """
+    movements = [movement for movement in movements if movement.quantity]
+    if not movements:
+        return
+    session.execute(
+        INSERT_MOVEMENTS,
+        {
+            "locations": [movement.location for movement in movements],
+            "location_ids": [movement.location_id for movement in movements],
+            "item_ids": [movement.item_id for movement in movements],
+            "quantities": [movement.quantity for movement in movements],
+            "reasons": [movement.reason for movement in movements],
+        },
+    )
+
+
+def refresh_turnover(
+    session: Session, *, now: datetime.datetime | None = None
+) -> datetime.datetime:
+    """
+    Add the sales and the movements of the transactions finished since the
+    last refresh to the daily buckets, and drop those past the history.
+    Returns the time of the refresh.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    oldest = now - datetime.timedelta(days=settings.TURNOVER_HISTORY_DAYS)
+    start_xid = session.execute(
+        LOCK_WATERMARK, {"name": WATERMARK, "now": now}
+    ).scalar_one()
+    end_xid = session.execute(OLDEST_RUNNING_XID).scalar_one()
+    params = {"oldest": oldest, "start_xid": start_xid, "end_xid": end_xid}
+    if start_xid is None:
+        session.execute(ADD_HISTORY_TO_BUCKETS, params)
+    elif start_xid < end_xid:
+        session.execute(ADD_CHANGES_TO_BUCKETS, params)
+    session.execute(
+        UPDATE_WATERMARK,
+        {"name": WATERMARK, "now": now, "end_xid": max(start_xid or 0, end_xid)},
+    )
+    session.execute(DROP_OLD_BUCKETS, {"day": oldest.date()})
+    session.execute(DROP_OLD_MOVEMENTS, {"before": oldest})
+    session.commit()
+    return now
+
+
+def processed_until(session: Session) -> datetime.datetime | None:
+    watermark = session.get(ReportWatermark, WATERMARK)
+    return watermark.processed_until if watermark else None
+
+
+def window_start(days: int) -> datetime.date:
+    """
+    First day of a window of `days` days ending today, UTC like the buckets.
+    """
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    return today - datetime.timedelta(days=days - 1)
+
+
+def turnover_totals(
+    location: Location, location_id: int, start_day: datetime.date
+) -> Subquery:
+    """
+    Units in and out of each item of a location since `start_day`, from the
+    primary key of the buckets.
+    """
+    return (
+        select(
+            StockTurnover.item_id,
+            func.sum(StockTurnover.units_in).label("units_in"),
+            func.sum(StockTurnover.units_out).label("units_out"),
+            func.sum(StockTurnover.adjusted).label("adjusted"),
+        )
+        .where(
+            StockTurnover.location == location,
+            StockTurnover.location_id == location_id,
+            StockTurnover.day >= start_day,
+        )
+        .group_by(StockTurnover.item_id)  # type: ignore
+        .subquery()
+    )
+
+
+def turnover_line(
+    item_id: int, quantity: int, units_in: int, units_out: int, adjusted: int, days: int
+) -> TurnoverLine:
+    # Stock at the start of the window, before the changes since
+    start_quantity = quantity - units_in + units_out - adjusted
+    average_quantity = (start_quantity + quantity) / 2
+    daily_out = units_out / days
+    return TurnoverLine(
+        item_id=item_id,
+        quantity=quantity,
+        units_in=units_in,
+        units_out=units_out,
+        adjusted=adjusted,
+        average_quantity=average_quantity,
+        turnover=units_out / average_quantity if average_quantity > 0 else None,
+        days_of_supply=quantity / daily_out if daily_out else None,
+    )
+
+
+def main() -> None:
+    # Meant to run every few minutes, see app.scheduler
+    logging.basicConfig(level=logging.INFO)
+    with Session(engine) as session:
+        refreshed_at = refresh_turnover(session)
+    logger.info(f"Turnover report refreshed at {refreshed_at}")
+
+
+if __name__ == "__main__":
+    main()
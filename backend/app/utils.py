@@ -4,8 +4,6 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any
 
-import emails  # type: ignore
-from jinja2 import Template
 from jose import JWTError, jwt
 
 from app.core.config import settings
@@ -18,6 +16,9 @@ class EmailData:
 
 
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
+    # Imported on first use, most requests never render emails
+    from jinja2 import Template
+
     template_str = (
         Path(__file__).parent / "email-templates" / "build" / template_name
     ).read_text()
@@ -32,6 +33,9 @@ def send_email(
     html_content: str = "",
 ) -> None:
     assert settings.emails_enabled, "no provided configuration for email variables"
+    # Imported on first use, the email stack is slow to import
+    import emails  # type: ignore
+
     message = emails.Message(
         subject=subject,
         html=html_content,